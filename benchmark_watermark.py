@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能测试脚本：对比水印处理各环节优化前后的耗时
+用法: python benchmark_watermark.py [测试名 ...]
+"""
+
+import io
+import sys
+import time
+import argparse
+from datetime import datetime
+from contextlib import redirect_stdout
+
+from PIL import ExifTags, Image, ImageDraw, ImageFont
+
+import exif_tools
+import font_manager
+import photo_watermark
+import text_template
+import watermark_render
+
+
+def timed(func, *args):
+    """
+    执行函数并返回(耗时秒数, 返回值)
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_date_parse(frames=30000):
+    """
+    日期解析：strptime逐张解析 vs 快速路径+按日期部分缓存
+    模拟连续3天拍摄的30000张照片，每张的拍摄时间都不同，每种方式只解析一遍
+    """
+    days = ["2023:10:15", "2023:10:16", "2023:10:17"]
+    raw_dates = [f"{days[i % 3]} {i // 3 // 3600:02d}:{i // 3 // 60 % 60:02d}:{i // 3 % 60:02d}" for i in range(frames)]
+
+    def run_slow():
+        for date_str in raw_dates:
+            photo_watermark.parse_exif_date_slow(date_str)
+
+    def run_fast():
+        photo_watermark.format_date_part.cache_clear()
+        for date_str in raw_dates:
+            photo_watermark.format_exif_date(date_str)
+
+    slow, _ = timed(run_slow)
+    fast, _ = timed(run_fast)
+    print(f"不同的时间: {len(set(raw_dates))} 个")
+    print(f"strptime:       {slow * 1e6 / frames:.3f} 微秒/张")
+    print(f"快速路径+缓存:  {fast * 1e6 / frames:.3f} 微秒/张")
+    print(f"加速比: {slow / fast:.1f}x")
+    print(f"缓存统计: {photo_watermark.format_date_part.cache_info()}")
+
+
+def bench_font_load(images=10000, font_size=16):
+    """
+    字体加载：每张图片重新查找并加载字体 vs 进程内字体缓存
+    模拟处理10000张图片时的字体获取
+    """
+    def load_uncached():
+        # 优化前add_watermark_to_image中的逻辑
+        try:
+            return ImageFont.truetype(font_manager.DEFAULT_FONTS[0][0], font_size)
+        except:
+            try:
+                return ImageFont.truetype(font_manager.DEFAULT_FONTS[1][0], font_size)
+            except:
+                font = ImageFont.load_default()
+                print("警告: 无法加载中文字体，可能导致水印显示不正确")
+                return font
+
+    def run_uncached():
+        for _ in range(images):
+            load_uncached()
+
+    def run_cached():
+        font_manager.find_default_font.cache_clear()
+        font_manager.load_font.cache_clear()
+        font_manager._resolved_fonts.clear()
+        font_manager._font_data.clear()
+        for _ in range(images):
+            font_manager.get_font(font_size)
+
+    # 字体都不可用时会打印警告，只统计行数不输出
+    uncached_warnings, cached_warnings = io.StringIO(), io.StringIO()
+    with redirect_stdout(uncached_warnings):
+        uncached, _ = timed(run_uncached)
+    with redirect_stdout(cached_warnings):
+        cached, _ = timed(run_cached)
+    print(f"使用的字体: {font_manager.find_default_font()[0] or 'Pillow默认字体'}")
+    print(f"每张加载:       {uncached * 1e6 / images:.3f} 微秒/张, 共 {uncached:.3f} 秒")
+    print(f"进程内缓存:     {cached * 1e6 / images:.3f} 微秒/张, 共 {cached:.3f} 秒")
+    print(f"加速比: {uncached / cached:.1f}x")
+    print(f"警告输出行数: {uncached_warnings.getvalue().count(chr(10))} -> {cached_warnings.getvalue().count(chr(10))}")
+    print(f"缓存统计: {font_manager.load_font.cache_info()}")
+
+
+def bench_glyph_atlas(frames=5000, font_size=48):
+    """
+    日期蒙版：每个日期用draw.text渲染 vs 数字字形图集拼接
+    模拟延时摄影归档中每张照片日期都不同的情况
+    """
+    if watermark_render.np is None:
+        print("未安装NumPy，跳过")
+        return
+    font = font_manager.get_font(font_size)
+    # 不同的日期字符串，覆盖所有数字
+    dates = [f"{2000 + i % 30}-{i % 12 + 1:02d}-{i % 28 + 1:02d}" for i in range(frames)]
+
+    def run_draw_text():
+        for date in dates:
+            watermark_render.render_text_mask(date, font)
+
+    def run_atlas():
+        watermark_render.get_glyph_atlas.cache_clear()
+        atlas = watermark_render.get_glyph_atlas(font)
+        for date in dates:
+            atlas.render(date)
+
+    draw_text, _ = timed(run_draw_text)
+    atlas, _ = timed(run_atlas)
+    print(f"draw.text:      {draw_text * 1e6 / frames:.1f} 微秒/张")
+    print(f"字形图集:       {atlas * 1e6 / frames:.1f} 微秒/张（含建立图集）")
+    print(f"加速比: {draw_text / atlas:.1f}x")
+
+
+def bench_placement(frames=20000, font_size=32):
+    """
+    水印定位：每张图片测量文字并计算位置 vs 按(文字, 尺寸, 方向)缓存的位置表
+    模拟同一机型拍摄的一批竖拍照片（尺寸和方向都相同）
+    """
+    font = font_manager.get_font(font_size)
+    text = "2023-10-15"
+    image_size = (6000, 4000)
+
+    def run_uncached():
+        for _ in range(frames):
+            mask = watermark_render.render_text_mask(text, font)
+            watermark_render.place_mask(mask, 'bottom-right', image_size, 6)
+
+    def run_cached():
+        watermark_render.get_placement.cache_clear()
+        for _ in range(frames):
+            watermark_render.get_placement(text, font, 'bottom-right', image_size, 6)
+
+    uncached, _ = timed(run_uncached)
+    cached, _ = timed(run_cached)
+    print(f"逐张测量定位:   {uncached * 1e6 / frames:.2f} 微秒/张")
+    print(f"位置表:         {cached * 1e6 / frames:.2f} 微秒/张")
+    print(f"加速比: {uncached / cached:.1f}x")
+    print(f"缓存统计: {watermark_render.get_placement.cache_info()}")
+
+
+def bench_effects(frames=500, font_size=48):
+    """
+    描边投影效果：每张图片渲染带模糊投影的图章 vs 按(文字, 效果)缓存的图章
+    """
+    font = font_manager.get_font(font_size)
+    text = "2023-10-15"
+    color = (255, 255, 255, 204)
+    style = watermark_render.WatermarkStyle(2, (0, 0, 0), False, (0, 0, 0), (3, 3), 4)
+
+    def run_uncached():
+        for _ in range(frames):
+            watermark_render.render_effect_stamp(text, font, color, style)
+
+    def run_cached():
+        watermark_render.get_effect_stamp.cache_clear()
+        for _ in range(frames):
+            watermark_render.get_effect_stamp(text, font, color, style)
+
+    uncached, _ = timed(run_uncached)
+    cached, _ = timed(run_cached)
+    print(f"逐张渲染效果:   {uncached * 1e6 / frames:.1f} 微秒/张")
+    print(f"效果图章缓存:   {cached * 1e6 / frames:.1f} 微秒/张")
+    print(f"加速比: {uncached / cached:.1f}x")
+
+
+def bench_text_template(frames=2000):
+    """
+    文本模板：每张图片读取完整EXIF字典并重新解析模板 vs 编译后的模板只读取引用的标签
+    """
+    template = "{date:%Y.%m.%d} · {Model} · f/{FNumber}"
+    img = Image.new('RGB', (64, 48))
+    exif = img.getexif()
+    exif[exif_tools.TEMPLATE_TAGS['Model']] = "TestCamera X1"
+    exif[exif_tools.TAG_SOFTWARE] = "Firmware 1.0"
+    exif_ifd = exif.get_ifd(exif_tools.TAG_EXIF_IFD)
+    exif_ifd[exif_tools.TAG_DATETIME_ORIGINAL] = "2023:10:15 14:30:25"
+    exif_ifd[exif_tools.TEMPLATE_TAGS['FNumber']] = 2.8
+    exif_ifd[exif_tools.TAG_MAKER_NOTE] = b'MakerNote' * 400
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', exif=exif.tobytes())
+    data = buffer.getvalue()
+
+    def run_full_exif():
+        for _ in range(frames):
+            with Image.open(io.BytesIO(data)) as photo:
+                exif_data = photo.getexif()
+                fields = {'Model': exif_data.get(0x0110)}
+                fields.update((ExifTags.TAGS.get(tag, tag), value)
+                              for tag, value in exif_data.get_ifd(exif_tools.TAG_EXIF_IFD).items())
+            date = datetime.strptime(fields['DateTimeOriginal'], '%Y:%m:%d %H:%M:%S')
+            template.format(date=date, **fields)
+
+    def run_compiled():
+        compiled = text_template.compile_template(template)
+        for _ in range(frames):
+            tags = exif_tools.read_file_tags(io.BytesIO(data), compiled.tags)
+            compiled.render(tags, photo_watermark.resolve_date(tags))
+
+    full, _ = timed(run_full_exif)
+    compiled, _ = timed(run_compiled)
+    print(f"完整EXIF+format: {full * 1e6 / frames:.1f} 微秒/张")
+    print(f"编译模板:        {compiled * 1e6 / frames:.1f} 微秒/张")
+    print(f"加速比: {full / compiled:.1f}x")
+
+
+def bench_roi(frames=20, font_size=96):
+    """
+    非RGB图片：整张图片转换为RGB后绘制再转换回来 vs 只转换和混合水印所在的区域
+    分别在600万和2400万像素的灰度、CMYK图片上测试，区域合成的耗时只与水印面积有关
+    """
+    font = font_manager.get_font(font_size)
+    text = "2023-10-15"
+    color = (255, 255, 255, 204)
+
+    def run_full_frame(img, placement):
+        for _ in range(frames):
+            rgb = img.convert('RGB')
+            watermark_render.draw_placement(rgb, placement, color)
+            rgb.convert(img.mode)
+
+    def run_roi(img, placement):
+        for _ in range(frames):
+            watermark_render.draw_placement(img, placement, color)
+
+    for mode in ('L', 'CMYK'):
+        for size in ((3000, 2000), (6000, 4000)):
+            img = Image.new(mode, size, 128 if mode == 'L' else (20, 40, 60, 10))
+            placement = watermark_render.get_placement(text, font, 'bottom-right', size)
+            full, _ = timed(run_full_frame, img, placement)
+            roi, _ = timed(run_roi, img, placement)
+            megapixels = size[0] * size[1] / 1e6
+            print(f"{mode} {megapixels:.0f}MP  整张转换: {full * 1e3 / frames:7.2f} 毫秒/张  "
+                  f"区域合成: {roi * 1e3 / frames:5.2f} 毫秒/张  加速比: {full / roi:.0f}x")
+
+
+def bench_modes(frames=200, font_size=96):
+    """
+    各模式的区域混合：水印区域转换为RGB混合后再转换回来 vs 在图片自身的颜色空间中混合
+    在2400万像素的灰度、调色板、RGBA、CMYK和16位图片上测试
+    """
+    font = font_manager.get_font(font_size)
+    color = (255, 255, 255, 204)
+    placement = watermark_render.get_placement("2023-10-15", font, 'bottom-right', (6000, 4000))
+    alpha = watermark_render.scale_alpha(placement[0], color[3])
+
+    def run(drawer, img):
+        for _ in range(frames):
+            drawer(img, color[:3], alpha, placement[1])
+
+    for mode in ('L', 'P', 'RGBA', 'CMYK', 'I;16'):
+        img = Image.new('RGB', (6000, 4000), (90, 120, 150))
+        img = img.quantize(64) if mode == 'P' else img.convert('I').convert(mode) if mode == 'I;16' else img.convert(mode)
+        drawer = watermark_render._MODE_DRAWERS[mode]
+        roundtrip, _ = timed(run, watermark_render.draw_roi, img)
+        native, _ = timed(run, drawer, img)
+        print(f"{mode:5s} RGB往返: {roundtrip * 1e3 / frames:6.3f} 毫秒/张  "
+              f"{drawer.__name__}: {native * 1e3 / frames:6.3f} 毫秒/张  加速比: {roundtrip / native:.1f}x")
+
+
+def bench_blend(frames=200, font_size=160):
+    """
+    水印混合：每张图片draw.text(..., fill=rgba_color) vs 缓存蒙版+pillow引擎 vs 缓存蒙版+numpy引擎
+    在2400万像素的RGB图片上绘制大号水印
+    """
+    if watermark_render.np is None:
+        print("未安装NumPy，跳过")
+        return
+    font = font_manager.get_font(font_size)
+    text = "2023-10-15 12:34"
+    color = (255, 255, 255, 204)
+    img = Image.new('RGB', (6000, 4000), (90, 120, 150))
+    placement = watermark_render.get_placement(text, font, 'bottom-right', img.size)
+    xy = placement[1]
+    # draw.text的坐标是文字原点，蒙版的坐标是墨迹左上角
+    left, top = font.getbbox(text)[:2]
+
+    def run_draw_text():
+        for _ in range(frames):
+            ImageDraw.Draw(img, 'RGBA').text((xy[0] - left, xy[1] - top), text, font=font, fill=color)
+
+    def run_engine(engine):
+        for _ in range(frames):
+            watermark_render.draw_placement(img, placement, color, engine)
+
+    draw_text, _ = timed(run_draw_text)
+    pillow, _ = timed(run_engine, 'pillow')
+    numpy_engine, _ = timed(run_engine, 'numpy')
+    pixels = placement[0].width * placement[0].height
+    for name, seconds in (("draw.text", draw_text), ("pillow引擎", pillow), ("numpy引擎", numpy_engine)):
+        print(f"{name:10s} {seconds * 1e3 / frames:6.3f} 毫秒/张  {pixels * frames / seconds / 1e6:7.1f} 百万像素/秒")
+    print(f"numpy引擎相对draw.text加速比: {draw_text / numpy_engine:.1f}x")
+
+
+def bench_tile(frames=10, font_size=96):
+    """
+    平铺水印：每张图片逐个draw.text绘制旋转文字 vs 缓存的平铺单元按尺寸展开一次后整幅混合
+    在2400万像素的RGB图片上斜向铺满水印
+    """
+    font = font_manager.get_font(font_size)
+    text = "PROOF 2023-10-15"
+    color = (255, 255, 255, 102)
+    size = (6000, 4000)
+    img = Image.new('RGB', size, (90, 120, 150))
+
+    def run_draw_text():
+        # 优化前的做法：每张图片在整幅图层上逐个绘制文字，再旋转图层并合成
+        for _ in range(frames):
+            layer = Image.new('RGBA', size)
+            draw = ImageDraw.Draw(layer)
+            step_x, step_y = font_size * 12, font_size * 3
+            for row, top in enumerate(range(0, size[1], step_y)):
+                for left in range(-(row % 2) * step_x // 2, size[0], step_x):
+                    draw.text((left, top), text, font=font, fill=color)
+            layer = layer.rotate(watermark_render.TILE_ANGLE, Image.BICUBIC)
+            img.paste(layer, (0, 0), layer)
+
+    def run_tile():
+        watermark_render.get_tile.cache_clear()
+        watermark_render._tiled_masks.clear()
+        for _ in range(frames):
+            placement = watermark_render.get_placement(text, font, 'tile', size)
+            watermark_render.draw_placement(img, placement, color)
+
+    draw_text, _ = timed(run_draw_text)
+    tile, _ = timed(run_tile)
+    print(f"逐个draw.text: {draw_text * 1e3 / frames:8.2f} 毫秒/张")
+    print(f"平铺单元:      {tile * 1e3 / frames:8.2f} 毫秒/张（含首张展开）")
+    print(f"加速比: {draw_text / tile:.1f}x")
+
+
+BENCHMARKS = {
+    'date': bench_date_parse,
+    'font': bench_font_load,
+    'atlas': bench_glyph_atlas,
+    'placement': bench_placement,
+    'effects': bench_effects,
+    'template': bench_text_template,
+    'roi': bench_roi,
+    'modes': bench_modes,
+    'blend': bench_blend,
+    'tile': bench_tile,
+}
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description='水印工具性能测试')
+    parser.add_argument('names', nargs='*', help=f"要运行的测试（可选：{', '.join(sorted(BENCHMARKS))}，默认全部）")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的测试: {', '.join(unknown)}")
+
+    for name in args.names or sorted(BENCHMARKS):
+        print(f"\n===== {name}: {BENCHMARKS[name].__doc__.strip().splitlines()[0]} =====")
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
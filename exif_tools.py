@@ -0,0 +1,683 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+EXIF元数据读取工具
+只读取文件头部的元数据段并按需遍历TIFF IFD，不构造完整的PIL Image对象
+支持JPEG(APP1)、PNG(eXIf/iTXt/tEXt)、TIFF(原地读取IFD)和WebP(RIFF EXIF/XMP块)
+"""
+
+import os
+import re
+import zlib
+import struct
+
+
+# JPEG文件起始标记
+JPEG_SOI = b'\xff\xd8'
+
+# PNG文件签名
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# EXIF数据在APP1段中的前缀
+EXIF_HEADER = b'Exif\x00\x00'
+
+# XMP数据在JPEG APP1段中的前缀
+XMP_HEADER = b'http://ns.adobe.com/xap/1.0/\x00'
+
+# PNG中保存XMP的文本块关键字
+PNG_XMP_KEYWORD = b'XML:com.adobe.xmp'
+
+# 常用EXIF标签ID
+TAG_EXIF_IFD = 0x8769  # ExifIFD指针（位于IFD0）
+TAG_IMAGE_DESCRIPTION = 0x010E  # ImageDescription（位于IFD0）
+TAG_ORIENTATION = 0x0112  # Orientation，图片方向（位于IFD0）
+TAG_SOFTWARE = 0x0131  # Software（位于IFD0）
+TAG_DATETIME = 0x0132  # DateTime，文件修改时间（位于IFD0）
+TAG_DATETIME_ORIGINAL = 0x9003  # 36867, DateTimeOriginal
+TAG_DATETIME_DIGITIZED = 0x9004  # DateTimeDigitized
+TAG_OFFSET_TIME_ORIGINAL = 0x9011  # OffsetTimeOriginal，拍摄时间的时区
+TAG_GPS_IFD = 0x8825  # GPS IFD指针（位于IFD0）
+TAG_INTEROP_IFD = 0xA005  # Interoperability IFD指针（位于ExifIFD）
+TAG_MAKER_NOTE = 0x927C  # MakerNote，厂商私有数据（位于ExifIFD）
+TAG_THUMBNAIL_OFFSET = 0x0201  # JPEGInterchangeFormat，缩略图偏移（位于IFD1）
+TAG_THUMBNAIL_LENGTH = 0x0202  # JPEGInterchangeFormatLength，缩略图长度（位于IFD1）
+TAG_XMP = 0x02BC  # TIFF文件中的XMP数据（位于IFD0）
+
+# 一次遍历中收集的EXIF标签：日期相关字段和图片方向
+METADATA_TAGS = {
+    'DateTimeOriginal': TAG_DATETIME_ORIGINAL,
+    'DateTimeDigitized': TAG_DATETIME_DIGITIZED,
+    'DateTime': TAG_DATETIME,
+    'OffsetTimeOriginal': TAG_OFFSET_TIME_ORIGINAL,
+    'Orientation': TAG_ORIENTATION,
+}
+
+# 水印文本模板可以引用的其他EXIF标签，只有模板用到时才读取
+TEMPLATE_TAGS = {
+    'Make': 0x010F,
+    'Model': 0x0110,
+    'Artist': 0x013B,
+    'Copyright': 0x8298,
+    'ExposureTime': 0x829A,
+    'FNumber': 0x829D,
+    'ISO': 0x8827,  # ISOSpeedRatings
+    'ExposureBiasValue': 0x9204,
+    'FocalLength': 0x920A,
+    'FocalLengthIn35mmFilm': 0xA405,
+    'LensMake': 0xA433,
+    'LensModel': 0xA434,
+}
+
+# 取值为RATIONAL/SRATIONAL的模板标签，读取时转换为数值
+_RATIONAL_TAGS = {'ExposureTime', 'FNumber', 'ExposureBiasValue', 'FocalLength'}
+
+# XMP中的日期属性，EXIF中没有对应标签时使用
+XMP_DATE_PROPERTIES = {
+    'DateTimeOriginal': 'exif:DateTimeOriginal',
+    'DateCreated': 'photoshop:DateCreated',
+}
+
+# 可作为水印日期的来源，顺序即默认优先级
+DATE_SOURCES = ('DateTimeOriginal', 'DateTimeDigitized', 'DateTime', 'DateCreated')
+
+# TIFF数据类型对应的单个值字节数
+_TYPE_SIZES = {
+    1: 1,   # BYTE
+    2: 1,   # ASCII
+    3: 2,   # SHORT
+    4: 4,   # LONG
+    5: 8,   # RATIONAL
+    6: 1,   # SBYTE
+    7: 1,   # UNDEFINED
+    8: 2,   # SSHORT
+    9: 4,   # SLONG
+    10: 8,  # SRATIONAL
+    11: 4,  # FLOAT
+    12: 8,  # DOUBLE
+    13: 4,  # IFD
+}
+
+# 数值类型对应的struct格式字符
+_TYPE_FORMATS = {3: 'H', 4: 'I', 8: 'h', 9: 'i', 11: 'f', 12: 'd'}
+
+# 指向子IFD的标签
+_SUB_IFD_TAGS = (TAG_EXIF_IFD, TAG_GPS_IFD, TAG_INTEROP_IFD)
+
+# 可以从EXIF中删除的数据分组（thumbnail为IFD1及其缩略图）
+STRIP_GROUPS = ('gps', 'makernote', 'thumbnail')
+
+# 位于ExifIFD中的标签（其余标签视为位于IFD0）
+_EXIF_IFD_TAGS = {
+    TAG_DATETIME_ORIGINAL,
+    TAG_DATETIME_DIGITIZED,
+    TAG_OFFSET_TIME_ORIGINAL,
+    0x829A,  # ExposureTime
+    0x829D,  # FNumber
+    0x8827,  # ISOSpeedRatings
+    0x9204,  # ExposureBiasValue
+    0x920A,  # FocalLength
+    0xA405,  # FocalLengthIn35mmFilm
+    0xA433,  # LensMake
+    0xA434,  # LensModel
+}
+
+
+class _FileView(object):
+    """
+    把文件包装成可按切片读取的只读视图，用于原地读取TIFF文件中的IFD
+    只有被访问到的字节才会从文件中读取
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        fp.seek(0, os.SEEK_END)
+        self.size = fp.tell()
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        start, stop, _ = key.indices(self.size)
+        if stop <= start:
+            return b''
+        self.fp.seek(start)
+        return self.fp.read(stop - start)
+
+
+def _unpack(fmt, data, offset):
+    """
+    从data的offset处按fmt解析数据，data可以是bytes或_FileView
+    """
+    return struct.unpack(fmt, data[offset:offset + struct.calcsize(fmt)])
+
+
+def _read_jpeg_segments(fp):
+    """
+    扫描JPEG标记直到SOS（图像数据开始），收集APP1中的EXIF和XMP
+    只读取APP1段，其余段直接跳过，通常只需读取几KB
+    :param fp: 以二进制模式打开的文件对象，位于文件开头
+    :return: (TIFF格式的EXIF字节串, XMP字节串)，不存在的为None
+    """
+    tiff = xmp = None
+    if fp.read(2) != JPEG_SOI:
+        return tiff, xmp
+
+    while tiff is None or xmp is None:
+        marker = fp.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            break
+        code = marker[1]
+        # 跳过标记前的填充字节0xFF
+        while code == 0xFF:
+            byte = fp.read(1)
+            if not byte:
+                return tiff, xmp
+            code = byte[0]
+
+        # SOS之后是压缩数据，EOI表示文件结束，均不会再出现APP段
+        if code in (0xDA, 0xD9):
+            break
+        # 没有长度字段的独立标记
+        if code == 0x01 or 0xD0 <= code <= 0xD7:
+            continue
+
+        length_bytes = fp.read(2)
+        if len(length_bytes) < 2:
+            break
+        length = struct.unpack('>H', length_bytes)[0]
+        if length < 2:
+            break
+
+        if code == 0xE1:
+            payload = fp.read(length - 2)
+            if payload.startswith(EXIF_HEADER):
+                tiff = tiff or payload[len(EXIF_HEADER):]
+            elif payload.startswith(XMP_HEADER):
+                xmp = xmp or payload[len(XMP_HEADER):]
+        else:
+            fp.seek(length - 2, 1)
+    return tiff, xmp
+
+
+def _png_text_xmp(chunk_type, data):
+    """
+    从PNG的iTXt/tEXt块中取出XMP
+    :return: XMP字节串，不是XMP块时返回None
+    """
+    keyword, sep, rest = data.partition(b'\x00')
+    if not sep or keyword != PNG_XMP_KEYWORD:
+        return None
+    if chunk_type == b'tEXt':
+        return rest
+    # iTXt: 压缩标志(1) 压缩方法(1) 语言标签\0 翻译关键字\0 文本
+    if len(rest) < 2:
+        return None
+    compressed = rest[0]
+    text = rest[2:].split(b'\x00', 2)
+    if len(text) < 3:
+        return None
+    return zlib.decompress(text[2]) if compressed else text[2]
+
+
+def _read_png_chunks(fp):
+    """
+    遍历PNG块，读取eXIf块中的EXIF和iTXt/tEXt块中的XMP
+    图像数据块(IDAT)只跳过不读取
+    :param fp: 以二进制模式打开的文件对象，位于文件开头
+    :return: (TIFF格式的EXIF字节串, XMP字节串)，不存在的为None
+    """
+    tiff = xmp = None
+    if fp.read(8) != PNG_SIGNATURE:
+        return tiff, xmp
+
+    while tiff is None or xmp is None:
+        header = fp.read(8)
+        if len(header) < 8:
+            break
+        length, chunk_type = struct.unpack('>I4s', header)
+        if chunk_type == b'IEND':
+            break
+        if chunk_type == b'eXIf':
+            tiff = strip_exif_header(fp.read(length))
+        elif chunk_type in (b'iTXt', b'tEXt') and xmp is None:
+            xmp = _png_text_xmp(chunk_type, fp.read(length))
+        else:
+            fp.seek(length, 1)
+        # 跳过CRC
+        fp.seek(4, 1)
+    return tiff, xmp
+
+
+def _read_webp_chunks(fp):
+    """
+    遍历WebP的RIFF块，读取EXIF块和XMP块，图像数据块只跳过不读取
+    :param fp: 以二进制模式打开的文件对象，位于文件开头
+    :return: (TIFF格式的EXIF字节串, XMP字节串)，不存在的为None
+    """
+    tiff = xmp = None
+    header = fp.read(12)
+    if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WEBP':
+        return tiff, xmp
+
+    while tiff is None or xmp is None:
+        chunk_header = fp.read(8)
+        if len(chunk_header) < 8:
+            break
+        chunk_type, length = struct.unpack('<4sI', chunk_header)
+        # RIFF块按偶数字节对齐
+        padded = length + (length & 1)
+        if chunk_type == b'EXIF':
+            tiff = strip_exif_header(fp.read(length))
+            fp.seek(padded - length, 1)
+        elif chunk_type == b'XMP ':
+            xmp = fp.read(length)
+            fp.seek(padded - length, 1)
+        else:
+            fp.seek(padded, 1)
+    return tiff, xmp
+
+
+def read_metadata_block(fp):
+    """
+    按文件格式定位EXIF和XMP数据，不解码任何像素
+    TIFF文件本身就是EXIF结构，返回可原地读取的文件视图
+    :param fp: 以二进制模式打开、可随机访问的文件对象
+    :return: (TIFF格式的EXIF数据, XMP字节串)，不存在的为None
+    """
+    fp.seek(0)
+    head = fp.read(12)
+    fp.seek(0)
+    if head[:2] == JPEG_SOI:
+        return _read_jpeg_segments(fp)
+    if head[:8] == PNG_SIGNATURE:
+        return _read_png_chunks(fp)
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return _read_webp_chunks(fp)
+    if head[:4] in (b'II*\x00', b'MM\x00*'):
+        tiff = _FileView(fp)
+        xmp = read_tiff_tags(tiff, {TAG_XMP}).get(TAG_XMP)
+        return tiff, xmp if isinstance(xmp, bytes) else None
+    # GIF、BMP等格式没有标准的EXIF存储位置
+    return None, None
+
+
+def strip_exif_header(exif_bytes):
+    """
+    去掉EXIF数据前的"Exif\\0\\0"前缀（如img.info['exif']），得到TIFF数据
+    :param exif_bytes: EXIF原始字节串
+    :return: TIFF格式字节串
+    """
+    if exif_bytes.startswith(EXIF_HEADER):
+        return exif_bytes[len(EXIF_HEADER):]
+    return exif_bytes
+
+
+def _tiff_header(tiff):
+    """
+    解析TIFF头
+    :param tiff: TIFF格式字节串
+    :return: (字节序前缀, IFD0偏移)，格式不正确时返回(None, 0)
+    """
+    if len(tiff) < 8:
+        return None, 0
+    if tiff[:4] == b'II*\x00':
+        endian = '<'
+    elif tiff[:4] == b'MM\x00*':
+        endian = '>'
+    else:
+        return None, 0
+    return endian, _unpack(endian + 'I', tiff, 4)[0]
+
+
+def _iter_ifd(tiff, offset, endian):
+    """
+    遍历一个IFD中的条目，只解析条目头，不读取取值
+    :param tiff: TIFF格式字节串或文件视图
+    :param offset: IFD起始偏移
+    :param endian: 字节序前缀
+    :return: 生成(标签, 类型, 数量, 取值所在偏移)
+    """
+    if offset <= 0 or offset + 2 > len(tiff):
+        return
+    count = _unpack(endian + 'H', tiff, offset)[0]
+    pos = offset + 2
+    for _ in range(count):
+        if pos + 12 > len(tiff):
+            return
+        tag, typ, n = _unpack(endian + 'HHI', tiff, pos)
+        size = _TYPE_SIZES.get(typ, 1) * n
+        if size <= 4:
+            value_pos = pos + 8
+        else:
+            value_pos = _unpack(endian + 'I', tiff, pos + 8)[0]
+        yield tag, typ, n, value_pos
+        pos += 12
+
+
+def _decode_value(tiff, typ, count, pos, endian):
+    """
+    按TIFF类型解码单个条目的取值
+    :return: 字符串、整数/浮点数、(分子, 分母)元组、bytes，或它们组成的元组
+    """
+    size = _TYPE_SIZES.get(typ, 1) * count
+    if pos + size > len(tiff):
+        return None
+    data = tiff[pos:pos + size]
+
+    if typ == 2:
+        # ASCII字符串，去掉结尾的NUL
+        return data.split(b'\x00', 1)[0].decode('utf-8', 'replace').strip()
+    if typ in (5, 10):
+        fmt = endian + ('ii' if typ == 10 else 'II') * count
+        raw = struct.unpack(fmt, data)
+        values = tuple(zip(raw[0::2], raw[1::2]))
+    elif typ in _TYPE_FORMATS:
+        values = struct.unpack(endian + _TYPE_FORMATS[typ] * count, data)
+    else:
+        # BYTE / UNDEFINED 等原样返回
+        return data
+    return values[0] if count == 1 else values
+
+
+def read_tiff_tags(tiff, tags):
+    """
+    从TIFF格式的EXIF数据中读取指定标签
+    只遍历IFD0，必要时再进入ExifIFD，不解码其余条目的取值
+    :param tiff: TIFF格式字节串或文件视图
+    :param tags: 需要读取的标签ID集合
+    :return: {标签ID: 取值}
+    """
+    endian, ifd0_offset = _tiff_header(tiff)
+    if endian is None:
+        return {}
+
+    result = {}
+    exif_ifd_offset = 0
+    for tag, typ, count, pos in _iter_ifd(tiff, ifd0_offset, endian):
+        if tag == TAG_EXIF_IFD:
+            exif_ifd_offset = _decode_value(tiff, typ, count, pos, endian)
+        elif tag in tags:
+            result[tag] = _decode_value(tiff, typ, count, pos, endian)
+
+    # 只有在还需要ExifIFD中的标签时才继续遍历
+    if exif_ifd_offset and any(tag not in result for tag in tags & _EXIF_IFD_TAGS):
+        for tag, typ, count, pos in _iter_ifd(tiff, exif_ifd_offset, endian):
+            if tag in tags:
+                result[tag] = _decode_value(tiff, typ, count, pos, endian)
+    return result
+
+
+def xmp_value(xmp, name):
+    """
+    从XMP中取出指定属性的值，支持属性形式和元素形式
+    :param xmp: XMP字节串
+    :param name: 带命名空间前缀的属性名，如"exif:DateTimeOriginal"
+    :return: 属性值字符串或None
+    """
+    if not xmp:
+        return None
+    text = xmp.decode('utf-8', 'replace') if isinstance(xmp, bytes) else xmp
+    escaped = re.escape(name)
+    match = (re.search(escaped + r'\s*=\s*["\']([^"\']*)["\']', text)
+             or re.search('<' + escaped + r'>\s*([^<]*?)\s*</' + escaped + '>', text))
+    return match.group(1) if match else None
+
+
+def xmp_date_to_exif(value):
+    """
+    把XMP的ISO 8601日期（如2023-10-15T14:30:25+08:00）转换成EXIF格式"YYYY:MM:DD HH:MM:SS"
+    :param value: XMP日期字符串
+    :return: EXIF格式日期字符串或None
+    """
+    if not value or len(value) < 10 or value[4] != '-' or value[7] != '-':
+        return None
+    date_part = value[:10].replace('-', ':')
+    time_part = value[11:19] if len(value) >= 19 and value[10] == 'T' else ''
+    return f'{date_part} {time_part}' if len(time_part) == 8 else date_part
+
+
+def metadata_value(name, value):
+    """
+    检查日期和方向字段的取值类型，只保留可以写入JSON、可以直接使用的值
+    有的软件把日期写成UNDEFINED类型，原样返回的bytes按ASCII解码，无法解码时丢弃
+    :param name: 字段名（见METADATA_TAGS）
+    :param value: _decode_value()的返回值
+    :return: 日期和时区字段为非空字符串，Orientation为整数，其他取值返回None
+    """
+    if name == 'Orientation':
+        if isinstance(value, tuple) and value:
+            value = value[0]
+        return value if isinstance(value, int) and not isinstance(value, bool) else None
+    if isinstance(value, bytes):
+        try:
+            value = value.split(b'\x00', 1)[0].decode('ascii').strip()
+        except UnicodeDecodeError:
+            return None
+    return value if isinstance(value, str) and value else None
+
+
+def template_value(name, value):
+    """
+    把模板标签的原始取值转换为便于格式化、可以写入JSON的值
+    :param name: 标签名（见TEMPLATE_TAGS）
+    :param value: _decode_value()的返回值
+    :return: 字符串、整数或浮点数，无法使用时返回None
+    """
+    if isinstance(value, bytes) or value is None or value == '':
+        return None
+    if name in _RATIONAL_TAGS:
+        number = value
+        if isinstance(value, tuple):
+            # 多个值时只取第一个分数
+            numerator, denominator = value[0] if isinstance(value[0], tuple) else value
+            if not denominator:
+                return None
+            number = numerator / denominator
+        if name == 'ExposureTime' and 0 < number < 1:
+            # 快门速度习惯写成1/250的形式
+            return f'1/{round(1 / number)}'
+        return int(number) if number == int(number) else round(number, 4)
+    if isinstance(value, tuple):
+        return value[0] if value else None
+    return value
+
+
+def read_tags(tiff, xmp, extra_tags=()):
+    """
+    一次遍历收集水印需要的所有字段：DateTimeOriginal、DateTimeDigitized、DateTime、
+    OffsetTimeOriginal、Orientation，以及XMP中的exif:DateTimeOriginal和photoshop:DateCreated
+    :param tiff: TIFF格式的EXIF数据或None
+    :param xmp: XMP字节串或None
+    :param extra_tags: 同时读取的模板标签名（见TEMPLATE_TAGS）
+    :return: {字段名: 取值}，XMP日期已转换为EXIF格式"YYYY:MM:DD HH:MM:SS"；
+             请求的模板标签即使不存在也会以None出现，用于区分"没有该标签"和"没有读取过"
+    """
+    tags = {}
+    extra = {name: TEMPLATE_TAGS[name] for name in extra_tags}
+    if tiff:
+        values = read_tiff_tags(tiff, set(METADATA_TAGS.values()) | set(extra.values()))
+        for name, tag in METADATA_TAGS.items():
+            value = metadata_value(name, values.get(tag))
+            if value is not None:
+                tags[name] = value
+        for name, tag in extra.items():
+            tags[name] = template_value(name, values.get(tag))
+    else:
+        tags.update(dict.fromkeys(extra))
+
+    if xmp:
+        text = xmp.decode('utf-8', 'replace') if isinstance(xmp, bytes) else xmp
+        for name, prop in XMP_DATE_PROPERTIES.items():
+            if name not in tags:
+                value = xmp_date_to_exif(xmp_value(text, prop))
+                if value:
+                    tags[name] = value
+    return tags
+
+
+def read_file_tags(fp, extra_tags=()):
+    """
+    从任意支持的图片文件头读取水印需要的所有字段
+    :param fp: 以二进制模式打开的文件对象
+    :param extra_tags: 同时读取的模板标签名（见TEMPLATE_TAGS）
+    :return: {字段名: 取值}
+    """
+    return read_tags(*read_metadata_block(fp), extra_tags=extra_tags)
+
+
+def patch_ifd0_ascii(tiff, values):
+    """
+    修改或新增IFD0中的ASCII标签（如Software、ImageDescription），其余数据按原始字节保留
+    新的IFD0追加到数据末尾，原有数据都不移动，ExifIFD、缩略图以及MakerNote内部的偏移都保持有效
+    :param tiff: TIFF格式的EXIF字节串，为None时新建只包含这些标签的EXIF
+    :param values: {标签ID: 字符串}
+    :return: 修改后的TIFF格式字节串
+    """
+    if not tiff:
+        # 空的大端TIFF：头 + 没有条目的IFD0
+        tiff = b'MM\x00*' + struct.pack('>I', 8) + struct.pack('>HI', 0, 0)
+    endian, ifd0_offset = _tiff_header(tiff)
+    if endian is None or not values:
+        return tiff
+
+    # 原IFD0的条目按原始12字节保留
+    entries = {}
+    next_offset = 0
+    if 0 < ifd0_offset and ifd0_offset + 2 <= len(tiff):
+        count = _unpack(endian + 'H', tiff, ifd0_offset)[0]
+        pos = ifd0_offset + 2
+        for _ in range(count):
+            if pos + 12 > len(tiff):
+                break
+            entries[_unpack(endian + 'H', tiff, pos)[0]] = tiff[pos:pos + 12]
+            pos += 12
+        if pos + 4 <= len(tiff):
+            next_offset = _unpack(endian + 'I', tiff, pos)[0]
+
+    # 新IFD0放在末尾（按字对齐），超过4字节的取值紧跟在IFD0之后
+    padding = b'\x00' * (len(tiff) & 1)
+    ifd_offset = len(tiff) + len(padding)
+    data_offset = ifd_offset + 2 + 12 * len(set(entries) | set(values)) + 4
+    extra = b''
+    for tag, text in values.items():
+        raw = text.encode('utf-8') + b'\x00'
+        if len(raw) <= 4:
+            value_field = raw.ljust(4, b'\x00')
+        else:
+            value_field = struct.pack(endian + 'I', data_offset + len(extra))
+            extra += raw + b'\x00' * (len(raw) & 1)
+        entries[tag] = struct.pack(endian + 'HHI', tag, 2, len(raw)) + value_field
+
+    # IFD中的条目必须按标签升序排列
+    ifd = (struct.pack(endian + 'H', len(entries))
+           + b''.join(entries[tag] for tag in sorted(entries))
+           + struct.pack(endian + 'I', next_offset))
+    return tiff[:4] + struct.pack(endian + 'I', ifd_offset) + tiff[8:] + padding + ifd + extra
+
+
+def strip_exif_tags(tiff, groups):
+    """
+    在字节层面删除EXIF中的GPS、MakerNote或缩略图，并重新排列剩余数据、修正所有偏移
+    只解析IFD条目头，取值按原始字节复制，不解码成字典再重新序列化
+    保留的MakerNote固定在原偏移处，使其内部相对TIFF头的偏移继续有效
+    :param tiff: TIFF格式的EXIF字节串
+    :param groups: 要删除的分组，取值见STRIP_GROUPS
+    :return: 删除后的TIFF格式字节串，没有可删除的数据时原样返回
+    """
+    endian, ifd0_offset = _tiff_header(tiff)
+    if endian is None or not groups:
+        return tiff
+    dropped_tags = set()
+    if 'gps' in groups:
+        dropped_tags.add(TAG_GPS_IFD)
+    if 'makernote' in groups:
+        dropped_tags.add(TAG_MAKER_NOTE)
+
+    ifds = {}  # IFD原偏移 -> [(标签, 原始12字节条目, 取值原偏移或None)]
+    next_ifds = {}  # IFD原偏移 -> 下一个IFD原偏移
+    blocks = {}  # 超过4字节的取值及缩略图：原偏移 -> 长度
+    pinned = set()  # 需要保持原偏移的数据块
+    stripped = False
+
+    def walk(offset, follow_next):
+        nonlocal stripped
+        if offset in ifds or offset <= 0 or offset + 2 > len(tiff):
+            return
+        entries = ifds[offset] = []
+        thumbnail = {}
+        pos = offset + 2
+        for tag, typ, count, value_pos in _iter_ifd(tiff, offset, endian):
+            raw = tiff[pos:pos + 12]
+            pos += 12
+            size = _TYPE_SIZES.get(typ, 1) * count
+            if tag in dropped_tags or (size > 4 and value_pos + size > len(tiff)):
+                # 要删除的标签，以及取值越界的损坏条目
+                stripped = True
+                continue
+            if tag in _SUB_IFD_TAGS and size == 4:
+                walk(_unpack(endian + 'I', tiff, value_pos)[0], False)
+            elif tag in (TAG_THUMBNAIL_OFFSET, TAG_THUMBNAIL_LENGTH) and size == 4:
+                thumbnail[tag] = _unpack(endian + 'I', tiff, value_pos)[0]
+            if size > 4:
+                blocks[value_pos] = max(size, blocks.get(value_pos, 0))
+                if tag == TAG_MAKER_NOTE:
+                    pinned.add(value_pos)
+                entries.append((tag, raw, value_pos))
+            else:
+                entries.append((tag, raw, None))
+
+        thumbnail_offset = thumbnail.get(TAG_THUMBNAIL_OFFSET)
+        thumbnail_length = thumbnail.get(TAG_THUMBNAIL_LENGTH, 0)
+        if thumbnail_offset and thumbnail_offset + thumbnail_length <= len(tiff):
+            blocks[thumbnail_offset] = max(thumbnail_length, blocks.get(thumbnail_offset, 0))
+
+        next_offset = _unpack(endian + 'I', tiff, pos)[0] if follow_next and pos + 4 <= len(tiff) else 0
+        if next_offset and 'thumbnail' in groups:
+            stripped = True
+            next_offset = 0
+        next_ifds[offset] = next_offset
+        walk(next_offset, False)
+
+    walk(ifd0_offset, True)
+    if not stripped:
+        return tiff
+
+    # 按原来的先后顺序重新排列IFD和数据块，删除的数据只会让后面的内容前移，
+    # 所以固定偏移的MakerNote前面总能用空字节补齐
+    layout = sorted([(offset, 'ifd', 2 + 12 * len(entries) + 4) for offset, entries in ifds.items()]
+                    + [(offset, 'data', size) for offset, size in blocks.items()])
+    new_offsets = {}
+    pos = 8
+    for offset, kind, size in layout:
+        if kind == 'data' and offset in pinned and pos <= offset:
+            pos = offset
+        else:
+            pos += pos & 1
+        new_offsets[kind, offset] = pos
+        pos += size
+
+    out = bytearray(pos)
+    out[:4] = tiff[:4]
+    struct.pack_into(endian + 'I', out, 4, new_offsets['ifd', ifd0_offset])
+    for offset, kind, size in layout:
+        start = new_offsets[kind, offset]
+        if kind == 'data':
+            out[start:start + size] = tiff[offset:offset + size]
+            continue
+        entries = ifds[offset]
+        struct.pack_into(endian + 'H', out, start, len(entries))
+        pos = start + 2
+        for tag, raw, value_pos in entries:
+            out[pos:pos + 12] = raw
+            if value_pos is not None:
+                struct.pack_into(endian + 'I', out, pos + 8, new_offsets['data', value_pos])
+            elif tag in _SUB_IFD_TAGS or tag == TAG_THUMBNAIL_OFFSET:
+                target = _unpack(endian + 'I', raw, 8)[0]
+                key = ('ifd' if tag in _SUB_IFD_TAGS else 'data', target)
+                if key in new_offsets:
+                    struct.pack_into(endian + 'I', out, pos + 8, new_offsets[key])
+            pos += 12
+        next_offset = next_ifds[offset]
+        struct.pack_into(endian + 'I', out, pos, new_offsets['ifd', next_offset] if next_offset else 0)
+    return bytes(out)
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+字体索引
+扫描系统字体目录，只读取字体文件的name和cmap表，记录字体族名、路径、TTC索引和是否支持中文，
+索引以JSON保存在缓存目录中，字体目录没有变化时直接复用，按名称查找字体只需一次字典查询
+"""
+
+import os
+import sys
+import json
+import struct
+from functools import lru_cache
+
+from metadata_cache import default_cache_dir
+
+
+# 索引文件名
+INDEX_FILE_NAME = 'fonts.json'
+
+# 索引格式版本，格式变化时递增，旧索引会被自动重建
+INDEX_VERSION = 1
+
+# 字体文件扩展名
+FONT_EXTENSIONS = ('.ttf', '.otf', '.ttc', '.otc')
+
+# 用于判断字体是否支持中文的字符（中、文、日、期）
+CJK_SAMPLE = (0x4E2D, 0x6587, 0x65E5, 0x671F)
+
+# name表中的名称ID
+_NAME_FAMILY = 1
+_NAME_SUBFAMILY = 2
+_NAME_TYPOGRAPHIC_FAMILY = 16
+_NAME_TYPOGRAPHIC_SUBFAMILY = 17
+
+# 视为常规字重的样式名
+_REGULAR_STYLES = ('regular', 'normal', 'book', 'roman', 'medium', 'w3', 'w4', '')
+
+
+def font_dirs():
+    """
+    获取当前系统的标准字体目录
+    :return: 字体目录列表
+    """
+    home = os.path.expanduser('~')
+    if os.name == 'nt':
+        windir = os.environ.get('WINDIR', 'C:/Windows')
+        local = os.environ.get('LOCALAPPDATA') or home
+        return [os.path.join(windir, 'Fonts'), os.path.join(local, 'Microsoft', 'Windows', 'Fonts')]
+    if sys.platform == 'darwin':
+        return ['/System/Library/Fonts', '/Library/Fonts', os.path.join(home, 'Library', 'Fonts')]
+    data_home = os.environ.get('XDG_DATA_HOME') or os.path.join(home, '.local', 'share')
+    return ['/usr/share/fonts', '/usr/local/share/fonts', os.path.join(data_home, 'fonts'),
+            os.path.join(home, '.fonts')]
+
+
+def _read(fp, offset, size):
+    """
+    从字体文件的指定偏移读取数据
+    """
+    fp.seek(offset)
+    return fp.read(size)
+
+
+def _face_offsets(fp):
+    """
+    读取字体文件中每个字体的起始偏移，TTC/OTC字体集包含多个字体
+    :return: 偏移列表，不是TrueType/OpenType字体时返回空列表
+    """
+    header = _read(fp, 0, 12)
+    if len(header) < 12:
+        return []
+    if header[:4] == b'ttcf':
+        count = struct.unpack('>I', header[8:12])[0]
+        data = _read(fp, 12, 4 * count)
+        return list(struct.unpack(f'>{len(data) // 4}I', data[:len(data) // 4 * 4]))
+    if header[:4] in (b'\x00\x01\x00\x00', b'OTTO', b'true'):
+        return [0]
+    return []
+
+
+def _table_directory(fp, offset):
+    """
+    读取一个字体的表目录
+    :return: {表名: (偏移, 长度)}
+    """
+    data = _read(fp, offset, 12)
+    if len(data) < 12:
+        return {}
+    count = struct.unpack('>H', data[4:6])[0]
+    records = _read(fp, offset + 12, 16 * count)
+    tables = {}
+    for pos in range(0, len(records) - 15, 16):
+        tag, _, table_offset, length = struct.unpack('>4sIII', records[pos:pos + 16])
+        tables[tag.decode('latin-1')] = (table_offset, length)
+    return tables
+
+
+def _read_names(data):
+    """
+    解析name表
+    :param data: name表数据
+    :return: {名称ID: [名称, ...]}，英文名称排在前面
+    """
+    names = {}
+    if len(data) < 6:
+        return names
+    count, string_offset = struct.unpack('>HH', data[2:6])
+    english = []
+    other = []
+    for pos in range(6, min(6 + 12 * count, len(data) - 11), 12):
+        platform, encoding, language, name_id, length, offset = struct.unpack('>6H', data[pos:pos + 12])
+        raw = data[string_offset + offset:string_offset + offset + length]
+        if platform == 3 or platform == 0:
+            text = raw.decode('utf-16-be', 'replace')
+            is_english = platform == 0 or language == 0x409
+        elif platform == 1 and encoding == 0:
+            text = raw.decode('latin-1')
+            is_english = language == 0
+        else:
+            continue
+        (english if is_english else other).append((name_id, text.strip()))
+    for name_id, text in english + other:
+        if text and text not in names.setdefault(name_id, []):
+            names[name_id].append(text)
+    return names
+
+
+def _cmap_covers(data, codepoints):
+    """
+    检查cmap表是否包含全部指定字符
+    :param data: cmap表数据
+    :param codepoints: 字符码位列表
+    :return: 是否全部包含
+    """
+    if len(data) < 4:
+        return False
+    count = struct.unpack('>H', data[2:4])[0]
+    subtables = {}
+    for pos in range(4, min(4 + 8 * count, len(data) - 7), 8):
+        platform, encoding, offset = struct.unpack('>HHI', data[pos:pos + 8])
+        subtables.setdefault((platform, encoding), offset)
+
+    # 优先使用完整Unicode的子表（格式12），其次是BMP子表（格式4）
+    for key in ((3, 10), (0, 6), (0, 4), (3, 1), (0, 3), (0, 1), (0, 0)):
+        offset = subtables.get(key)
+        if offset is None or offset + 2 > len(data):
+            continue
+        fmt = struct.unpack('>H', data[offset:offset + 2])[0]
+        if fmt == 12:
+            return all(_format12_glyph(data, offset, cp) for cp in codepoints)
+        if fmt == 4:
+            return all(_format4_glyph(data, offset, cp) for cp in codepoints)
+    return False
+
+
+def _format4_glyph(data, offset, codepoint):
+    """
+    在格式4的cmap子表中查找字符的字形编号
+    :return: 字形编号，0表示不包含
+    """
+    if codepoint > 0xFFFF:
+        return 0
+    seg_count = struct.unpack('>H', data[offset + 6:offset + 8])[0] // 2
+    ends = offset + 14
+    starts = ends + 2 * seg_count + 2
+    deltas = starts + 2 * seg_count
+    range_offsets = deltas + 2 * seg_count
+    for i in range(seg_count):
+        end = struct.unpack('>H', data[ends + 2 * i:ends + 2 * i + 2])[0]
+        if end < codepoint:
+            continue
+        start = struct.unpack('>H', data[starts + 2 * i:starts + 2 * i + 2])[0]
+        if start > codepoint:
+            return 0
+        delta = struct.unpack('>h', data[deltas + 2 * i:deltas + 2 * i + 2])[0]
+        range_pos = range_offsets + 2 * i
+        range_offset = struct.unpack('>H', data[range_pos:range_pos + 2])[0]
+        if range_offset == 0:
+            return (codepoint + delta) & 0xFFFF
+        glyph_pos = range_pos + range_offset + 2 * (codepoint - start)
+        if glyph_pos + 2 > len(data):
+            return 0
+        glyph = struct.unpack('>H', data[glyph_pos:glyph_pos + 2])[0]
+        return (glyph + delta) & 0xFFFF if glyph else 0
+    return 0
+
+
+def _format12_glyph(data, offset, codepoint):
+    """
+    在格式12的cmap子表中查找字符的字形编号
+    :return: 字形编号，0表示不包含
+    """
+    groups = struct.unpack('>I', data[offset + 12:offset + 16])[0]
+    pos = offset + 16
+    for _ in range(groups):
+        if pos + 12 > len(data):
+            break
+        start, end, glyph = struct.unpack('>III', data[pos:pos + 12])
+        if start <= codepoint <= end:
+            return glyph + codepoint - start
+        pos += 12
+    return 0
+
+
+def read_font_faces(path):
+    """
+    读取字体文件中每个字体的信息，只读取表目录、name表和cmap表
+    :param path: 字体文件路径
+    :return: [{'family', 'names', 'style', 'path', 'index', 'cjk'}, ...]
+    """
+    faces = []
+    with open(path, 'rb') as fp:
+        for index, offset in enumerate(_face_offsets(fp)):
+            tables = _table_directory(fp, offset)
+            if 'name' not in tables:
+                continue
+            names = _read_names(_read(fp, *tables['name']))
+            families = names.get(_NAME_TYPOGRAPHIC_FAMILY, []) + names.get(_NAME_FAMILY, [])
+            if not families:
+                continue
+            styles = names.get(_NAME_TYPOGRAPHIC_SUBFAMILY) or names.get(_NAME_SUBFAMILY) or ['']
+            cjk = 'cmap' in tables and _cmap_covers(_read(fp, *tables['cmap']), CJK_SAMPLE)
+            faces.append({
+                'family': families[0],
+                'names': list(dict.fromkeys(families)),
+                'style': styles[0],
+                'path': path,
+                'index': index,
+                'cjk': cjk,
+            })
+    return faces
+
+
+def _name_keys(name):
+    """
+    生成用于查找的键：完整名称，以及按单词截取的前缀（如"Noto Sans CJK SC"可用"Noto Sans CJK"查到）
+    :return: (完整名称键, 前缀键列表)
+    """
+    words = name.lower().replace('-', ' ').replace('_', ' ').split()
+    return ' '.join(words), [' '.join(words[:n]) for n in range(len(words) - 1, 0, -1)]
+
+
+def normalize_font_name(name):
+    """
+    把字体名称规范为查找用的键（忽略大小写、连字符和多余空格）
+    """
+    return _name_keys(name)[0]
+
+
+def build_font_index(dirs=None):
+    """
+    扫描字体目录，建立字体索引
+    :param dirs: 字体目录列表，默认使用font_dirs()
+    :return: 索引字典{'version', 'dirs', 'fonts', 'lookup'}
+    """
+    dirs = [d for d in (dirs or font_dirs()) if os.path.isdir(d)]
+    dir_mtimes = {}
+    fonts = []
+    for root_dir in dirs:
+        for dirpath, dirnames, filenames in os.walk(root_dir):
+            dirnames.sort()
+            dir_mtimes[dirpath] = os.stat(dirpath).st_mtime_ns
+            for filename in sorted(filenames):
+                if not filename.lower().endswith(FONT_EXTENSIONS):
+                    continue
+                try:
+                    fonts.extend(read_font_faces(os.path.join(dirpath, filename)))
+                except (OSError, struct.error):
+                    continue
+
+    # 同名字体优先选择支持中文的常规字重
+    order = sorted(range(len(fonts)), key=lambda i: (not fonts[i]['cjk'],
+                                                      fonts[i]['style'].lower() not in _REGULAR_STYLES,
+                                                      len(fonts[i]['family']), fonts[i]['path'], fonts[i]['index']))
+    lookup = {}
+    prefixes = {}
+    for i in order:
+        for name in fonts[i]['names']:
+            key, name_prefixes = _name_keys(name)
+            lookup.setdefault(key, i)
+            for prefix in name_prefixes:
+                prefixes.setdefault(prefix, i)
+    # 完整名称优先于前缀
+    for prefix, i in prefixes.items():
+        lookup.setdefault(prefix, i)
+    # 没有指定字体时使用的中文字体
+    cjk_fonts = [i for i in order if fonts[i]['cjk']]
+
+    return {
+        'version': INDEX_VERSION,
+        'dirs': dir_mtimes,
+        'roots': dirs,
+        'fonts': fonts,
+        'lookup': lookup,
+        'default_cjk': cjk_fonts[0] if cjk_fonts else None,
+    }
+
+
+def _index_is_current(index, dirs):
+    """
+    检查索引是否仍然有效：格式版本一致，且扫描过的每个目录的修改时间都没有变化
+    """
+    if index.get('version') != INDEX_VERSION or index.get('roots') != [d for d in dirs if os.path.isdir(d)]:
+        return False
+    for dirpath, mtime_ns in index['dirs'].items():
+        try:
+            if os.stat(dirpath).st_mtime_ns != mtime_ns:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+@lru_cache(maxsize=None)
+def load_font_index(cache_dir=None):
+    """
+    加载字体索引，索引不存在或字体目录有变化时重新扫描并保存
+    :param cache_dir: 索引所在目录，默认使用default_cache_dir()
+    :return: 索引字典
+    """
+    dirs = font_dirs()
+    index_file = os.path.join(cache_dir or default_cache_dir(), INDEX_FILE_NAME)
+    try:
+        with open(index_file, encoding='utf-8') as f:
+            index = json.load(f)
+        if _index_is_current(index, dirs):
+            return index
+    except (OSError, ValueError):
+        pass
+
+    index = build_font_index(dirs)
+    try:
+        os.makedirs(os.path.dirname(index_file), exist_ok=True)
+        with open(index_file, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+    except OSError as e:
+        print(f"警告: 无法保存字体索引 {index_file}: {e}")
+    return index
+
+
+def find_font(name, cache_dir=None):
+    """
+    按字体族名查找字体，支持完整名称和按单词截取的前缀
+    :param name: 字体族名，如"Noto Sans CJK"、"SimHei"
+    :param cache_dir: 索引所在目录
+    :return: 字体信息字典或None
+    """
+    index = load_font_index(cache_dir)
+    i = index['lookup'].get(normalize_font_name(name))
+    return index['fonts'][i] if i is not None else None
+
+
+def find_cjk_font(cache_dir=None):
+    """
+    查找一个支持中文的字体
+    :param cache_dir: 索引所在目录
+    :return: 字体信息字典或None
+    """
+    index = load_font_index(cache_dir)
+    i = index['default_cjk']
+    return index['fonts'][i] if i is not None else None
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+字体管理
+水印字体在进程内只查找和加载一次，之后按(字体路径, 字号, 字体索引)从缓存中取用
+字体文件只读入内存一次，不同字号共用同一份数据，多进程处理时直接传给工作进程
+"""
+
+import io
+import os
+from bisect import bisect_left
+from functools import lru_cache
+
+from PIL import ImageFont
+
+from font_index import FONT_EXTENSIONS, find_font, find_cjk_font
+
+
+# 随程序附带的字体目录，其中的字体优先于系统字体使用，在没有系统字体的容器中结果也相同
+BUNDLED_FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts')
+
+# 默认水印字体候选：(字体路径, TTC字体集中的索引)，按顺序使用第一个能加载的
+DEFAULT_FONTS = [
+    ("C:/Windows/Fonts/simhei.ttf", 0),  # Windows 黑体
+    ("/usr/share/fonts/truetype/wqy/wqy-microhei.ttc", 0),  # Linux 文泉驿微米黑
+]
+
+
+# 按图片尺寸计算字号时可选的字号档位，不同分辨率的图片落在少数几档上，可以共用缓存的字体和蒙版
+FONT_SIZE_BUCKETS = (8, 10, 12, 14, 16, 20, 24, 28, 32, 40, 48, 56, 64, 80, 96, 112, 128,
+                     160, 192, 224, 256, 320, 384, 448, 512)
+
+
+def bucket_font_size(size):
+    """
+    把字号取整到最接近的档位（与两侧档位距离相同时取较小的一档）
+    :param size: 字号
+    :return: FONT_SIZE_BUCKETS中的字号
+    """
+    i = bisect_left(FONT_SIZE_BUCKETS, size)
+    if i == 0:
+        return FONT_SIZE_BUCKETS[0]
+    if i == len(FONT_SIZE_BUCKETS):
+        return FONT_SIZE_BUCKETS[-1]
+    lower, upper = FONT_SIZE_BUCKETS[i - 1], FONT_SIZE_BUCKETS[i]
+    return lower if size - lower <= upper - size else upper
+
+
+def scaled_font_size(font_scale, image_size):
+    """
+    按图片短边的比例计算字号，并取整到字号档位
+    :param font_scale: 字号占图片短边的比例，如0.03
+    :param image_size: 图片尺寸(宽, 高)
+    :return: 字号
+    """
+    return bucket_font_size(min(image_size) * font_scale)
+
+
+# 已读入内存的字体文件{字体路径: 字体数据}
+_font_data = {}
+
+# 已解析的字体{字体文件路径或字体族名: (字体路径, 字体索引)}，键为None表示默认字体
+_resolved_fonts = {}
+
+# 字体索引所在目录，为None时使用默认缓存目录
+_font_cache_dir = None
+
+
+def set_font_cache_dir(cache_dir):
+    """
+    设置查找字体族名时使用的字体索引目录，与元数据缓存共用--cache-dir
+    :param cache_dir: 缓存目录，为None时使用默认缓存目录
+    """
+    global _font_cache_dir
+    _font_cache_dir = cache_dir
+
+
+def read_font_file(path):
+    """
+    把字体文件读入内存，每个文件只读取一次
+    :param path: 字体文件路径
+    :return: 字体数据
+    """
+    data = _font_data.get(path)
+    if data is None:
+        with open(path, 'rb') as f:
+            data = f.read()
+        _font_data[path] = data
+    return data
+
+
+@lru_cache(maxsize=128)
+def load_font(path, size, index=0):
+    """
+    加载字体并在进程内缓存，同一字体和字号只会加载一次
+    字体从内存中的数据创建，不同字号共用read_font_file()读入的同一份数据
+    :param path: 字体文件路径，为None时使用Pillow的默认字体
+    :param size: 字号
+    :param index: TTC字体集中的字体索引
+    :return: 字体对象
+    """
+    if path is None:
+        # Pillow 10.1起默认字体可以指定字号，旧版本只有固定大小的点阵字体
+        try:
+            return ImageFont.load_default(size)
+        except TypeError:
+            return ImageFont.load_default()
+    return ImageFont.truetype(io.BytesIO(read_font_file(path)), size, index=index)
+
+
+@lru_cache(maxsize=None)
+def find_bundled_font():
+    """
+    按文件名顺序选取fonts目录中的第一个字体
+    :return: 字体路径，没有附带字体时返回None
+    """
+    try:
+        names = sorted(os.listdir(BUNDLED_FONT_DIR))
+    except OSError:
+        return None
+    for name in names:
+        if name.lower().endswith(FONT_EXTENSIONS):
+            return os.path.join(BUNDLED_FONT_DIR, name)
+    return None
+
+
+@lru_cache(maxsize=None)
+def find_default_font():
+    """
+    查找默认水印字体：先使用fonts目录中附带的字体，再尝试DEFAULT_FONTS，最后从字体索引中选取支持中文的字体
+    结果在进程内缓存，找不到时只警告一次
+    :return: (字体路径, 字体索引)，没有可用字体时返回(None, 0)
+    """
+    bundled = find_bundled_font()
+    if bundled:
+        return bundled, 0
+
+    for path, index in DEFAULT_FONTS:
+        if is_loadable(path, index):
+            return path, index
+
+    face = find_cjk_font(_font_cache_dir)
+    if face:
+        return face['path'], face['index']
+    print("警告: 无法加载中文字体，可能导致水印显示不正确")
+    return None, 0
+
+
+def is_loadable(path, index=0):
+    """
+    检查字体文件能否加载，不能加载时从内存中删除已读入的数据，不会传给工作进程
+    :param path: 字体文件路径
+    :param index: TTC字体集中的字体索引
+    :return: 是否能加载
+    """
+    try:
+        load_font(path, 16, index)
+        return True
+    except (OSError, ValueError):
+        _font_data.pop(path, None)
+        return False
+
+
+def resolve_font(name=None):
+    """
+    把--font参数解析为字体文件，结果在进程内缓存；指定的字体无法加载时只警告一次，使用默认字体
+    :param name: 字体文件路径或字体族名（如"Noto Sans CJK"），为None时使用默认字体
+    :return: (字体路径, 字体索引)
+    """
+    resolved = _resolved_fonts.get(name)
+    if resolved is None:
+        if not name:
+            resolved = find_default_font()
+        elif os.path.isfile(name):
+            resolved = (name, 0)
+            if not is_loadable(name):
+                print(f"警告: {name} 不是可用的字体文件，使用默认字体")
+                resolved = find_default_font()
+        else:
+            face = find_font(name, _font_cache_dir)
+            if face and is_loadable(face['path'], face['index']):
+                resolved = (face['path'], face['index'])
+            else:
+                print(f"警告: 未找到字体 {name}，使用默认字体")
+                resolved = find_default_font()
+        _resolved_fonts[name] = resolved
+    return resolved
+
+
+def get_font(size, name=None):
+    """
+    获取指定字号的水印字体
+    :param size: 字号
+    :param name: 字体文件路径或字体族名，为None时使用默认字体
+    :return: 字体对象
+    """
+    path, index = resolve_font(name)
+    return load_font(path, size, index)
+
+
+def export_fonts():
+    """
+    导出已解析的字体和已读入内存的字体数据，作为工作进程的初始化参数
+    fork方式创建的工作进程直接继承这些数据，spawn方式每个进程只接收一次
+    :return: (已解析的字体, 字体数据)
+    """
+    return dict(_resolved_fonts), dict(_font_data)
+
+
+def import_fonts(state):
+    """
+    在工作进程中导入主进程已解析的字体，之后不再查找字体目录或读取字体文件
+    :param state: export_fonts()的返回值
+    """
+    resolved_fonts, font_data = state
+    _resolved_fonts.update(resolved_fonts)
+    _font_data.update(font_data)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+图片元数据缓存
+以(路径, 文件大小, 修改时间)为键把解析出的EXIF日期、尺寸、模式和格式保存到SQLite，
+重复处理未变化的图片时无需再读取元数据
+"""
+
+import os
+import csv
+import json
+import sqlite3
+from collections import namedtuple
+
+
+# 单张图片的元数据
+# tags: 从EXIF/XMP读取的字段{字段名: 值}，包括各日期字段和Orientation，水印日期按优先级从中选取；
+#       使用文本模板时还包括模板引用的EXIF标签（不存在的标签值为None）
+ImageMetadata = namedtuple('ImageMetadata', ['tags', 'width', 'height', 'mode', 'format'])
+
+# 缓存文件名
+CACHE_FILE_NAME = 'metadata.sqlite'
+
+# 表结构版本，结构变化时递增，旧缓存会被自动丢弃
+SCHEMA_VERSION = 3
+
+
+def default_cache_dir():
+    """
+    获取默认缓存目录
+    :return: 缓存目录路径
+    """
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'photo_watermark')
+
+
+class MetadataCache(object):
+    """
+    基于SQLite的元数据缓存
+    """
+
+    def __init__(self, cache_dir=None, commit_interval=500):
+        """
+        :param cache_dir: 缓存目录，默认使用default_cache_dir()
+        :param commit_interval: 每写入多少条记录提交一次
+        """
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.commit_interval = commit_interval
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        cache_file = os.path.join(self.cache_dir, CACHE_FILE_NAME)
+        self.conn = sqlite3.connect(cache_file)
+        try:
+            self._init_schema()
+        except sqlite3.DatabaseError:
+            # 缓存文件损坏（不是SQLite数据库）时删除重建，其中的元数据都可以重新读取
+            self.conn.close()
+            os.remove(cache_file)
+            self.conn = sqlite3.connect(cache_file)
+            self._init_schema()
+
+    def _init_schema(self):
+        """
+        创建数据表，表结构版本不一致时重建
+        """
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.conn.execute('DROP TABLE IF EXISTS metadata')
+            self.conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS metadata ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, '
+            'tags TEXT, width INTEGER, height INTEGER, mode TEXT, format TEXT)'
+        )
+        self.conn.commit()
+
+    def get(self, path, file_stat, required=()):
+        """
+        查询缓存，文件大小或修改时间变化时视为未命中
+        :param path: 图片文件路径
+        :param file_stat: 图片的stat结果（可直接使用os.scandir返回的结果）
+        :param required: 必须已读取过的模板标签名，缓存的记录缺少其中任何一个时视为未命中
+        :return: ImageMetadata或None
+        """
+        row = self.conn.execute(
+            'SELECT size, mtime_ns, tags, width, height, mode, format FROM metadata WHERE path = ?',
+            (os.path.abspath(path),)
+        ).fetchone()
+        if row and row[0] == file_stat.st_size and row[1] == file_stat.st_mtime_ns:
+            tags = json.loads(row[2])
+            if all(name in tags for name in required):
+                self.hits += 1
+                return ImageMetadata(tags, *row[3:])
+        self.misses += 1
+        return None
+
+    def put(self, path, file_stat, metadata):
+        """
+        写入缓存
+        :param path: 图片文件路径
+        :param file_stat: 图片的stat结果
+        :param metadata: ImageMetadata
+        """
+        self.conn.execute(
+            'INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (os.path.abspath(path), file_stat.st_size, file_stat.st_mtime_ns,
+             json.dumps(metadata.tags)) + tuple(metadata[1:])
+        )
+        self._pending += 1
+        if self._pending >= self.commit_interval:
+            self.conn.commit()
+            self._pending = 0
+
+    def close(self):
+        """
+        提交未保存的记录并关闭数据库
+        """
+        self.conn.commit()
+        self.conn.close()
+
+
+class MetadataCollector(object):
+    """
+    与MetadataCache接口相同的记录器：查询总是未命中，写入的记录保存在列表中
+    工作进程中不能使用主进程的SQLite连接，处理时读取到的元数据先记录下来，再由主进程写入缓存
+    """
+
+    def __init__(self):
+        # [(路径, stat结果, ImageMetadata)]
+        self.records = []
+
+    def get(self, path, file_stat, required=()):
+        """
+        :return: 总是返回None
+        """
+        return None
+
+    def put(self, path, file_stat, metadata):
+        """
+        记录一张图片的元数据
+        :param path: 图片文件路径
+        :param file_stat: 图片的stat结果
+        :param metadata: ImageMetadata
+        """
+        self.records.append((path, file_stat, metadata))
+
+
+# 清单文件的字段
+# date为按扫描时的日期优先级选出的水印日期，tags为读取到的所有EXIF/XMP字段（JSON）
+INVENTORY_FIELDS = ['path', 'date', 'size', 'mtime_ns', 'format', 'width', 'height', 'mode', 'tags']
+
+
+def write_inventory(output_file, records):
+    """
+    写入图片清单，扩展名为.csv时写CSV，否则写JSONL
+    :param output_file: 清单文件路径
+    :param records: (文件路径, stat结果, ImageMetadata, 水印日期)列表
+    """
+    rows = []
+    for path, file_stat, metadata, date in records:
+        rows.append({
+            'path': os.path.abspath(path),
+            'date': date,
+            'size': file_stat.st_size,
+            'mtime_ns': file_stat.st_mtime_ns,
+            'format': metadata.format,
+            'width': metadata.width,
+            'height': metadata.height,
+            'mode': metadata.mode,
+            'tags': metadata.tags,
+        })
+
+    if output_file.lower().endswith('.csv'):
+        with open(output_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=INVENTORY_FIELDS)
+            writer.writeheader()
+            for row in rows:
+                # CSV中的字段表以JSON字符串保存
+                writer.writerow(dict(row, tags=json.dumps(row['tags'], ensure_ascii=False)))
+    else:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+
+def load_inventory(inventory_file):
+    """
+    读取图片清单
+    :param inventory_file: 清单文件路径（CSV或JSONL）
+    :return: {绝对路径: (文件大小, 修改时间, ImageMetadata)}
+    """
+    if inventory_file.lower().endswith('.csv'):
+        with open(inventory_file, newline='', encoding='utf-8') as f:
+            rows = [dict(row, tags=json.loads(row['tags'] or '{}')) for row in csv.DictReader(f)]
+    else:
+        with open(inventory_file, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    inventory = {}
+    for row in rows:
+        metadata = ImageMetadata(row['tags'], int(row['width']), int(row['height']),
+                                 row['mode'], row['format'])
+        inventory[row['path']] = (int(row['size']), int(row['mtime_ns']), metadata)
+    return inventory
+
+
+def lookup_inventory(inventory, path, file_stat, required=()):
+    """
+    从清单中查询图片元数据，文件已变化或缺少需要的模板标签时视为不存在
+    :param inventory: load_inventory()的返回值
+    :param path: 图片文件路径
+    :param file_stat: 图片的stat结果
+    :param required: 必须已读取过的模板标签名
+    :return: ImageMetadata或None
+    """
+    entry = inventory.get(os.path.abspath(path))
+    if (entry and entry[0] == file_stat.st_size and entry[1] == file_stat.st_mtime_ns
+            and all(name in entry[2].tags for name in required)):
+        return entry[2]
+    return None
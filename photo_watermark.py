@@ -8,154 +8,614 @@
 
 import os
 import argparse
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageColor
 from datetime import datetime
 import sys
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from multiprocessing import Pool
 
+from exif_tools import (DATE_SOURCES, EXIF_HEADER, STRIP_GROUPS, TAG_EXIF_IFD, TAG_GPS_IFD, TAG_IMAGE_DESCRIPTION,
+                        TAG_MAKER_NOTE, TAG_ORIENTATION, TAG_SOFTWARE, patch_ifd0_ascii, read_metadata_block,
+                        read_tags, read_file_tags, strip_exif_header, strip_exif_tags)
+from font_manager import export_fonts, get_font, import_fonts, scaled_font_size, set_font_cache_dir
+from text_template import compile_template
+from watermark_render import (BLEND_ENGINES, TILE_ANGLE, TILE_POSITION, WatermarkStyle, get_effect_stamp,
+                              get_placement, get_text_mask, get_tile, draw_placement, normalize_orientation)
+import watermark_render
+from metadata_cache import ImageMetadata, MetadataCache, MetadataCollector, write_inventory, load_inventory, lookup_inventory
 
-def get_exif_date(image_path):
+
+# 定义支持的图片格式
+SUPPORTED_FORMATS = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.gif', '.webp']
+
+# 保存时可以直接写入EXIF和ICC原始数据的格式（MPO为手机常见的多帧JPEG）
+METADATA_FORMATS = {'JPEG', 'MPO', 'PNG', 'WEBP', 'TIFF'}
+
+# JPEG单个APP1段能容纳的EXIF数据上限
+MAX_JPEG_EXIF_SIZE = 65533
+
+
+def parse_exif_date_slow(date_str):
+    """
+    使用strptime解析EXIF日期字符串，兼容非标准的厂商格式
+    :param date_str: EXIF日期字符串
+    :return: 格式化的日期字符串(YYYY-MM-DD)或None
+    """
+    try:
+        date_obj = datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S')
+        return date_obj.strftime('%Y-%m-%d')
+    except ValueError:
+        # 尝试其他可能的日期格式
+        try:
+            date_obj = datetime.strptime(date_str.split(' ')[0], '%Y:%m:%d')
+            return date_obj.strftime('%Y-%m-%d')
+        except:
+            pass
+    return None
+
+
+@lru_cache(maxsize=4096)
+def format_date_part(date_part):
+    """
+    将"YYYY:MM:DD"形式的日期部分格式化为YYYY-MM-DD，结果按日期部分缓存
+    同一批照片的拍摄时间各不相同，但日期很少，缓存几乎总能命中
+    :param date_part: 10个字符的日期部分，年、月、日都是ASCII数字
+    :return: 格式化的日期字符串(YYYY-MM-DD)，日期无效时为None
+    """
+    year, month, day = int(date_part[0:4]), int(date_part[5:7]), int(date_part[8:10])
+    # 快速路径：29日之后需要结合月份和闰年判断，交给strptime
+    if year >= 1000 and 1 <= month <= 12 and 1 <= day <= 28:
+        return f'{date_part[0:4]}-{date_part[5:7]}-{date_part[8:10]}'
+    try:
+        return datetime.strptime(date_part, '%Y:%m:%d').strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def format_exif_date(date_str):
+    """
+    将EXIF日期字符串格式化为YYYY-MM-DD，结果与parse_exif_date_slow相同
+    :param date_str: EXIF日期字符串，格式通常为："YYYY:MM:DD HH:MM:SS"
+    :return: 格式化的日期字符串(YYYY-MM-DD)或None
+    """
+    if not date_str:
+        return None
+    # "YYYY:MM:DD"后为空格或结尾时，strptime的结果只取决于日期部分（时间无效时也只按日期解析），
+    # 按日期部分缓存；isdigit()对全角数字和上标等非ASCII字符也返回True，这些交给strptime处理
+    date_part = date_str[:10]
+    if (len(date_part) == 10 and date_part.isascii() and date_part[4] == ':' and date_part[7] == ':'
+            and (len(date_str) == 10 or date_str[10] == ' ')
+            and (date_part[0:4] + date_part[5:7] + date_part[8:10]).isdigit()):
+        return format_date_part(date_part)
+    return parse_exif_date_slow(date_str)
+
+
+def resolve_date(tags, date_priority=None):
+    """
+    按优先级从日期字段中选出水印日期
+    :param tags: 从EXIF/XMP读取的字段{字段名: 值}
+    :param date_priority: 日期来源优先级列表，默认使用DATE_SOURCES的顺序
+    :return: 格式化的日期字符串(YYYY-MM-DD)或None
+    """
+    for name in date_priority or DATE_SOURCES:
+        value = tags.get(name)
+        date = format_exif_date(value) if isinstance(value, str) else None
+        if date:
+            return date
+    return None
+
+
+def resolve_watermark_text(image_path, tags, default_text=None, date_priority=None, text_template=None):
+    """
+    确定图片的水印文本：拍摄日期（或按模板生成的文本），没有时使用默认文本，都没有时使用当前日期
+    :param image_path: 图片文件路径，用于输出警告
+    :param tags: 从EXIF/XMP读取的字段{字段名: 值}
+    :param default_text: 无EXIF信息时的默认文本
+    :param date_priority: 日期来源优先级列表
+    :param text_template: 编译后的水印文本模板(TextTemplate)，为None时水印为拍摄日期
+    :return: 水印文本
+    """
+    watermark_text = resolve_date(tags, date_priority)
+    if text_template is not None and (watermark_text or not text_template.uses_date):
+        # 模板引用的字段都不存在时按没有EXIF信息处理
+        watermark_text = text_template.render(tags, watermark_text)
+    if not watermark_text:
+        if default_text:
+            watermark_text = default_text
+        else:
+            # 如果没有默认文本且没有EXIF日期，则使用当前日期
+            watermark_text = datetime.now().strftime('%Y-%m-%d')
+            if text_template is not None:
+                watermark_text = text_template.render(tags, watermark_text) or watermark_text
+            print(f"警告: {image_path} 没有EXIF拍摄日期，使用当前日期作为水印")
+    return watermark_text
+
+
+def get_exif_date(image_path, date_priority=None):
     """
     从图片中提取EXIF信息中的拍摄日期
     :param image_path: 图片文件路径
+    :param date_priority: 日期来源优先级列表
     :return: 格式化的日期字符串(YYYY-MM-DD)或None
     """
     try:
-        with Image.open(image_path) as img:
-            exif_data = img._getexif()
-            if exif_data:
-                # EXIF拍摄日期标签ID
-                date_tag = 36867  # DateTimeOriginal
-                if date_tag in exif_data:
-                    date_str = exif_data[date_tag]
-                    # 解析日期字符串，格式通常为："YYYY:MM:DD HH:MM:SS"
-                    try:
-                        date_obj = datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S')
-                        return date_obj.strftime('%Y-%m-%d')
-                    except ValueError:
-                        # 尝试其他可能的日期格式
-                        try:
-                            date_obj = datetime.strptime(date_str.split(' ')[0], '%Y:%m:%d')
-                            return date_obj.strftime('%Y-%m-%d')
-                        except:
-                            pass
+        # 只读取文件头中的元数据段，不构造PIL Image
+        with open(image_path, 'rb') as fp:
+            tags = read_file_tags(fp)
+        return resolve_date(tags, date_priority)
     except Exception as e:
         print(f"读取{image_path}的EXIF信息时出错: {e}")
     return None
 
 
-def add_watermark_to_image(image_path, output_dir, font_size=16, color='white', position='bottom-right', opacity=80, default_text=None):
+def get_image_tags(img, extra_tags=()):
+    """
+    从已打开的图片中一次性读取日期和方向等字段，复用打开图片时已解析的文件头，不再重新打开文件
+    :param img: 已打开的PIL Image对象
+    :param extra_tags: 同时读取的模板标签名
+    :return: {字段名: 取值}
+    """
+    try:
+        exif_bytes = img.info.get('exif')
+        xmp = img.info.get('xmp') or img.info.get('XML:com.adobe.xmp')
+        if exif_bytes:
+            # JPEG/WebP/PNG在打开时已把EXIF原始数据放入info
+            return read_tags(strip_exif_header(exif_bytes), xmp, extra_tags)
+        if img.fp is not None:
+            # TIFF的IFD、图像数据之后的PNG eXIf块等，直接从同一个文件句柄读取
+            position = img.fp.tell()
+            try:
+                return read_tags(*read_metadata_block(img.fp), extra_tags=extra_tags)
+            finally:
+                img.fp.seek(position)
+    except Exception as e:
+        print(f"读取{img.filename}的EXIF信息时出错: {e}")
+    return dict.fromkeys(extra_tags)
+
+
+def read_image_metadata(img, extra_tags=()):
+    """
+    从已打开的图片中读取元数据
+    :param img: 已打开的PIL Image对象
+    :param extra_tags: 同时读取的模板标签名
+    :return: ImageMetadata
+    """
+    width, height = img.size
+    return ImageMetadata(get_image_tags(img, extra_tags), width, height, img.mode, img.format)
+
+
+def watermark_color(color, opacity):
+    """
+    把颜色和透明度转换为RGBA颜色
+    :param color: 颜色名称或HEX值，或直接给出的RGBA元组
+    :param opacity: 透明度(0-100)
+    :return: (R, G, B, A)
+    """
+    if isinstance(color, str):
+        # 如果是颜色名称，转换为RGB后添加透明度
+        return ImageColor.getrgb(color)[:3] + (int(255 * opacity / 100),)
+    return color
+
+
+def loaded_orientation(img, metadata):
+    """
+    加载像素并返回像素数据实际所处的EXIF方向
+    较新的Pillow在加载TIFF时会自动按方向转置并删除Orientation标签，此时像素已是显示方向
+    :param img: 已打开的PIL Image对象
+    :param metadata: 图片元数据(ImageMetadata)
+    :return: EXIF方向值
+    """
+    img.load()
+    if img.format == 'TIFF' and TAG_ORIENTATION not in img.tag_v2:
+        return 1
+    return metadata.tags.get('Orientation')
+
+
+def build_save_options(img, exif_software=None, exif_description=None, strip=None):
+    """
+    构造保存参数，把原图的EXIF和ICC原始字节直接交给编码器，不经过解析和二次写入
+    :param img: 已打开的PIL Image对象
+    :param exif_software: 写入EXIF Software标签的文本，为None时不修改
+    :param exif_description: 写入EXIF ImageDescription标签的文本，为None时不修改
+    :param strip: 要从EXIF中删除的分组（见STRIP_GROUPS），为None时全部保留
+    :return: 传给img.save的关键字参数
+    """
+    options = {}
+    if img.format not in METADATA_FORMATS:
+        return options
+
+    patch = {}
+    if exif_software:
+        patch[TAG_SOFTWARE] = exif_software
+    if exif_description:
+        patch[TAG_IMAGE_DESCRIPTION] = exif_description
+
+    if img.format == 'TIFF':
+        # TIFF的EXIF就是文件本身的IFD，没有可直接复用的独立数据块，只能由编码器重新写出
+        exif = img.getexif()
+        exif.update(patch)
+        if strip and 'gps' in strip:
+            exif.pop(TAG_GPS_IFD, None)
+        if strip and 'makernote' in strip:
+            exif.get_ifd(TAG_EXIF_IFD).pop(TAG_MAKER_NOTE, None)
+        options['exif'] = exif
+    else:
+        exif_bytes = img.info.get('exif')
+        tiff = strip_exif_header(exif_bytes) if exif_bytes else None
+        if tiff and strip:
+            tiff = strip_exif_tags(tiff, strip)
+        if patch:
+            patched = patch_ifd0_ascii(tiff, patch)
+            if img.format in ('JPEG', 'MPO') and len(EXIF_HEADER) + len(patched) > MAX_JPEG_EXIF_SIZE:
+                print(f"警告: {img.filename} 的EXIF数据过大，无法写入Software/ImageDescription")
+            else:
+                tiff = patched
+        if tiff:
+            options['exif'] = EXIF_HEADER + tiff
+
+    icc_profile = img.info.get('icc_profile')
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    return options
+
+
+def add_watermark_to_image(image_path, output_dir, font_size=16, color='white', position='bottom-right', opacity=80, default_text=None,
+                           metadata=None, metadata_cache=None, file_stat=None, date_priority=None,
+                           exif_software=None, exif_description=None, strip=None, font_name=None,
+                           font_scale=None, style=None, text_template=None, blend_engine='pillow',
+                           tile_angle=TILE_ANGLE, watermark_text=None, placements=None):
     """
     向图片添加水印并保存
     :param image_path: 图片文件路径
     :param output_dir: 输出目录
     :param font_size: 字体大小
     :param color: 字体颜色
-    :param position: 水印位置
+    :param position: 水印位置，tile为斜向平铺整张图片
     :param opacity: 透明度(0-100)
     :param default_text: 无EXIF信息时的默认文本
+    :param metadata: 预先读取的元数据(ImageMetadata)，如来自扫描清单
+    :param metadata_cache: 元数据缓存(MetadataCache)，为None时不使用缓存
+    :param file_stat: 图片的stat结果，用于校验缓存
+    :param date_priority: 日期来源优先级列表
+    :param exif_software: 写入输出图片EXIF Software标签的文本
+    :param exif_description: 写入输出图片EXIF ImageDescription标签的文本
+    :param strip: 要从输出图片EXIF中删除的分组（见STRIP_GROUPS）
+    :param font_name: 字体文件路径或字体族名，为None时使用默认字体
+    :param font_scale: 字号占图片短边的比例，指定时忽略font_size，字号取整到FONT_SIZE_BUCKETS中的档位
+    :param style: 描边、阴影等水印效果(WatermarkStyle)，为None时为普通文字
+    :param text_template: 编译后的水印文本模板(TextTemplate)，为None时水印为拍摄日期
+    :param blend_engine: RGB图片的混合引擎（见BLEND_ENGINES）
+    :param tile_angle: 平铺水印（position为tile）的旋转角度
+    :param watermark_text: 规划阶段确定的水印文本，为None时根据元数据确定
+    :param placements: 规划阶段预先计算的位置表{(水印文本, 存储尺寸, 方向): (蒙版, 坐标)}，命中时不再调用FreeType
     :return: 是否成功
     """
     try:
-        # 打开图片
-        img = Image.open(image_path)
-        draw = ImageDraw.Draw(img, 'RGBA')
-        width, height = img.size
-
-        # 获取水印文本
-        watermark_text = get_exif_date(image_path)
-        if not watermark_text:
-            if default_text:
-                watermark_text = default_text
-            else:
-                # 如果没有默认文本且没有EXIF日期，则使用当前日期
-                watermark_text = datetime.now().strftime('%Y-%m-%d')
-                print(f"警告: {image_path} 没有EXIF拍摄日期，使用当前日期作为水印")
+        # 先查询元数据缓存，命中时不再解析EXIF；缓存中没有模板需要的标签时重新读取
+        extra_tags = text_template.tags if text_template is not None else ()
+        if metadata is None and metadata_cache is not None and file_stat is not None:
+            metadata = metadata_cache.get(image_path, file_stat, extra_tags)
 
-        # 加载字体，尝试使用系统字体
-        try:
-            # 尝试加载Windows系统字体
-            font = ImageFont.truetype("C:/Windows/Fonts/simhei.ttf", font_size)
-        except:
-            try:
-                # 尝试加载Linux系统字体
-                font = ImageFont.truetype("/usr/share/fonts/truetype/wqy/wqy-microhei.ttc", font_size)
-            except:
-                # 如果都失败，使用默认字体
-                font = ImageFont.load_default()
-                print("警告: 无法加载中文字体，可能导致水印显示不正确")
-
-        # 获取文本尺寸 - 使用textbbox替代textsize（Pillow 8.0.0+兼容性）
-        try:
-            # 尝试使用textbbox（Pillow 8.0.0+）
-            bbox = draw.textbbox((0, 0), watermark_text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-        except AttributeError:
-            # 兼容旧版本Pillow
-            text_width, text_height = draw.textsize(watermark_text, font=font)
-
-        # 计算文本位置
-        margin = 10  # 边距
-        if position == 'top-left':
-            text_x, text_y = margin, margin
-        elif position == 'top-right':
-            text_x, text_y = width - text_width - margin, margin
-        elif position == 'bottom-left':
-            text_x, text_y = margin, height - text_height - margin
-        elif position == 'bottom-right':
-            text_x, text_y = width - text_width - margin, height - text_height - margin
-        elif position == 'center':
-            text_x, text_y = (width - text_width) // 2, (height - text_height) // 2
-        else:
-            # 默认右下角
-            text_x, text_y = width - text_width - margin, height - text_height - margin
-
-        # 创建半透明文字
-        # 转换颜色为RGBA
-        if isinstance(color, str):
-            # 如果是颜色名称，转换为RGBA
-            from PIL import ImageColor
-            rgb_color = ImageColor.getrgb(color)
-            # 添加透明度
-            rgba_color = rgb_color + (int(255 * opacity / 100),)
-        else:
-            rgba_color = color
+        # 只打开一次图片，EXIF读取、绘制和保存共用同一个文件句柄
+        with Image.open(image_path) as img:
+            if metadata is None:
+                metadata = read_image_metadata(img, extra_tags)
+                if metadata_cache is not None and file_stat is not None:
+                    metadata_cache.put(image_path, file_stat, metadata)
+
+            # 获取水印文本
+            if watermark_text is None:
+                watermark_text = resolve_watermark_text(image_path, metadata.tags, default_text, date_priority,
+                                                        text_template)
 
-        # 绘制水印
-        draw.text((text_x, text_y), watermark_text, font=font, fill=rgba_color)
+            # 创建半透明文字
+            rgba_color = watermark_color(color, opacity)
 
-        # 创建输出目录（如果不存在）
-        os.makedirs(output_dir, exist_ok=True)
+            # 优先使用规划阶段预先计算的位置表，否则按(文字, 字体, 效果, 尺寸, 方向)从缓存中获取，
+            # 水印在显示时位于指定位置且文字方向正确
+            orientation = normalize_orientation(loaded_orientation(img, metadata))
+            placement = placements.get((watermark_text, img.size, orientation)) if placements else None
+            if placement is None:
+                size = scaled_font_size(font_scale, img.size) if font_scale else font_size
+                placement = get_placement(watermark_text, get_font(size, font_name), position, img.size, orientation,
+                                          rgba_color, style, tile_angle)
 
-        # 保存处理后的图片
-        output_path = os.path.join(output_dir, os.path.basename(image_path))
-        img.save(output_path)
-        print(f"已保存带水印的图片到: {output_path}")
-        return True
+            # 绘制水印
+            draw_placement(img, placement, rgba_color, blend_engine)
+            save_watermarked_image(img, image_path, output_dir, exif_software, exif_description, strip)
+            return True
     except Exception as e:
         print(f"处理{image_path}时出错: {e}")
         return False
 
 
-def process_path(input_path, font_size=16, color='white', position='bottom-right', opacity=80, default_text=None):
+def save_watermarked_image(img, image_path, output_dir, exif_software=None, exif_description=None, strip=None):
+    """
+    保存加好水印的图片，原图的EXIF和ICC配置文件按原始字节写回
+    :param img: 已绘制水印的图片
+    :param image_path: 原图片路径，输出文件与其同名
+    :param output_dir: 输出目录，不存在时自动创建
+    :param exif_software: 写入输出图片EXIF Software标签的文本
+    :param exif_description: 写入输出图片EXIF ImageDescription标签的文本
+    :param strip: 要从输出图片EXIF中删除的分组（见STRIP_GROUPS）
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, os.path.basename(image_path))
+    img.save(output_path, **build_save_options(img, exif_software, exif_description, strip))
+    print(f"已保存带水印的图片到: {output_path}")
+
+
+def iter_image_files(input_path, supported_formats):
+    """
+    使用os.scandir递归遍历目录中的图片，返回的stat结果可直接用于缓存校验而无需打开文件
+    :param input_path: 目录路径
+    :param supported_formats: 支持的扩展名列表
+    :return: 生成(文件路径, 相对目录, stat结果)
+    """
+    pending_dirs = ['']
+    while pending_dirs:
+        rel_dir = pending_dirs.pop()
+        dir_path = os.path.join(input_path, rel_dir) if rel_dir else input_path
+        try:
+            with os.scandir(dir_path) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            print(f"读取目录{dir_path}时出错: {e}")
+            continue
+
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                pending_dirs.append(os.path.join(rel_dir, entry.name))
+            elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in supported_formats:
+                yield entry.path, rel_dir, entry.stat()
+
+
+def read_file_metadata(image_path, extra_tags=()):
+    """
+    读取单个图片文件的元数据，只解析文件头，不解码像素
+    :param image_path: 图片文件路径
+    :param extra_tags: 同时读取的模板标签名
+    :return: ImageMetadata
+    """
+    with Image.open(image_path) as img:
+        return read_image_metadata(img, extra_tags)
+
+
+def list_image_files(input_path):
+    """
+    列出输入路径（单个文件或目录）中的所有图片
+    :param input_path: 输入文件或目录路径
+    :return: (文件路径, 相对目录, stat结果)列表
+    """
+    if os.path.isfile(input_path):
+        if os.path.splitext(input_path)[1].lower() in SUPPORTED_FORMATS:
+            return [(input_path, '', os.stat(input_path))]
+        print(f"警告: 文件 '{input_path}' 不是支持的图片格式")
+        return []
+    return list(iter_image_files(input_path, SUPPORTED_FORMATS))
+
+
+def scan_path(input_path, inventory_file, workers=None, use_cache=True, cache_dir=None, date_priority=None,
+              text_template=None):
+    """
+    预扫描输入路径，使用线程池并行读取拍摄日期等元数据并写入清单文件
+    :param input_path: 输入文件或目录路径
+    :param inventory_file: 清单文件路径（.csv为CSV，其他为JSONL）
+    :param workers: 读取元数据的线程数，默认由ThreadPoolExecutor决定
+    :param use_cache: 是否使用元数据缓存
+    :param cache_dir: 元数据缓存目录
+    :param date_priority: 日期来源优先级列表
+    :param text_template: 编译后的水印文本模板(TextTemplate)，同时读取模板引用的标签写入清单
+    """
+    if not os.path.exists(input_path):
+        print(f"错误: 路径 '{input_path}' 不存在")
+        return
+
+    files = list_image_files(input_path)
+    extra_tags = text_template.tags if text_template is not None else ()
+
+    metadata_cache = None
+    if use_cache:
+        try:
+            metadata_cache = MetadataCache(cache_dir)
+        except Exception as e:
+            print(f"警告: 无法打开元数据缓存，将不使用缓存: {e}")
+
+    # 先在主线程查询缓存（SQLite连接不能跨线程使用），未命中的文件再并行读取
+    records = []
+    pending = []
+    for file_path, rel_path, file_stat in files:
+        metadata = metadata_cache.get(file_path, file_stat, extra_tags) if metadata_cache is not None else None
+        if metadata is not None:
+            records.append((file_path, file_stat, metadata))
+        else:
+            pending.append((file_path, file_stat))
+
+    def read_safely(file_path):
+        try:
+            return read_file_metadata(file_path, extra_tags)
+        except Exception as e:
+            print(f"读取{file_path}的元数据时出错: {e}")
+            return None
+
+    failed_count = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(read_safely, [file_path for file_path, file_stat in pending])
+        for (file_path, file_stat), metadata in zip(pending, results):
+            if metadata is None:
+                failed_count += 1
+                continue
+            records.append((file_path, file_stat, metadata))
+            if metadata_cache is not None:
+                metadata_cache.put(file_path, file_stat, metadata)
+
+    if metadata_cache is not None:
+        metadata_cache.close()
+
+    records.sort(key=lambda record: record[0])
+    records = [(file_path, file_stat, metadata, resolve_date(metadata.tags, date_priority))
+               for file_path, file_stat, metadata in records]
+    write_inventory(inventory_file, records)
+
+    # 输出扫描结果统计
+    no_date_count = sum(1 for record in records if not record[3])
+    print(f"\n扫描完成！清单已保存到: {inventory_file}")
+    print(f"总文件数: {len(files)}")
+    print(f"有拍摄日期: {len(records) - no_date_count}")
+    print(f"无拍摄日期（将使用默认文本）: {no_date_count}")
+    print(f"读取失败: {failed_count}")
+
+
+def plan_watermarks(files, inventory, metadata_cache, default_text=None, date_priority=None, text_template=None):
+    """
+    规划阶段：从清单和缓存中获取元数据，确定这些图片的水印文本
+    不在这里打开图片，未命中的图片在处理时从已打开的文件句柄读取元数据，每张图片只打开一次
+    :param files: list_image_files()的返回值
+    :param inventory: load_inventory()的返回值
+    :param metadata_cache: 元数据缓存(MetadataCache)，为None时不使用缓存
+    :param default_text: 无EXIF信息时的默认文本
+    :param date_priority: 日期来源优先级列表
+    :param text_template: 编译后的水印文本模板(TextTemplate)，缓存中缺少模板引用的标签时视为未命中
+    :return: [(文件路径, 相对目录, stat结果, ImageMetadata, 水印文本)]，未命中的图片元数据和文本为None
+    """
+    extra_tags = text_template.tags if text_template is not None else ()
+    tasks = []
+    for file_path, rel_path, file_stat in files:
+        metadata = lookup_inventory(inventory, file_path, file_stat, extra_tags)
+        if metadata is None and metadata_cache is not None:
+            metadata = metadata_cache.get(file_path, file_stat, extra_tags)
+        text = None
+        if metadata is not None:
+            text = resolve_watermark_text(file_path, metadata.tags, default_text, date_priority, text_template)
+        tasks.append((file_path, rel_path, file_stat, metadata, text))
+    return tasks
+
+
+def prerender_placements(tasks, font_size=16, font_name=None, position='bottom-right', font_scale=None,
+                         rgba_color=None, style=None, tile_angle=TILE_ANGLE):
+    """
+    预先为每种(文字, 图片尺寸, 方向)组合渲染水印并计算位置，尺寸相同的一批图片共用同一项
+    Pillow的FreeType渲染不释放GIL，在主线程中逐个渲染，多进程处理时工作进程直接使用结果
+    :param tasks: plan_watermarks()的返回值
+    :param font_size: 字体大小
+    :param font_name: 字体文件路径或字体族名
+    :param position: 水印位置
+    :param font_scale: 字号占图片短边的比例，指定时按图片尺寸取字号档位
+    :param rgba_color: 水印颜色和透明度，只在有效果时用于渲染图章
+    :param style: 描边、阴影等水印效果(WatermarkStyle)
+    :param tile_angle: 平铺水印的旋转角度
+    :return: {(水印文本, 存储尺寸, 方向): (蒙版或效果图章, 坐标)}，平铺水印只包含旋转后的单元，不包含整幅蒙版
+    """
+    keys = {}
+    for file_path, rel_path, file_stat, metadata, text in tasks:
+        if text is not None:
+            image_size = (metadata.width, metadata.height)
+            orientation = normalize_orientation(metadata.tags.get('Orientation'))
+            size = scaled_font_size(font_scale, image_size) if font_scale else font_size
+            keys[text, image_size, orientation] = get_font(size, font_name)
+    # 不同分辨率的图片落在少数几个字号档位上，get_placement中的蒙版按(文字, 字体)缓存，只渲染一次
+    return {key: get_placement(key[0], font, position, key[1], key[2], rgba_color, style, tile_angle)
+            for key, font in keys.items()}
+
+
+def render_cache_stats():
+    """
+    读取本进程水印渲染缓存的统计（来自lru_cache的cache_info）
+    :return: (蒙版命中, 蒙版未命中, 位置命中, 位置未命中)，蒙版包括文字蒙版、效果贴图和平铺单元
+    """
+    masks = [get_text_mask.cache_info(), get_effect_stamp.cache_info(), get_tile.cache_info()]
+    placement = get_placement.cache_info()
+    return (sum(info.hits for info in masks), sum(info.misses for info in masks), placement.hits, placement.misses)
+
+
+def cache_stats_delta(after, before):
+    """
+    计算两次render_cache_stats()之间的差值
+    """
+    return tuple(a - b for a, b in zip(after, before))
+
+
+def process_job(job, placements=None, metadata_cache=None, **watermark_options):
+    """
+    处理规划好的一张图片；元数据未知时由add_watermark_to_image从同一个文件句柄读取，源文件只打开一次
+    :param job: (文件路径, 输出目录, stat结果, 元数据, 水印文本)
+    :param placements: 规划阶段预先计算的位置表
+    :param metadata_cache: 处理时读取到的元数据写入这里（MetadataCache或MetadataCollector）
+    :param watermark_options: 传给add_watermark_to_image的水印参数
+    :return: 是否成功
+    """
+    file_path, target_output_dir, file_stat, metadata, text = job
+    return add_watermark_to_image(file_path, target_output_dir, metadata=metadata, metadata_cache=metadata_cache,
+                                  file_stat=file_stat, watermark_text=text, placements=placements,
+                                  **watermark_options)
+
+
+# 工作进程中共用的位置表和水印参数，由_init_worker设置
+_worker_placements = {}
+_worker_options = {}
+
+
+def _init_worker(placements, watermark_options, fonts):
+    """
+    工作进程初始化，保存只读共用的预计算位置表（含预渲染蒙版）和水印参数，
+    并导入主进程已读入内存的字体，位置表未命中时也不再查找字体
+    """
+    global _worker_placements, _worker_options
+    _worker_placements = placements
+    _worker_options = watermark_options
+    import_fonts(fonts)
+
+
+def _watermark_worker(job):
+    """
+    在工作进程中处理一张图片
+    :param job: (文件路径, 输出目录, stat结果, 元数据, 水印文本)
+    :return: (是否成功, 处理时读取到的元数据[(路径, stat结果, ImageMetadata)], 本张图片的渲染缓存统计)，
+             元数据由主进程写入缓存
+    """
+    collector = MetadataCollector()
+    stats = render_cache_stats()
+    success = process_job(job, _worker_placements, collector, **_worker_options)
+    return success, collector.records, cache_stats_delta(render_cache_stats(), stats)
+
+
+def process_path(input_path, font_size=16, color='white', position='bottom-right', opacity=80, default_text=None,
+                 use_cache=True, cache_dir=None, inventory_file=None, date_priority=None,
+                 exif_software=None, exif_description=None, strip=None, font_name=None, jobs=1,
+                 font_scale=None, style=None, text_template=None, blend_engine='pillow',
+                 tile_angle=TILE_ANGLE):
     """
     处理输入路径（单个文件或目录）
+    先规划：读取所有图片的元数据，确定水印文本并预先渲染所有不同文字的蒙版；
+    再处理：每张图片只需解码、混合和编码
     :param input_path: 输入文件或目录路径
     :param font_size: 字体大小
     :param color: 字体颜色
     :param position: 水印位置
     :param opacity: 透明度
     :param default_text: 无EXIF信息时的默认文本
+    :param use_cache: 是否使用元数据缓存
+    :param cache_dir: 元数据缓存和字体索引目录，默认使用用户缓存目录
+    :param inventory_file: 预扫描生成的清单文件，提供时直接使用其中的元数据
+    :param date_priority: 日期来源优先级列表
+    :param exif_software: 写入输出图片EXIF Software标签的文本
+    :param exif_description: 写入输出图片EXIF ImageDescription标签的文本
+    :param strip: 要从输出图片EXIF中删除的分组（见STRIP_GROUPS）
+    :param font_name: 字体文件路径或字体族名，为None时使用默认字体
+    :param jobs: 处理图片的进程数
+    :param font_scale: 字号占图片短边的比例，指定时忽略font_size
+    :param style: 描边、阴影等水印效果(WatermarkStyle)，为None时为普通文字
+    :param text_template: 编译后的水印文本模板(TextTemplate)，为None时水印为拍摄日期
+    :param blend_engine: RGB图片的混合引擎（见BLEND_ENGINES）
+    :param tile_angle: 平铺水印（position为tile）的旋转角度
     """
     # 检查输入路径是否存在
     if not os.path.exists(input_path):
         print(f"错误: 路径 '{input_path}' 不存在")
         return
 
-    # 定义支持的图片格式
-    supported_formats = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.gif']
-
     # 创建输出目录
     if os.path.isdir(input_path):
         parent_dir = os.path.dirname(input_path) if os.path.dirname(input_path) else '.'
@@ -166,42 +626,170 @@ def process_path(input_path, font_size=16, color='white', position='bottom-right
         dir_name = os.path.basename(parent_dir)
         output_dir = os.path.join(parent_dir, f"{dir_name}_watermark")
 
-    # 处理文件或目录
-    success_count = 0
-    total_count = 0
+    # 读取预扫描清单
+    inventory = {}
+    if inventory_file:
+        try:
+            inventory = load_inventory(inventory_file)
+        except Exception as e:
+            print(f"警告: 无法读取清单文件{inventory_file}: {e}")
 
-    if os.path.isfile(input_path):
-        # 处理单个文件
-        file_ext = os.path.splitext(input_path)[1].lower()
-        if file_ext in supported_formats:
-            total_count = 1
-            if add_watermark_to_image(input_path, output_dir, font_size, color, position, opacity, default_text):
-                success_count = 1
-        else:
-            print(f"警告: 文件 '{input_path}' 不是支持的图片格式")
+    # 打开元数据缓存，失败时不使用缓存继续处理
+    metadata_cache = None
+    if use_cache:
+        try:
+            metadata_cache = MetadataCache(cache_dir)
+        except Exception as e:
+            print(f"警告: 无法打开元数据缓存，将不使用缓存: {e}")
+
+    # 按字体族名查找字体时，字体索引与元数据缓存保存在同一目录
+    set_font_cache_dir(cache_dir)
+
+    # 记录本次处理开始时的渲染缓存统计
+    start_stats = render_cache_stats()
+
+    # 规划阶段：确定每张图片的水印文本，预先渲染所有不同文字的蒙版并计算位置
+    files = list_image_files(input_path)
+    tasks = plan_watermarks(files, inventory, metadata_cache, default_text, date_priority, text_template)
+    try:
+        placements = prerender_placements(tasks, font_size, font_name, position, font_scale,
+                                          watermark_color(color, opacity), style, tile_angle)
+    except Exception as e:
+        # 预渲染失败时逐张渲染，出错的图片在处理时单独报告
+        print(f"警告: 预先渲染水印蒙版时出错，将逐张渲染: {e}")
+        placements = {}
+    if placements:
+        texts = set(key[0] for key in placements)
+        print(f"预先渲染水印蒙版: {len(texts)} 种文字，{len(placements)} 种位置，共 {len(tasks)} 张图片")
+
+    # 每张图片共用的水印参数
+    watermark_options = dict(font_size=font_size, color=color, position=position, opacity=opacity,
+                             default_text=default_text, date_priority=date_priority,
+                             exif_software=exif_software, exif_description=exif_description, strip=strip,
+                             font_name=font_name, font_scale=font_scale, style=style, text_template=text_template,
+                             blend_engine=blend_engine, tile_angle=tile_angle)
+
+    # 保持相对目录结构
+    jobs_list = [(file_path, os.path.join(output_dir, rel_path) if rel_path else output_dir, file_stat, metadata, text)
+                 for file_path, rel_path, file_stat, metadata, text in tasks]
+
+    # 处理图片
+    total_count = len(jobs_list)
+    success_count = 0
+    # 规划阶段未命中的图片在处理时读取元数据，处理完再写入缓存
+    collected = []
+    worker_stats = (0, 0, 0, 0)
+    if jobs and jobs > 1 and total_count > 1:
+        # 工作进程通过初始化参数共用预计算的位置表和字体数据，不再查找字体和渲染文字
+        with Pool(min(jobs, total_count), initializer=_init_worker,
+                  initargs=(placements, watermark_options, export_fonts())) as pool:
+            for success, records, stats in pool.imap(_watermark_worker, jobs_list,
+                                                     chunksize=max(1, total_count // (jobs * 8))):
+                if success:
+                    success_count += 1
+                collected.extend(records)
+                worker_stats = tuple(a + b for a, b in zip(worker_stats, stats))
     else:
-        # 处理目录中的所有图片
-        for root, dirs, files in os.walk(input_path):
-            for file in files:
-                file_ext = os.path.splitext(file)[1].lower()
-                if file_ext in supported_formats:
-                    total_count += 1
-                    file_path = os.path.join(root, file)
-                    # 保持相对目录结构
-                    rel_path = os.path.relpath(root, input_path)
-                    if rel_path == '.':
-                        target_output_dir = output_dir
-                    else:
-                        target_output_dir = os.path.join(output_dir, rel_path)
-                    
-                    if add_watermark_to_image(file_path, target_output_dir, font_size, color, position, opacity, default_text):
-                        success_count += 1
+        collector = MetadataCollector()
+        for job in jobs_list:
+            if process_job(job, placements, collector, **watermark_options):
+                success_count += 1
+        collected = collector.records
+
+    if metadata_cache is not None:
+        for file_path, file_stat, metadata in collected:
+            metadata_cache.put(file_path, file_stat, metadata)
+
+    if metadata_cache is not None:
+        metadata_cache.close()
 
     # 输出处理结果统计
     print(f"\n处理完成！")
     print(f"总文件数: {total_count}")
     print(f"成功处理: {success_count}")
     print(f"失败处理: {total_count - success_count}")
+    if metadata_cache is not None:
+        print(f"元数据缓存命中: {metadata_cache.hits}/{metadata_cache.hits + metadata_cache.misses}")
+    # 主进程（规划和单进程处理）与各工作进程的缓存统计之和；命中预渲染位置表的图片不查询缓存
+    mask_hits, mask_misses, placement_hits, placement_misses = (
+        a + b for a, b in zip(cache_stats_delta(render_cache_stats(), start_stats), worker_stats))
+    for label, hits, misses in (("水印蒙版", mask_hits, mask_misses), ("水印位置", placement_hits, placement_misses)):
+        if hits + misses:
+            print(f"{label}缓存命中: {hits}/{hits + misses} ({hits * 100 / (hits + misses):.1f}%)")
+
+
+def parse_text_template(value):
+    """
+    解析--text-template参数，模板只在这里编译一次
+    :param value: 模板字符串
+    :return: TextTemplate
+    """
+    try:
+        return compile_template(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_date_priority(value):
+    """
+    解析--date-priority参数
+    :param value: 逗号分隔的日期来源名称
+    :return: 日期来源列表
+    """
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in DATE_SOURCES]
+    if not names or unknown:
+        raise argparse.ArgumentTypeError(f"无效的日期来源: {', '.join(unknown) or value}（可选：{', '.join(DATE_SOURCES)}）")
+    return names
+
+
+def parse_font_scale(value):
+    """
+    解析--font-scale参数
+    :param value: 字号占图片短边的比例
+    :return: 比例(0-1)
+    """
+    try:
+        scale = float(value)
+    except ValueError:
+        scale = 0
+    if not 0 < scale <= 1:
+        raise argparse.ArgumentTypeError(f"无效的字号比例: {value}（应为0到1之间的小数，如0.03）")
+    return scale
+
+
+def parse_strip(value):
+    """
+    解析--strip参数
+    :param value: 逗号分隔的分组名称
+    :return: 分组名称列表
+    """
+    names = [name.strip().lower() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in STRIP_GROUPS]
+    if not names or unknown:
+        raise argparse.ArgumentTypeError(f"无效的删除项: {', '.join(unknown) or value}（可选：{', '.join(STRIP_GROUPS)}）")
+    return names
+
+
+def build_style(args):
+    """
+    根据命令行参数构造水印效果
+    :param args: 解析后的命令行参数
+    :return: WatermarkStyle，没有任何效果时返回None
+    """
+    stroke_width = max(args.stroke_width, 0)
+    if args.outline and not stroke_width:
+        stroke_width = 2
+    if not stroke_width and not args.shadow:
+        return None
+    # 空心字只有轮廓，默认使用文字颜色
+    stroke_color = args.stroke_color or (args.color if args.outline else 'black')
+    return WatermarkStyle(stroke_width=stroke_width,
+                          stroke_color=ImageColor.getrgb(stroke_color)[:3],
+                          outline=bool(args.outline and stroke_width),
+                          shadow_color=ImageColor.getrgb(args.shadow_color)[:3] if args.shadow else None,
+                          shadow_offset=(args.shadow_offset, args.shadow_offset),
+                          shadow_blur=max(args.shadow_blur, 0))
 
 
 def main():
@@ -212,12 +800,42 @@ def main():
     parser = argparse.ArgumentParser(description='图片水印命令行工具')
     parser.add_argument('--path', '-p', required=True, help='图片文件或目录的路径')
     parser.add_argument('--font-size', '-s', type=int, default=16, help='水印字体大小（默认：16）')
+    parser.add_argument('--font-scale', type=parse_font_scale,
+                        help='按图片短边的比例确定字号（如0.03），指定时忽略--font-size，字号会取整到固定档位')
+    parser.add_argument('--font', '-f', dest='font_name',
+                        help='水印字体，可以是字体文件路径或字体族名（如"Noto Sans CJK"，默认：自动选择中文字体）')
     parser.add_argument('--color', '-c', default='white', help='水印字体颜色（默认：白色）')
-    parser.add_argument('--position', '-pos', choices=['top-left', 'top-right', 'bottom-left', 'bottom-right', 'center'], 
-                        default='bottom-right', help='水印位置（默认：右下角）')
+    parser.add_argument('--position', '-pos',
+                        choices=['top-left', 'top-right', 'bottom-left', 'bottom-right', 'center', TILE_POSITION],
+                        default='bottom-right', help='水印位置，tile为斜向平铺整张图片（默认：右下角）')
+    parser.add_argument('--tile-angle', type=float, default=TILE_ANGLE,
+                        help=f'平铺水印的旋转角度（逆时针，度，默认：{TILE_ANGLE}）')
     parser.add_argument('--opacity', '-o', type=int, default=80, choices=range(0, 101), 
                         help='水印透明度（0-100，默认：80）')
     parser.add_argument('--default-text', '-d', help='无EXIF信息时的默认水印文本')
+    parser.add_argument('--text-template', '-t', type=parse_text_template,
+                        help='水印文本模板，如"{date:%%Y.%%m.%%d} · {Model} · f/{FNumber}"（默认：拍摄日期）')
+    parser.add_argument('--stroke-width', type=int, default=0, help='文字描边宽度（像素，默认：0，不描边）')
+    parser.add_argument('--stroke-color', help='描边颜色（默认：黑色，空心字时为字体颜色）')
+    parser.add_argument('--outline', action='store_true', help='空心字，只绘制文字轮廓（未指定描边宽度时为2）')
+    parser.add_argument('--shadow', action='store_true', help='为水印添加投影')
+    parser.add_argument('--shadow-color', default='black', help='投影颜色（默认：黑色）')
+    parser.add_argument('--shadow-offset', type=int, default=2, help='投影向右下方的偏移（像素，默认：2）')
+    parser.add_argument('--shadow-blur', type=float, default=3, help='投影的模糊半径（默认：3）')
+    parser.add_argument('--exif-software', help='写入输出图片EXIF Software标签的文本（默认：保留原值）')
+    parser.add_argument('--exif-description', help='写入输出图片EXIF ImageDescription标签的文本（默认：保留原值）')
+    parser.add_argument('--strip', type=parse_strip,
+                        help=f"从输出图片的EXIF中删除的数据，逗号分隔（可选：{', '.join(STRIP_GROUPS)}）")
+    parser.add_argument('--cache-dir', help='元数据缓存和字体索引目录（默认：用户缓存目录下的photo_watermark）')
+    parser.add_argument('--no-cache', action='store_true', help='不使用元数据缓存')
+    parser.add_argument('--date-priority', type=parse_date_priority, default=list(DATE_SOURCES),
+                        help=f"水印日期来源的优先级，逗号分隔（默认：{','.join(DATE_SOURCES)}）")
+    parser.add_argument('--scan', metavar='FILE', help='只预扫描元数据并写入清单文件（.csv或.jsonl），不添加水印')
+    parser.add_argument('--inventory', metavar='FILE', help='使用--scan生成的清单文件中的元数据')
+    parser.add_argument('--blend-engine', choices=BLEND_ENGINES, default='pillow',
+                        help='水印混合方式：pillow或numpy（NumPy向量化混合，结果相同，默认：pillow）')
+    parser.add_argument('--workers', type=int, help='--scan预扫描时读取元数据的线程数')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='处理图片的进程数（默认：1）')
     parser.add_argument('--version', '-v', action='store_true', help='显示版本信息')
 
     # 解析命令行参数
@@ -229,8 +847,31 @@ def main():
         print("根据PRD文档实现，支持读取EXIF信息并添加自定义水印")
         return
 
+    # 只执行预扫描
+    if args.scan:
+        scan_path(args.path, args.scan, args.workers, use_cache=not args.no_cache, cache_dir=args.cache_dir,
+                  date_priority=args.date_priority, text_template=args.text_template)
+        return
+
+    # 描边和投影效果
+    try:
+        style = build_style(args)
+    except ValueError as e:
+        print(f"错误: 无效的效果颜色: {e}")
+        return
+
+    if args.blend_engine == 'numpy' and watermark_render.np is None:
+        print("警告: 未安装NumPy，使用pillow混合引擎")
+        args.blend_engine = 'pillow'
+
     # 执行水印处理
-    process_path(args.path, args.font_size, args.color, args.position, args.opacity, args.default_text)
+    process_path(args.path, args.font_size, args.color, args.position, args.opacity, args.default_text,
+                 use_cache=not args.no_cache, cache_dir=args.cache_dir, inventory_file=args.inventory,
+                 date_priority=args.date_priority, exif_software=args.exif_software,
+                 exif_description=args.exif_description, strip=args.strip, font_name=args.font_name,
+                 jobs=args.jobs, font_scale=args.font_scale, style=style,
+                 text_template=args.text_template, blend_engine=args.blend_engine,
+                 tile_angle=args.tile_angle)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证exif_tools只读取文件头即可正确解析EXIF信息
+"""
+
+import os
+import csv
+import sys
+import json
+import shutil
+import sqlite3
+import struct
+import builtins
+from PIL import Image, PngImagePlugin
+
+import exif_tools
+import metadata_cache
+from metadata_cache import ImageMetadata, MetadataCache, load_inventory, lookup_inventory
+from photo_watermark import (add_watermark_to_image, format_date_part, format_exif_date, get_exif_date,
+                             list_image_files, parse_exif_date_slow, plan_watermarks, process_path, scan_path)
+
+
+TEST_DIR = "test_exif_tools"
+
+
+def create_jpeg_with_date(output_path, date_str, endian='>'):
+    """
+    创建一个带有DateTimeOriginal的JPEG测试图片
+    :param output_path: 输出图片路径
+    :param date_str: 拍摄日期字符串，格式为"YYYY:MM:DD HH:MM:SS"
+    :param endian: EXIF字节序（'<'或'>'）
+    """
+    img = Image.new('RGB', (320, 240), color='lightgray')
+    exif = img.getexif()
+    exif.endian = endian
+    exif[0x010F] = "TestCamera"  # Make
+    exif.get_ifd(exif_tools.TAG_EXIF_IFD)[exif_tools.TAG_DATETIME_ORIGINAL] = date_str
+    img.save(output_path, exif=exif.tobytes())
+    return output_path
+
+
+class CountingReader(object):
+    """
+    记录读取字节数的文件包装器
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.fp.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        return self.fp.seek(offset, whence)
+
+
+def check_jpeg_date():
+    """
+    检查两种字节序的JPEG都能读出拍摄日期
+    """
+    ok = True
+    for endian in ('<', '>'):
+        path = create_jpeg_with_date(os.path.join(TEST_DIR, f"date_{endian == '<'}.jpg"), "2023:10:15 14:30:25", endian)
+        result = get_exif_date(path)
+        print(f"字节序 {endian}: {result}")
+        ok = ok and result == '2023-10-15'
+    return ok
+
+
+def check_header_only():
+    """
+    检查读取日期时只读取了文件头部的少量数据
+    """
+    path = create_jpeg_with_date(os.path.join(TEST_DIR, "header_only.jpg"), "2022:01:02 03:04:05")
+    with open(path, 'rb') as fp:
+        reader = CountingReader(fp)
+        tiff, _ = exif_tools.read_metadata_block(reader)
+        tag = exif_tools.TAG_DATETIME_ORIGINAL
+        date_str = exif_tools.read_tiff_tags(tiff, {tag}).get(tag)
+    file_size = os.path.getsize(path)
+    print(f"读取 {reader.bytes_read} / {file_size} 字节, 结果: {date_str}")
+    return date_str == "2022:01:02 03:04:05" and reader.bytes_read < 4096
+
+
+def check_without_exif():
+    """
+    检查没有EXIF信息的图片返回None
+    """
+    path = os.path.join(TEST_DIR, "no_exif.jpg")
+    Image.new('RGB', (64, 64), color='white').save(path)
+    result = get_exif_date(path)
+    print(f"无EXIF图片: {result}")
+    return result is None
+
+
+def check_other_containers():
+    """
+    检查PNG、TIFF、WebP的EXIF以及PNG的XMP都能读出拍摄日期
+    """
+    img = Image.new('RGB', (120, 80), color='lightgray')
+    exif = img.getexif()
+    exif.get_ifd(exif_tools.TAG_EXIF_IFD)[exif_tools.TAG_DATETIME_ORIGINAL] = "2021:02:03 04:05:06"
+    paths = []
+    for ext in ('png', 'tiff', 'webp'):
+        path = os.path.join(TEST_DIR, f"container.{ext}")
+        img.save(path, exif=exif.tobytes())
+        paths.append(path)
+
+    # 只有XMP的PNG
+    xmp = '<x:xmpmeta><rdf:Description exif:DateTimeOriginal="2021-02-03T04:05:06+08:00"/></x:xmpmeta>'
+    png_info = PngImagePlugin.PngInfo()
+    png_info.add_itxt('XML:com.adobe.xmp', xmp, zip=True)
+    path = os.path.join(TEST_DIR, "xmp_only.png")
+    img.save(path, pnginfo=png_info)
+    paths.append(path)
+
+    ok = True
+    for path in paths:
+        result = get_exif_date(path)
+        print(f"{os.path.basename(path)}: {result}")
+        ok = ok and result == '2021-02-03'
+    return ok
+
+
+def check_date_priority():
+    """
+    检查没有DateTimeOriginal时按优先级回退到其他日期字段
+    """
+    img = Image.new('RGB', (120, 80), color='lightgray')
+    exif = img.getexif()
+    exif[exif_tools.TAG_DATETIME] = "2020:01:01 00:00:00"
+    exif.get_ifd(exif_tools.TAG_EXIF_IFD)[exif_tools.TAG_DATETIME_DIGITIZED] = "2019:03:04 05:06:07"
+    exif.get_ifd(exif_tools.TAG_EXIF_IFD)[exif_tools.TAG_OFFSET_TIME_ORIGINAL] = "+08:00"
+    path = os.path.join(TEST_DIR, "fallback.jpg")
+    img.save(path, exif=exif.tobytes())
+
+    with open(path, 'rb') as fp:
+        tags = exif_tools.read_file_tags(fp)
+    default_order = get_exif_date(path)
+    datetime_first = get_exif_date(path, ['DateTime', 'DateTimeDigitized'])
+    print(f"读取的字段: {tags}")
+    print(f"默认优先级: {default_order}, DateTime优先: {datetime_first}")
+    return (default_order == '2019-03-04' and datetime_first == '2020-01-01'
+            and tags.get('OffsetTimeOriginal') == '+08:00')
+
+
+def check_format_exif_date():
+    """
+    检查日期格式化的快速路径与strptime解析的结果一致
+    """
+    cases = [
+        # 标准格式和只有日期
+        ("2023:10:15 12:34:56", "2023-10-15"),
+        ("2023:10:15", "2023-10-15"),
+        ("1000:01:01 00:00:00", "1000-01-01"),
+        # 29日之后由strptime判断月份和闰年
+        ("2024:02:29 00:00:00", "2024-02-29"),
+        ("2023:02:29 00:00:00", None),
+        ("2023:04:31 00:00:00", None),
+        ("2023:12:31 23:59:59", "2023-12-31"),
+        # 亚秒和时区后缀
+        ("2023:10:15 12:34:56.789", "2023-10-15"),
+        ("2023:10:15 12:34:56+08:00", "2023-10-15"),
+        ("2023:10:15 12:34:56 Z", "2023-10-15"),
+        # 时间无效时只按日期解析
+        ("2023:10:15 25:61:99", "2023-10-15"),
+        ("2023:02:30 12:00:00", None),
+        # 未知日期；4位以下的年份strptime按原值输出，快速路径不处理
+        ("0000:00:00 00:00:00", None),
+        ("    :  :     :  :  ", None),
+        ("0999:01:01 00:00:00", "999-01-01"),
+        ("2023:00:10 00:00:00", None),
+        ("2023:13:10 00:00:00", None),
+        ("2023:10:00 00:00:00", None),
+        # 过短、分隔符不同和非数字；一位数的月和日由strptime补零
+        ("2023:10:1", "2023-10-01"),
+        ("2023", None),
+        ("2023-10-15 12:34:56", None),
+        ("2023:10:15T12:34:56", None),
+        ("2023:1:5 1:2:3", "2023-01-05"),
+        ("2023:10:15\x00", None),
+        ("20x3:10:15 00:00:00", None),
+        ("２０２３:10:15 00:00:00", "2023-10-15"),
+        ("²023:10:15 00:00:00", None),
+        ("", None),
+    ]
+    format_date_part.cache_clear()
+    ok = True
+    for date_str, expected in cases:
+        slow = parse_exif_date_slow(date_str) if date_str else None
+        try:
+            fast = format_exif_date(date_str)
+        except ValueError as e:
+            fast = f"异常: {e}"
+        if fast != expected or slow != expected:
+            print(f"{date_str!r}: 快速路径 {fast}, strptime {slow}, 期望 {expected}")
+            ok = False
+    # 逐日比较闰年和平年的每个日期
+    for year in (2023, 2024):
+        for month in range(1, 13):
+            for day in range(1, 32):
+                date_str = f"{year}:{month:02d}:{day:02d} 08:00:00"
+                if format_exif_date(date_str) != parse_exif_date_slow(date_str):
+                    print(f"{date_str}: 不一致")
+                    ok = False
+    # 缓存按日期部分，同一天不同时间的照片命中同一项
+    format_date_part.cache_clear()
+    same_day = [format_exif_date(f"2023:10:15 12:{minute:02d}:00") for minute in range(10)]
+    info = format_date_part.cache_info()
+    print(f"测试用例: {len(cases)} 个，逐日比较: 2 年，同一天10个时间的缓存统计: {info}")
+    return ok and same_day == ["2023-10-15"] * 10 and info.misses == 1 and info.hits == 9
+
+
+def check_mistyped_tags():
+    """
+    检查类型错误的日期和方向字段（如UNDEFINED类型的DateTime）被解码或丢弃，元数据可以写入缓存和清单
+    """
+    # Pillow会按标准类型写入已知标签，这里直接构造TIFF数据：
+    # DateTime为UNDEFINED(7)类型，Orientation为ASCII(2)类型，DateTimeDigitized为非ASCII的UNDEFINED
+    date = b"2020:05:06 07:08:09\x00"
+    entries = [(exif_tools.TAG_ORIENTATION, 2, 2, b"6\x00\x00\x00"),
+               (exif_tools.TAG_DATETIME, 7, len(date), struct.pack('<I', 8 + 2 + 3 * 12 + 4)),
+               (exif_tools.TAG_DATETIME_DIGITIZED, 7, 2, b"\xff\xfe\x00\x00")]
+    tiff = b'II*\x00' + struct.pack('<I', 8) + struct.pack('<H', len(entries))
+    tiff += b''.join(struct.pack('<HHI', tag, typ, count) + value for tag, typ, count, value in entries)
+    tiff += struct.pack('<I', 0) + date
+    input_dir = os.path.join(TEST_DIR, "mistyped")
+    os.makedirs(input_dir, exist_ok=True)
+    path = os.path.join(input_dir, "mistyped.jpg")
+    Image.new('RGB', (120, 80), color='lightgray').save(path, exif=exif_tools.EXIF_HEADER + tiff)
+
+    with open(path, 'rb') as fp:
+        tags = exif_tools.read_file_tags(fp)
+    print(f"读取的字段: {tags}")
+    cache_dir = os.path.join(TEST_DIR, "mistyped_cache")
+    inventory_file = os.path.join(TEST_DIR, "mistyped.jsonl")
+    try:
+        # 处理时读取的元数据写入缓存，再次规划时从缓存中得到水印文本
+        process_path(input_dir, cache_dir=cache_dir)
+        scan_path(input_dir, inventory_file, use_cache=False)
+    except TypeError as e:
+        print(f"写入元数据出错: {e}")
+        return False
+    cache = MetadataCache(cache_dir)
+    try:
+        tasks = plan_watermarks(list_image_files(input_dir), {}, cache)
+    finally:
+        cache.close()
+    written = load_inventory(inventory_file)
+    print(f"水印文本: {tasks[0][4]}, 清单: {len(written)} 项")
+    return (tags.get('DateTime') == "2020:05:06 07:08:09" and 'Orientation' not in tags
+            and 'DateTimeDigitized' not in tags and tasks[0][4] == '2020-05-06' and len(written) == 1)
+
+
+def check_single_open():
+    """
+    检查添加水印时源图片只被打开一次
+    """
+    path = create_jpeg_with_date(os.path.join(TEST_DIR, "single_open.jpg"), "2021:02:03 04:05:06")
+    opened = []
+    original_open = builtins.open
+
+    def counting_open(file, *args, **kwargs):
+        opened.append(file)
+        return original_open(file, *args, **kwargs)
+
+    builtins.open = counting_open
+    try:
+        success = add_watermark_to_image(path, os.path.join(TEST_DIR, "single_open_watermark"))
+    finally:
+        builtins.open = original_open
+    source_opens = opened.count(path)
+    print(f"源图片打开次数: {source_opens}")
+    return success and source_opens == 1
+
+
+def check_single_open_batch():
+    """
+    检查批量处理时每张源图片只被打开一次：不使用缓存、缓存为空和缓存已命中三种情况
+    """
+    input_dir = os.path.join(TEST_DIR, "open_count")
+    os.makedirs(input_dir, exist_ok=True)
+    paths = [create_jpeg_with_date(os.path.join(input_dir, f"{i}.jpg"), f"2021:02:0{i + 1} 04:05:06") for i in range(3)]
+    cache_dir = os.path.join(TEST_DIR, "open_count_cache")
+    opened = []
+    original_open = builtins.open
+
+    def counting_open(file, *args, **kwargs):
+        opened.append(file)
+        return original_open(file, *args, **kwargs)
+
+    counts = {}
+    for name, use_cache in (('不使用缓存', False), ('缓存为空', True), ('缓存已命中', True)):
+        del opened[:]
+        builtins.open = counting_open
+        try:
+            process_path(input_dir, use_cache=use_cache, cache_dir=cache_dir)
+        finally:
+            builtins.open = original_open
+        counts[name] = [opened.count(path) for path in paths]
+    print(f"各图片打开次数: {counts}")
+    return all(count == [1, 1, 1] for count in counts.values())
+
+
+def check_metadata_cache():
+    """
+    检查元数据缓存在文件大小或修改时间变化时失效，旧版本表结构和损坏的缓存文件会被重建
+    """
+    cache_dir = os.path.join(TEST_DIR, "metadata_cache")
+    path = create_jpeg_with_date(os.path.join(TEST_DIR, "cached.jpg"), "2022:03:04 05:06:07")
+    metadata = ImageMetadata({'DateTimeOriginal': "2022:03:04 05:06:07"}, 320, 240, 'RGB', 'JPEG')
+
+    def lookup(cache):
+        return cache.get(path, os.stat(path)) is not None
+
+    cache = MetadataCache(cache_dir)
+    cache.put(path, os.stat(path), metadata)
+    cache.close()
+    cache = MetadataCache(cache_dir)
+    results = {'重新打开': lookup(cache)}
+    # 只改修改时间
+    file_stat = os.stat(path)
+    os.utime(path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + 1000000000))
+    results['修改时间变化'] = lookup(cache)
+    cache.put(path, os.stat(path), metadata)
+    results['重新写入'] = lookup(cache)
+    # 重写文件并恢复原来的修改时间，只有大小变化
+    file_stat = os.stat(path)
+    create_jpeg_with_date(path, "2022:03:04 05:06:07 ")
+    os.utime(path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+    results['重写文件'] = lookup(cache) or os.stat(path).st_size == file_stat.st_size
+    cache.close()
+
+    # 旧版本的表结构：列不同，user_version较小
+    old_dir = os.path.join(TEST_DIR, "metadata_cache_old")
+    os.makedirs(old_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(old_dir, metadata_cache.CACHE_FILE_NAME))
+    conn.execute('CREATE TABLE metadata (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, date TEXT)')
+    file_stat = os.stat(path)
+    conn.execute('INSERT INTO metadata VALUES (?, ?, ?, ?)',
+                 (os.path.abspath(path), file_stat.st_size, file_stat.st_mtime_ns, "2022:03:04 05:06:07"))
+    conn.execute(f'PRAGMA user_version = {metadata_cache.SCHEMA_VERSION - 1}')
+    conn.commit()
+    conn.close()
+
+    # 不是SQLite数据库的缓存文件
+    corrupt_dir = os.path.join(TEST_DIR, "metadata_cache_corrupt")
+    os.makedirs(corrupt_dir, exist_ok=True)
+    with open(os.path.join(corrupt_dir, metadata_cache.CACHE_FILE_NAME), 'wb') as f:
+        f.write(b'SQLite format 3\x00' + b'\xff' * 4080)
+
+    for name, directory in (('旧表结构', old_dir), ('损坏的文件', corrupt_dir)):
+        cache = MetadataCache(directory)
+        results[name] = lookup(cache)
+        cache.put(path, os.stat(path), metadata)
+        results[name + '重建后'] = lookup(cache)
+        cache.close()
+
+    print(f"缓存命中: {results}")
+    return results == {'重新打开': True, '修改时间变化': False, '重新写入': True, '重写文件': False,
+                       '旧表结构': False, '旧表结构重建后': True, '损坏的文件': False, '损坏的文件重建后': True}
+
+
+def check_inventory_round_trip():
+    """
+    检查CSV和JSONL清单写入后读回的元数据一致，包括没有拍摄日期的图片、非ASCII路径和已修改的图片
+    """
+    input_dir = os.path.join(TEST_DIR, "inventory", "相册 été")
+    os.makedirs(input_dir, exist_ok=True)
+    dated = create_jpeg_with_date(os.path.join(input_dir, "照片_1.jpg"), "2020:01:02 03:04:05")
+    stale = create_jpeg_with_date(os.path.join(input_dir, "stale.jpg"), "2019:12:31 23:59:59")
+    undated = os.path.join(input_dir, "no_date.png")
+    Image.new('L', (64, 48), color=128).save(undated)
+
+    inventories = {}
+    dates = {}
+    for ext in ('.csv', '.jsonl'):
+        inventory_file = os.path.join(TEST_DIR, "inventory", "清单" + ext)
+        scan_path(input_dir, inventory_file, use_cache=False)
+        inventories[ext] = load_inventory(inventory_file)
+        with open(inventory_file, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f)) if ext == '.csv' else [json.loads(line) for line in f]
+        dates[ext] = {os.path.basename(row['path']): row['date'] for row in rows}
+    print(f"清单中的日期: {dates}")
+
+    # 两种格式读回的元数据相同，且与直接读取的一致
+    csv_inventory, jsonl_inventory = inventories['.csv'], inventories['.jsonl']
+    same = csv_inventory == jsonl_inventory and sorted(csv_inventory) == sorted(
+        os.path.abspath(path) for path in (dated, stale, undated))
+    entry = csv_inventory.get(os.path.abspath(dated))
+    fields_ok = (entry is not None and entry[2].tags.get('DateTimeOriginal') == "2020:01:02 03:04:05"
+                 and entry[2][1:] == (320, 240, 'RGB', 'JPEG')
+                 and csv_inventory[os.path.abspath(undated)][2][1:] == (64, 48, 'L', 'PNG'))
+    # 没有拍摄日期时CSV中为空字符串，JSONL中为null
+    dates_ok = (dates['.csv'] == {"照片_1.jpg": "2020-01-02", "stale.jpg": "2019-12-31", "no_date.png": ""}
+                and dates['.jsonl'] == {"照片_1.jpg": "2020-01-02", "stale.jpg": "2019-12-31", "no_date.png": None})
+
+    # 扫描后修改的图片不再使用清单中的记录
+    file_stat = os.stat(stale)
+    create_jpeg_with_date(stale, "2018:06:07 08:09:10")
+    os.utime(stale, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + 1000000000))
+    lookups = {os.path.basename(path): lookup_inventory(jsonl_inventory, path, os.stat(path)) is not None
+               for path in (dated, stale, undated)}
+    print(f"清单命中: {lookups}")
+    return (same and fields_ok and dates_ok
+            and lookups == {"照片_1.jpg": True, "stale.jpg": False, "no_date.png": True})
+
+
+def check_metadata_passthrough():
+    """
+    检查输出图片保留原图的EXIF（含MakerNote）和ICC配置文件，并能改写Software标签
+    """
+    img = Image.new('RGB', (160, 120), color='lightgray')
+    exif = img.getexif()
+    exif[0x010F] = "TestCamera"  # Make
+    exif[exif_tools.TAG_SOFTWARE] = "Firmware 1.0"
+    exif_ifd = exif.get_ifd(exif_tools.TAG_EXIF_IFD)
+    exif_ifd[exif_tools.TAG_DATETIME_ORIGINAL] = "2021:02:03 04:05:06"
+    exif_ifd[0x927C] = b'MakerNote' * 100  # MakerNote
+    icc_profile = b'\x00' * 128 + b'fake icc profile'
+
+    ok = True
+    for ext in ('jpg', 'png', 'webp'):
+        path = os.path.join(TEST_DIR, f"passthrough.{ext}")
+        img.save(path, exif=exif.tobytes(), icc_profile=icc_profile)
+        output_dir = os.path.join(TEST_DIR, "passthrough_watermark")
+        if not add_watermark_to_image(path, output_dir, exif_software="PhotoWatermark"):
+            return False
+        with Image.open(os.path.join(output_dir, os.path.basename(path))) as result:
+            result_exif = result.getexif()
+            result_ifd = result_exif.get_ifd(exif_tools.TAG_EXIF_IFD)
+            kept = (result_exif.get(0x010F) == "TestCamera"
+                    and result_exif.get(exif_tools.TAG_SOFTWARE) == "PhotoWatermark"
+                    and result_ifd.get(exif_tools.TAG_DATETIME_ORIGINAL) == "2021:02:03 04:05:06"
+                    and result_ifd.get(0x927C) == b'MakerNote' * 100
+                    and result.info.get('icc_profile') == icc_profile)
+        print(f"{ext}: {'保留' if kept else '丢失'}")
+        ok = ok and kept
+    return ok
+
+
+def check_strip():
+    """
+    检查--strip在字节层面删除GPS和MakerNote后，其余EXIF标签仍可正常读取
+    """
+    img = Image.new('RGB', (160, 120), color='lightgray')
+    ok = True
+    for endian in ('<', '>'):
+        exif = img.getexif()
+        exif.endian = endian
+        exif[0x010F] = "TestCamera"  # Make
+        exif[exif_tools.TAG_ORIENTATION] = 6
+        exif_ifd = exif.get_ifd(exif_tools.TAG_EXIF_IFD)
+        exif_ifd[exif_tools.TAG_DATETIME_ORIGINAL] = "2021:02:03 04:05:06"
+        exif_ifd[exif_tools.TAG_MAKER_NOTE] = b'MakerNote' * 4000
+        exif.get_ifd(exif_tools.TAG_GPS_IFD)[1] = "N"  # GPSLatitudeRef
+        tiff = exif_tools.strip_exif_header(exif.tobytes())
+
+        # 只删除GPS时MakerNote应原样保留
+        gps_only = exif_tools.strip_exif_tags(tiff, ['gps'])
+        stripped = exif_tools.strip_exif_tags(tiff, ['gps', 'makernote'])
+        for data, has_maker_note in ((gps_only, True), (stripped, False)):
+            result = Image.Exif()
+            result.load(exif_tools.EXIF_HEADER + data)
+            result_ifd = result.get_ifd(exif_tools.TAG_EXIF_IFD)
+            kept = (result.get(0x010F) == "TestCamera"
+                    and result.get(exif_tools.TAG_ORIENTATION) == 6
+                    and result_ifd.get(exif_tools.TAG_DATETIME_ORIGINAL) == "2021:02:03 04:05:06"
+                    and exif_tools.TAG_GPS_IFD not in result
+                    and (result_ifd.get(exif_tools.TAG_MAKER_NOTE) == b'MakerNote' * 4000) == has_maker_note)
+            ok = ok and kept
+        print(f"字节序 {endian}: 原始 {len(tiff)} 字节, 删除GPS {len(gps_only)} 字节, "
+              f"删除GPS和MakerNote {len(stripped)} 字节")
+
+        path = os.path.join(TEST_DIR, f"strip_{endian == '<'}.jpg")
+        img.save(path, exif=exif.tobytes())
+        output_dir = os.path.join(TEST_DIR, "strip_watermark")
+        if not add_watermark_to_image(path, output_dir, strip=['gps', 'makernote']):
+            return False
+        output_path = os.path.join(output_dir, os.path.basename(path))
+        ok = (ok and get_exif_date(output_path) == '2021-02-03'
+              and os.path.getsize(output_path) < os.path.getsize(path) - 30000)
+    return ok
+
+
+def main():
+    """
+    主函数
+    """
+    print("===== 测试：EXIF文件头读取 =====")
+    if os.path.exists(TEST_DIR):
+        shutil.rmtree(TEST_DIR)
+    os.makedirs(TEST_DIR, exist_ok=True)
+
+    checks = [check_jpeg_date, check_header_only, check_without_exif, check_other_containers, check_date_priority,
+              check_format_exif_date, check_mistyped_tags, check_single_open, check_single_open_batch,
+              check_metadata_cache, check_inventory_round_trip, check_metadata_passthrough, check_strip]
+    failed = 0
+    for check in checks:
+        print(f"\n--- {check.__doc__.strip()} ---")
+        if check():
+            print("通过")
+        else:
+            print("失败")
+            failed += 1
+
+    print(f"\n===== 测试总结 =====")
+    print(f"总测试数: {len(checks)}")
+    print(f"失败测试: {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证字体索引的扫描、查找和缓存
+"""
+
+import os
+import sys
+import time
+import shutil
+import struct
+
+import font_index
+import font_manager
+
+
+TEST_DIR = "test_font_index"
+
+
+def build_name_table(family, style):
+    """
+    构造只包含族名和样式名的name表（Windows平台，英文）
+    """
+    strings = [family.encode('utf-16-be'), style.encode('utf-16-be')]
+    records = b''
+    offset = 0
+    for name_id, raw in ((1, strings[0]), (2, strings[1])):
+        records += struct.pack('>6H', 3, 1, 0x409, name_id, len(raw), offset)
+        offset += len(raw)
+    header = struct.pack('>3H', 0, 2, 6 + len(records))
+    return header + records + b''.join(strings)
+
+
+def build_cmap_table(codepoints):
+    """
+    构造格式4的cmap表，每个字符单独一段，映射到连续的字形编号
+    """
+    codepoints = sorted(codepoints) + [0xFFFF]
+    seg_count = len(codepoints)
+    ends = b''.join(struct.pack('>H', cp) for cp in codepoints)
+    starts = b''.join(struct.pack('>H', cp) for cp in codepoints)
+    deltas = b''.join(struct.pack('>h', ((i + 1 - cp) + 0x8000) % 0x10000 - 0x8000) for i, cp in enumerate(codepoints))
+    range_offsets = b'\x00\x00' * seg_count
+    body = struct.pack('>4H', seg_count * 2, 0, 0, 0) + ends + b'\x00\x00' + starts + deltas + range_offsets
+    subtable = struct.pack('>3H', 4, 6 + len(body), 0) + body
+    return struct.pack('>2H', 0, 1) + struct.pack('>HHI', 3, 1, 12) + subtable
+
+
+def build_font(family, style, codepoints, base=0):
+    """
+    构造只包含name和cmap表的最小字体数据
+    :param base: 字体数据在文件中的起始偏移（TTC中表偏移相对文件开头）
+    """
+    tables = [(b'cmap', build_cmap_table(codepoints)), (b'name', build_name_table(family, style))]
+    offset = base + 12 + 16 * len(tables)
+    directory = b''
+    data = b''
+    for tag, table in tables:
+        directory += struct.pack('>4sIII', tag, 0, offset + len(data), len(table))
+        data += table + b'\x00' * (-len(table) % 4)
+    return struct.pack('>IHHHH', 0x00010000, len(tables), 0, 0, 0) + directory + data
+
+
+def build_collection(faces):
+    """
+    构造包含多个字体的TTC数据
+    :param faces: [(族名, 样式, 字符码位列表), ...]
+    """
+    header_size = 12 + 4 * len(faces)
+    offsets = []
+    data = b''
+    for family, style, codepoints in faces:
+        offsets.append(header_size + len(data))
+        data += build_font(family, style, codepoints, header_size + len(data))
+    return b'ttcf' + struct.pack('>HHI', 1, 0, len(faces)) + struct.pack(f'>{len(faces)}I', *offsets) + data
+
+
+def write_file(path, data):
+    """
+    写入测试字体文件
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def create_font_dir():
+    """
+    创建测试用字体目录：一个中日韩字体集和两个只含拉丁字符的字体
+    """
+    font_dir = os.path.join(TEST_DIR, "fonts")
+    latin = [ord(c) for c in "0123456789-: "]
+    cjk = latin + list(font_index.CJK_SAMPLE)
+    write_file(os.path.join(font_dir, "noto", "NotoSansCJK-Regular.ttc"), build_collection([
+        ("Noto Sans CJK JP", "Regular", cjk),
+        ("Noto Sans CJK SC", "Regular", cjk),
+    ]))
+    write_file(os.path.join(font_dir, "latin", "Example-Bold.ttf"), build_font("Example Sans", "Bold", latin))
+    write_file(os.path.join(font_dir, "latin", "Example-Regular.ttf"), build_font("Example Sans", "Regular", latin))
+    return font_dir
+
+
+def check_read_faces():
+    """
+    检查能读出TTC中每个字体的族名、索引和中文支持情况
+    """
+    font_dir = create_font_dir()
+    faces = font_index.read_font_faces(os.path.join(font_dir, "noto", "NotoSansCJK-Regular.ttc"))
+    latin = font_index.read_font_faces(os.path.join(font_dir, "latin", "Example-Regular.ttf"))
+    for face in faces + latin:
+        print(f"{face['family']} ({face['style']}) 索引 {face['index']} 中文 {face['cjk']}")
+    return ([(face['family'], face['index'], face['cjk']) for face in faces]
+            == [("Noto Sans CJK JP", 0, True), ("Noto Sans CJK SC", 1, True)]
+            and latin[0]['family'] == "Example Sans" and not latin[0]['cjk'])
+
+
+def check_lookup():
+    """
+    检查按完整族名、前缀和不同大小写都能查到字体，同名时优先常规字重
+    """
+    index = font_index.build_font_index([create_font_dir()])
+
+    def lookup(name):
+        i = index['lookup'].get(font_index.normalize_font_name(name))
+        return index['fonts'][i] if i is not None else None
+
+    sc = lookup("Noto Sans CJK SC")
+    prefix = lookup("noto-sans-cjk")
+    example = lookup("EXAMPLE SANS")
+    default = index['fonts'][index['default_cjk']]
+    print(f"Noto Sans CJK SC -> 索引 {sc['index']}, noto-sans-cjk -> {prefix['family']}, "
+          f"EXAMPLE SANS -> {example['style']}, 默认中文字体 -> {default['family']}")
+    return (sc['index'] == 1 and prefix['cjk'] and example['style'] == "Regular"
+            and default['cjk'] and lookup("Missing Font") is None)
+
+
+def check_index_cache():
+    """
+    检查字体目录未变化时复用索引文件，新增字体后重新扫描
+    """
+    font_dir = create_font_dir()
+    cache_dir = os.path.join(TEST_DIR, "cache")
+    original_dirs = font_index.font_dirs
+    original_build = font_index.build_font_index
+    builds = []
+
+    def counting_build(dirs=None):
+        builds.append(dirs)
+        return original_build(dirs)
+
+    font_index.font_dirs = lambda: [font_dir]
+    font_index.build_font_index = counting_build
+    try:
+        font_index.load_font_index(cache_dir)
+        font_index.load_font_index.cache_clear()
+        font_index.load_font_index(cache_dir)
+        reused = len(builds) == 1
+
+        # 等待一段时间，保证目录修改时间一定不同
+        time.sleep(0.05)
+        write_file(os.path.join(font_dir, "latin", "Other-Regular.ttf"), build_font("Other Sans", "Regular", [0x41]))
+        font_index.load_font_index.cache_clear()
+        found = font_index.find_font("Other Sans", cache_dir)
+        rebuilt = len(builds) == 2 and found is not None
+    finally:
+        font_index.font_dirs = original_dirs
+        font_index.build_font_index = original_build
+        font_index.load_font_index.cache_clear()
+    print(f"扫描次数: {len(builds)}")
+    return reused and rebuilt
+
+
+def check_font_cache_dir():
+    """
+    检查按字体族名解析--font时，字体索引保存在指定的缓存目录中
+    """
+    font_dir = create_font_dir()
+    cache_dir = os.path.join(TEST_DIR, "font_cache")
+    original_dirs = font_index.font_dirs
+    font_index.font_dirs = lambda: [font_dir]
+    font_index.load_font_index.cache_clear()
+    font_manager.set_font_cache_dir(cache_dir)
+    try:
+        # 测试字体只有name和cmap表，不能加载，解析后回退到默认字体
+        font_manager.resolve_font("Example Sans")
+    finally:
+        font_manager.set_font_cache_dir(None)
+        font_manager._resolved_fonts.pop("Example Sans", None)
+        font_index.font_dirs = original_dirs
+        font_index.load_font_index.cache_clear()
+    index_file = os.path.join(cache_dir, font_index.INDEX_FILE_NAME)
+    print(f"字体索引: {index_file} 存在 {os.path.exists(index_file)}")
+    return os.path.exists(index_file)
+
+
+def main():
+    """
+    主函数
+    """
+    print("===== 测试：字体索引 =====")
+    if os.path.exists(TEST_DIR):
+        shutil.rmtree(TEST_DIR)
+    os.makedirs(TEST_DIR, exist_ok=True)
+
+    checks = [check_read_faces, check_lookup, check_index_cache, check_font_cache_dir]
+    failed = 0
+    for check in checks:
+        print(f"\n--- {check.__doc__.strip()} ---")
+        if check():
+            print("通过")
+        else:
+            print("失败")
+            failed += 1
+
+    print(f"\n===== 测试总结 =====")
+    print(f"总测试数: {len(checks)}")
+    print(f"失败测试: {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
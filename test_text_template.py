@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证水印文本模板的编译、EXIF字段读取和元数据缓存
+"""
+
+import os
+import sys
+import shutil
+from PIL import Image
+
+import exif_tools
+from metadata_cache import MetadataCache
+from photo_watermark import list_image_files, plan_watermarks, process_path
+from text_template import compile_template
+
+
+TEST_DIR = "test_text_template"
+
+TEMPLATE = "{date:%Y.%m.%d} · {Model} · f/{FNumber} {ExposureTime}s ISO{ISO}"
+
+
+def create_photo(output_path, date_str="2023:10:15 14:30:25", model="TestCamera X1"):
+    """
+    创建带有拍摄参数的JPEG测试图片
+    :param output_path: 输出图片路径
+    :param date_str: 拍摄日期字符串，格式为"YYYY:MM:DD HH:MM:SS"
+    :param model: 相机型号，为None时不写入
+    """
+    img = Image.new('RGB', (160, 120), color='lightgray')
+    exif = img.getexif()
+    if model:
+        exif[exif_tools.TEMPLATE_TAGS['Model']] = model
+    exif_ifd = exif.get_ifd(exif_tools.TAG_EXIF_IFD)
+    exif_ifd[exif_tools.TAG_DATETIME_ORIGINAL] = date_str
+    exif_ifd[exif_tools.TEMPLATE_TAGS['FNumber']] = 2.8
+    exif_ifd[exif_tools.TEMPLATE_TAGS['ExposureTime']] = 1 / 250
+    exif_ifd[exif_tools.TEMPLATE_TAGS['ISO']] = 400
+    img.save(output_path, exif=exif.tobytes())
+    return output_path
+
+
+def check_compile():
+    """
+    检查模板编译后只声明需要额外读取的标签，无效模板会报错
+    """
+    template = compile_template(TEMPLATE)
+    print(f"需要读取的标签: {template.tags}")
+    ok = template.tags == ('ExposureTime', 'FNumber', 'ISO', 'Model') and template.uses_date
+    for invalid in ("{Unknown}", "{date", "{Model.upper}", "{}"):
+        try:
+            compile_template(invalid)
+            ok = False
+        except ValueError as e:
+            print(f"{invalid}: {e}")
+    return ok
+
+
+def check_render():
+    """
+    检查模板按EXIF字段生成水印文本，缺少的字段输出为空
+    """
+    template = compile_template(TEMPLATE)
+    path = create_photo(os.path.join(TEST_DIR, "render.jpg"))
+    with open(path, 'rb') as fp:
+        tags = exif_tools.read_file_tags(fp, template.tags)
+    text = template.render(tags, '2023-10-15')
+    missing = compile_template("{Model}/{LensModel}").render({'Model': 'X1', 'LensModel': None}, None)
+    print(f"读取的字段: {tags}")
+    print(f"水印文本: {text}, 缺少字段: {missing}")
+    return text == "2023.10.15 · TestCamera X1 · f/2.8 1/250s ISO400" and missing == "X1/"
+
+
+def check_cache_fields():
+    """
+    检查缓存中没有模板需要的标签时视为未命中，处理时重新读取后再次规划可以命中
+    """
+    input_dir = os.path.join(TEST_DIR, "photos")
+    os.makedirs(input_dir, exist_ok=True)
+    create_photo(os.path.join(input_dir, "a.jpg"))
+    create_photo(os.path.join(input_dir, "b.jpg"), "2023:10:16 08:00:00", model=None)
+    files = list_image_files(input_dir)
+    template = compile_template("{date} {Model}")
+    cache_dir = os.path.join(TEST_DIR, "cache")
+
+    def plan(text_template):
+        cache = MetadataCache(cache_dir)
+        try:
+            tasks = plan_watermarks(files, {}, cache, text_template=text_template)
+            return tasks, (cache.hits, cache.misses)
+        finally:
+            cache.close()
+
+    # 规划阶段不打开图片，未命中的图片在处理时读取元数据并写入缓存
+    cold = plan(None)[1]
+    process_path(input_dir, cache_dir=cache_dir)
+    date_only = plan(None)[1]
+    missing_tags = plan(template)[1]
+    process_path(input_dir, cache_dir=cache_dir, text_template=template)
+    tasks, with_tags = plan(template)
+    texts = sorted(task[4] for task in tasks)
+    print(f"(命中, 未命中) 冷缓存: {cold}, 只读日期: {date_only}, 缺少模板标签: {missing_tags}, "
+          f"读取模板标签后: {with_tags}")
+    print(f"水印文本: {texts}")
+    return (cold == (0, 2) and date_only == (2, 0) and missing_tags == (0, 2) and with_tags == (2, 0)
+            and texts == ["2023-10-15 TestCamera X1", "2023-10-16"])
+
+
+def main():
+    """
+    主函数
+    """
+    print("===== 测试：水印文本模板 =====")
+    if os.path.exists(TEST_DIR):
+        shutil.rmtree(TEST_DIR)
+    os.makedirs(TEST_DIR, exist_ok=True)
+
+    checks = [check_compile, check_render, check_cache_fields]
+    failed = 0
+    for check in checks:
+        print(f"\n--- {check.__doc__.strip()} ---")
+        if check():
+            print("通过")
+        else:
+            print("失败")
+            failed += 1
+
+    print(f"\n===== 测试总结 =====")
+    print(f"总测试数: {len(checks)}")
+    print(f"失败测试: {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,564 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证水印渲染（方向映射等）的结果
+"""
+
+import os
+import sys
+import shutil
+import builtins
+from PIL import Image, ImageChops, ImageFont
+
+import font_manager
+from metadata_cache import ImageMetadata
+from photo_watermark import add_watermark_to_image, process_path
+import watermark_render
+from font_manager import FONT_SIZE_BUCKETS, bucket_font_size, get_font
+from watermark_render import (WatermarkStyle, draw_placement, get_effect_stamp, get_placement, get_text_mask,
+                              render_text_mask)
+
+
+TEST_DIR = "test_watermark_render"
+
+# Pillow 9.1之前转置常量直接定义在Image模块中
+Transpose = getattr(Image, 'Transpose', Image)
+
+# EXIF方向 -> 存储方向变换到显示方向的操作（与ImageOps.exif_transpose一致）
+TO_DISPLAY = {
+    2: Transpose.FLIP_LEFT_RIGHT,
+    3: Transpose.ROTATE_180,
+    4: Transpose.FLIP_TOP_BOTTOM,
+    5: Transpose.TRANSPOSE,
+    6: Transpose.ROTATE_270,
+    7: Transpose.TRANSVERSE,
+    8: Transpose.ROTATE_90,
+}
+
+# 显示方向变换回存储方向的操作
+TO_STORED = {
+    2: Transpose.FLIP_LEFT_RIGHT,
+    3: Transpose.ROTATE_180,
+    4: Transpose.FLIP_TOP_BOTTOM,
+    5: Transpose.TRANSPOSE,
+    6: Transpose.ROTATE_90,
+    7: Transpose.TRANSVERSE,
+    8: Transpose.ROTATE_270,
+}
+
+
+def watermark(img, name, orientation=1, **params):
+    """
+    保存图片并添加水印，返回加水印后的图片
+    :param img: 原始图片
+    :param name: 文件名
+    :param orientation: 传给水印工具的EXIF方向
+    :param params: 其他水印参数
+    """
+    path = os.path.join(TEST_DIR, name)
+    img.save(path)
+    metadata = ImageMetadata({'Orientation': orientation}, img.width, img.height, img.mode, 'PNG')
+    output_dir = os.path.join(TEST_DIR, "output")
+    if not add_watermark_to_image(path, output_dir, metadata=metadata, **params):
+        return None
+    with Image.open(os.path.join(output_dir, name)) as result:
+        return result.convert('RGB')
+
+
+def check_orientation():
+    """
+    检查各EXIF方向下，水印在显示时的位置和文字方向与直接在显示图上添加水印一致
+    """
+    display = Image.new('RGB', (300, 200), color='gray')
+    ok = True
+    for position in ('bottom-right', 'top-left', 'center'):
+        params = dict(font_size=30, position=position, default_text="Ab 2023")
+        expected = watermark(display, "display.png", **params)
+        for orientation in range(2, 9):
+            stored = display.transpose(TO_STORED[orientation])
+            result = watermark(stored, "stored.png", orientation, **params)
+            diff = ImageChops.difference(result.transpose(TO_DISPLAY[orientation]), expected).getbbox()
+            if diff:
+                print(f"位置 {position} 方向 {orientation}: 不一致 {diff}")
+                ok = False
+    return ok
+
+
+def check_mask_cache():
+    """
+    检查相同文字只渲染一次蒙版，相同尺寸只计算一次位置，复用的结果与第一次一致
+    """
+    get_text_mask.cache_clear()
+    get_placement.cache_clear()
+    img = Image.new('RGB', (200, 120), color='gray')
+    params = dict(font_size=24, default_text="Cached 2023")
+    first = watermark(img, "mask_first.png", **params)
+    second = watermark(img, "mask_second.png", **params)
+    third = watermark(img.resize((300, 120)), "mask_third.png", **params)
+    mask_info = get_text_mask.cache_info()
+    placement_info = get_placement.cache_info()
+    print(f"蒙版缓存: {mask_info}")
+    print(f"位置缓存: {placement_info}")
+    return (mask_info.misses == 1 and placement_info.misses == 2 and placement_info.hits == 1
+            and third is not None and ImageChops.difference(first, second).getbbox() is None)
+
+
+def check_effects():
+    """
+    检查描边、空心字和投影效果改变了输出，相同文字和效果的图章只渲染一次
+    """
+    get_effect_stamp.cache_clear()
+    img = Image.new('RGB', (200, 120), color='gray')
+    params = dict(font_size=24, default_text="Effect 2023")
+    plain = watermark(img, "effect_plain.png", **params)
+    styles = [
+        WatermarkStyle(2, (0, 0, 0), False, None, (0, 0), 0),
+        WatermarkStyle(2, (255, 255, 255), True, None, (0, 0), 0),
+        WatermarkStyle(0, (0, 0, 0), False, (0, 0, 0), (3, 3), 2.5),
+    ]
+    ok = plain is not None
+    for i, style in enumerate(styles):
+        first = watermark(img, f"effect_{i}_first.png", style=style, **params)
+        second = watermark(img.resize((260, 140)), f"effect_{i}_second.png", style=style, **params)
+        ok = (ok and first is not None and second is not None
+              and ImageChops.difference(plain, first).getbbox() is not None)
+    stamp_info = get_effect_stamp.cache_info()
+    print(f"图章缓存: {stamp_info}")
+    return ok and stamp_info.misses == len(styles) and stamp_info.hits == len(styles)
+
+
+def changed_box(before, after):
+    """
+    按原始字节比较两张图片，返回发生变化的像素范围
+    :return: (左, 上, 右, 下)，没有变化时返回None
+    """
+    width, height = before.size
+    before_bytes, after_bytes = before.tobytes(), after.tobytes()
+    pixel_size = len(before_bytes) // (width * height)
+    view = lambda data: Image.frombytes('L', (width * pixel_size, height), data)
+    box = ImageChops.difference(view(before_bytes), view(after_bytes)).getbbox()
+    if box is None:
+        return None
+    return box[0] // pixel_size, box[1], -(-box[2] // pixel_size), box[3]
+
+
+def check_roi_modes():
+    """
+    检查非RGB图片只在水印区域内混合，区域外的字节保持不变，各模式都能添加水印
+    """
+    noise = Image.frombytes('RGB', (240, 160), os.urandom(240 * 160 * 3))
+    images = {
+        'L': noise.convert('L'),
+        'LA': noise.convert('LA'),
+        'P': noise.quantize(64),
+        'RGBA': noise.convert('RGBA'),
+        'CMYK': noise.convert('CMYK'),
+        'I;16': noise.convert('I').convert('I;16'),
+    }
+    placement = get_placement("ROI 2023", get_font(24), 'bottom-right', noise.size, 1)
+    mask, (left, top) = placement
+    ok = True
+    for mode, img in images.items():
+        result = img.copy()
+        draw_placement(result, placement, (255, 255, 255, 204))
+        box = changed_box(img, result)
+        inside = (box is not None and box[0] >= left and box[1] >= top
+                  and box[2] <= left + mask.width and box[3] <= top + mask.height)
+        print(f"{mode}: 变化范围 {box}, 水印区域 {(left, top, left + mask.width, top + mask.height)}")
+        ok = ok and inside and result.mode == mode
+
+    # 保存为各自常用的格式，整个流程都能处理
+    for mode, ext in (('L', 'png'), ('P', 'gif'), ('CMYK', 'jpg'), ('RGBA', 'png')):
+        path = os.path.join(TEST_DIR, f"roi_{mode}.{ext}")
+        images[mode].save(path)
+        ok = ok and add_watermark_to_image(path, os.path.join(TEST_DIR, "roi_watermark"), font_size=24)
+    return ok
+
+
+def check_native_modes():
+    """
+    检查各模式在自身颜色空间中混合：L按亮度，CMYK反相为油墨，P使用调色板中的准确颜色，16位图片保留16位精度
+    """
+    placement = get_placement("Native 2023", get_font(28), 'center', (240, 160), 1)
+    mask, (left, top) = placement
+    # 文字完全覆盖的像素
+    solid = next((left + x, top + y) for y in range(mask.height) for x in range(mask.width)
+                 if mask.getpixel((x, y)) == 255)
+    results = {}
+    for mode, background, color in (('L', 40, (255, 0, 0, 255)), ('CMYK', (10, 20, 30, 200), (255, 255, 255, 255)),
+                                    ('CMYK', (0, 0, 0, 0), (0, 0, 0, 255)), ('I;16', 1000, (255, 255, 255, 255)),
+                                    ('I;16B', 1000, (255, 255, 255, 128))):
+        img = Image.new(mode, (240, 160), background)
+        draw_placement(img, placement, color)
+        results[(mode, color)] = img.getpixel(solid)
+    palette_img = Image.new('RGB', (240, 160), (0, 0, 128)).quantize(8)
+    draw_placement(palette_img, placement, (255, 200, 0, 255))
+    palette = palette_img.getpalette()
+    ink_index = palette_img.getpixel(solid)
+    results['P'] = tuple(palette[ink_index * 3:ink_index * 3 + 3])
+    print(f"完全覆盖的像素: {results}")
+    expected = {
+        ('L', (255, 0, 0, 255)): Image.new('RGB', (1, 1), (255, 0, 0)).convert('L').getpixel((0, 0)),
+        ('CMYK', (255, 255, 255, 255)): (0, 0, 0, 0),
+        ('CMYK', (0, 0, 0, 255)): (0, 0, 0, 255),
+        ('I;16', (255, 255, 255, 255)): 65535,
+        'P': (255, 200, 0),
+    }
+    ok = all(results[key] == value for key, value in expected.items())
+    if watermark_render.np is not None:
+        # 半透明白色：1000 + (65535 - 1000) * 128 / 255
+        ok = ok and results[('I;16B', (255, 255, 255, 128))] == (1000 * 127 + 65535 * 128 + 127) // 255
+    return ok
+
+
+def check_numeric_modes():
+    """
+    检查32位整数(I)和浮点(F)图片按自身的数值范围混合，超过255的值不会被截断，有无NumPy结果都正确
+    """
+    placement = get_placement("Numeric 2023", get_font(28), 'center', (240, 160), 1)
+    mask, (left, top) = placement
+    solid = next((left + x, top + y) for y in range(mask.height) for x in range(mask.width)
+                 if mask.getpixel((x, y)) == 255)
+    ok = True
+    for mode, background, white in (('I', 30000, 65535), ('F', 30000.0, 65535), ('F', 0.25, 1.0), ('I', 100, 255)):
+        path = os.path.join(TEST_DIR, f"numeric_{mode}_{background}.tif")
+        Image.new(mode, (240, 160), background).save(path)
+        output_dir = os.path.join(TEST_DIR, "numeric_watermark")
+        engines = [watermark_render.np, None] if watermark_render.np is not None else [None]
+        for np_module in engines:
+            original_np = watermark_render.np
+            watermark_render.np = np_module
+            try:
+                success = add_watermark_to_image(path, output_dir, font_size=28, position='center', opacity=100,
+                                                 default_text="Numeric 2023")
+            finally:
+                watermark_render.np = original_np
+            with Image.open(os.path.join(output_dir, os.path.basename(path))) as result:
+                values = (result.mode, result.getpixel(solid), result.getpixel((0, 0)))
+            print(f"{mode} 背景 {background}, NumPy {np_module is not None}: {values}")
+            ok = ok and success and values == (mode, white, background)
+    return ok
+
+
+def check_transparent_palette():
+    """
+    检查P模式图片的水印不会写成透明索引：白色透明键的PNG-8上画白字，调色板已满和有空位两种情况
+    """
+    placement = get_placement("Keyed 2023", get_font(28), 'center', (240, 160), 1)
+    mask, (left, top) = placement
+    solid = next((left + x, top + y) for y in range(mask.height) for x in range(mask.width)
+                 if mask.getpixel((x, y)) == 255)
+    ok = True
+    for entries in (256, 8):
+        # 索引0为白色且透明，其余为深浅不同的蓝色，调色板已满时最接近白色的不透明颜色为(250, 250, 255)
+        shades = [250 * index // (entries - 1) for index in range(1, entries)]
+        palette = [255, 255, 255] + [value for shade in shades for value in (shade, shade, 255)]
+        img = Image.new('P', (240, 160), 1)
+        img.putpalette(palette)
+        path = os.path.join(TEST_DIR, f"keyed_{entries}.png")
+        img.save(path, transparency=0)
+        with Image.open(path) as keyed:
+            keyed.load()
+            draw_placement(keyed, placement, (255, 255, 255, 255))
+            index = keyed.getpixel(solid)
+            color = tuple(keyed.getpalette()[index * 3:index * 3 + 3])
+        print(f"调色板 {entries} 项: 文字像素索引 {index}, 颜色 {color}")
+        # 有空位时追加不透明的白色，已满时使用最接近的不透明颜色
+        expected = (255, 255, 255) if entries < 256 else (250, 250, 255)
+        # 没有安装NumPy时按Pillow的近似查找，只检查不是透明索引
+        ok = ok and index != 0 and (color == expected or watermark_render.np is None)
+    return ok
+
+
+def check_blend_engines():
+    """
+    检查numpy混合引擎与pillow引擎逐像素一致，并且透明度对RGB图片生效
+    """
+    if watermark_render.np is None:
+        print("未安装NumPy，跳过")
+        return True
+    noise = Image.frombytes('RGB', (240, 160), os.urandom(240 * 160 * 3))
+    style = WatermarkStyle(2, (0, 0, 0), False, (0, 0, 0), (3, 3), 2)
+    ok = True
+    for color in ((255, 255, 255, 255), (255, 0, 0, 204), (30, 200, 90, 77)):
+        for current_style in (None, style):
+            placement = get_placement("Blend 2023", get_font(28), 'center', noise.size, 1, color, current_style)
+            results = []
+            for engine in ('pillow', 'numpy'):
+                img = noise.copy()
+                draw_placement(img, placement, color, engine)
+                results.append(img)
+            same = results[0].tobytes() == results[1].tobytes()
+            print(f"颜色 {color} 效果 {current_style is not None}: {'一致' if same else '不一致'}")
+            ok = ok and same
+
+    # 同一蒙版下，透明度越低与原图的差异越小
+    background = Image.new('RGB', (240, 160), (0, 0, 0))
+    placement = get_placement("Blend 2023", get_font(28), 'center', background.size, 1)
+    brightness = []
+    for opacity in (255, 128):
+        img = background.copy()
+        draw_placement(img, placement, (255, 255, 255, opacity))
+        brightness.append(img.getextrema()[0][1])
+    print(f"不透明/半透明时的最大亮度: {brightness}")
+    return ok and brightness[0] == 255 and brightness[1] == 128
+
+
+def check_blend_weight_cache():
+    """
+    检查numpy引擎的混合权重缓存有独立的数量上限，超出时只淘汰最久未使用的一项
+    """
+    if watermark_render.np is None:
+        print("未安装NumPy，跳过")
+        return True
+    limit = watermark_render.BLEND_CACHE_SIZE
+    color = (255, 255, 255, 255)
+    watermark_render._blend_weights.clear()
+    masks = [Image.new('L', (4, 2), i) for i in range(limit + 1)]
+    first = watermark_render.get_blend_weights(masks[0], color)
+    for mask in masks[1:limit]:
+        watermark_render.get_blend_weights(mask, color)
+    # 再次使用第一个蒙版后，超出上限时应淘汰第二个
+    reused = watermark_render.get_blend_weights(masks[0], color)[0] is first[0]
+    watermark_render.get_blend_weights(masks[limit], color)
+    cached = watermark_render._blend_weights.objects()
+    watermark_render._blend_weights.clear()
+    print(f"上限: {limit}, 缓存项: {len(cached)}, 命中: {reused}")
+    return (reused and len(cached) == limit and any(mask is masks[0] for mask in cached)
+            and not any(mask is masks[1] for mask in cached))
+
+
+def check_glyph_atlas():
+    """
+    检查用字形图集拼接的日期蒙版与draw.text渲染的结果逐像素一致，包括字形互相重叠的小字号
+    """
+    if watermark_render.np is None:
+        print("未安装NumPy，不使用字形图集")
+        return True
+    ok = True
+    used = 0
+    for size in list(range(6, 19)) + [24, 31, 64]:
+        atlas = watermark_render.get_glyph_atlas(get_font(size))
+        if atlas is None:
+            continue
+        used += 1
+        for text in ("2023-10-15", "1999-01-01", "2047-11-28", "-", "0000", "1111-11-11", "0123456789"):
+            expected = render_text_mask(text, get_font(size))
+            result = atlas.render(text)
+            if result.size != expected.size or ImageChops.difference(result, expected).getbbox():
+                print(f"字号 {size} 文字 {text}: 不一致")
+                ok = False
+    print(f"使用字形图集的字号: {used}/16")
+    return ok and used > 0
+
+
+def check_font_scale():
+    """
+    检查按短边比例确定的字号会取整到档位，分辨率相近的图片共用同一个蒙版
+    """
+    buckets_ok = (bucket_font_size(3) == 8 and bucket_font_size(61) == 64 and bucket_font_size(60) == 56
+                  and bucket_font_size(5000) == 512 and all(bucket_font_size(size) == size for size in FONT_SIZE_BUCKETS))
+    get_text_mask.cache_clear()
+    params = dict(font_scale=0.04, default_text="Scaled")
+    results = [watermark(Image.new('RGB', size, color='gray'), f"scale_{i}.png", **params)
+               for i, size in enumerate(((800, 600), (816, 612), (600, 800), (160, 120)))]
+    info = get_text_mask.cache_info()
+    # 前三张短边600和612，字号24；最后一张短边120，字号取最小档位8
+    print(f"蒙版缓存: {info}")
+    return buckets_ok and all(results) and info.misses == 2
+
+
+def check_bundled_font():
+    """
+    检查fonts目录中的字体优先使用，字体文件只读取一次，不同字号共用内存中的数据
+    """
+    try:
+        default_font = ImageFont.load_default(20)
+    except TypeError:
+        default_font = None
+    if not hasattr(default_font, 'font_bytes'):
+        print("Pillow版本过旧，默认字体不是可缩放字体")
+        return True
+    font_dir = os.path.join(TEST_DIR, "fonts")
+    os.makedirs(font_dir, exist_ok=True)
+    font_path = os.path.join(font_dir, "Bundled-Regular.ttf")
+    with open(font_path, 'wb') as f:
+        f.write(default_font.font_bytes)
+
+    def reset():
+        font_manager.find_bundled_font.cache_clear()
+        font_manager.find_default_font.cache_clear()
+        font_manager.load_font.cache_clear()
+        font_manager._resolved_fonts.clear()
+        font_manager._font_data.clear()
+
+    opened = []
+    original_open = builtins.open
+    original_dir = font_manager.BUNDLED_FONT_DIR
+
+    def counting_open(file, *args, **kwargs):
+        opened.append(file)
+        return original_open(file, *args, **kwargs)
+
+    reset()
+    font_manager.BUNDLED_FONT_DIR = font_dir
+    builtins.open = counting_open
+    try:
+        fonts = [font_manager.get_font(size) for size in (16, 24, 32, 24)]
+        resolved = font_manager.resolve_font()
+        state = font_manager.export_fonts()
+    finally:
+        builtins.open = original_open
+        font_manager.BUNDLED_FONT_DIR = original_dir
+        reset()
+    print(f"使用的字体: {resolved}, 字体文件读取次数: {opened.count(font_path)}")
+    return (resolved == (font_path, 0) and opened.count(font_path) == 1
+            and [font.size for font in fonts] == [16, 24, 32, 24] and fonts[1] is fonts[3]
+            and list(state[1]) == [font_path])
+
+
+def check_invalid_font_file():
+    """
+    检查--font指定的文件不是字体时只警告一次并使用默认字体，图片仍正常处理
+    """
+    input_dir = os.path.join(TEST_DIR, "invalid_font")
+    os.makedirs(input_dir, exist_ok=True)
+    for i in range(2):
+        Image.new('RGB', (120, 80), color='gray').save(os.path.join(input_dir, f"{i}.jpg"))
+    font_path = os.path.join(TEST_DIR, "not_a_font.ttf")
+    with open(font_path, 'w') as f:
+        f.write("localhost\n")
+
+    font_manager._resolved_fonts.clear()
+    font_manager._font_data.clear()
+    printed = []
+    original_print = builtins.print
+    builtins.print = lambda *args, **kwargs: printed.append(' '.join(str(arg) for arg in args))
+    try:
+        process_path(input_dir, font_name=font_path, use_cache=False)
+        resolved = font_manager.resolve_font(font_path)
+    finally:
+        builtins.print = original_print
+        font_manager._resolved_fonts.clear()
+        font_manager._font_data.clear()
+    warnings = [line for line in printed if font_path in line]
+    output_dir = os.path.join(TEST_DIR, "invalid_font_watermark")
+    saved = sorted(os.listdir(output_dir)) if os.path.isdir(output_dir) else []
+    print(f"警告: {warnings}, 使用的字体: {resolved}, 输出: {saved}")
+    return (len(warnings) == 1 and resolved == font_manager.find_default_font()
+            and saved == ["0.jpg", "1.jpg"] and font_path not in font_manager.export_fonts()[1])
+
+
+def check_cache_report():
+    """
+    检查处理结束时输出的缓存命中率来自渲染缓存的实际查询次数
+    """
+    input_dir = os.path.join(TEST_DIR, "cache_report")
+    os.makedirs(input_dir, exist_ok=True)
+    for i in range(4):
+        Image.new('RGB', (173, 91), color='gray').save(os.path.join(input_dir, f"{i}.png"))
+
+    printed = []
+    original_print = builtins.print
+    builtins.print = lambda *args, **kwargs: printed.append(' '.join(str(arg) for arg in args))
+    try:
+        process_path(input_dir, font_size=18, default_text="cache report", use_cache=False)
+    finally:
+        builtins.print = original_print
+    report = [line for line in printed if "缓存命中" in line]
+    print(report)
+    # 没有元数据缓存时不预渲染：第一张图片渲染一次蒙版并计算位置，其余3张命中位置缓存
+    return report[0].startswith("水印蒙版缓存命中: ") and "/1 " in report[0] and report[1] == "水印位置缓存命中: 3/4 (75.0%)"
+
+
+def check_parallel_jobs():
+    """
+    检查多进程处理（共用预渲染蒙版）与单进程处理的结果一致
+    """
+    input_dir = os.path.join(TEST_DIR, "batch")
+    os.makedirs(input_dir, exist_ok=True)
+    for i in range(6):
+        img = Image.new('RGB', (240, 160), color='gray')
+        exif = img.getexif()
+        exif[0x0112] = i % 2 * 5 + 1  # 交替使用方向1和6
+        exif.get_ifd(0x8769)[0x9003] = f"2023:10:{i % 3 + 1:02d} 08:00:00"
+        img.save(os.path.join(input_dir, f"{i}.jpg"), exif=exif.tobytes(), quality=95)
+
+    output_dir = os.path.join(TEST_DIR, "batch_watermark")
+    results = []
+    for jobs in (1, 2):
+        process_path(input_dir, font_size=20, use_cache=False, jobs=jobs)
+        results.append({name: Image.open(os.path.join(output_dir, name)).convert('RGB')
+                        for name in sorted(os.listdir(output_dir))})
+        shutil.rmtree(output_dir)
+    single, parallel = results
+    return (len(single) == 6 and single.keys() == parallel.keys()
+            and all(ImageChops.difference(single[name], parallel[name]).getbbox() is None for name in single))
+
+
+def check_tile_position():
+    """
+    检查平铺水印：单元对每种(文字, 角度)只渲染一次，整幅蒙版按图片尺寸只展开一次，水印铺满整张图片
+    """
+    get_placement.cache_clear()
+    watermark_render.get_tile.cache_clear()
+    watermark_render._tiled_masks.clear()
+    color = (255, 255, 255, 160)
+    font = get_font(20)
+    placement = get_placement("Proof", font, 'tile', (320, 240), 1, color, None, 30)
+    rotated = get_placement("Proof", font, 'tile', (240, 320), 6, color, None, 30)
+    tile, xy = placement
+    ok = xy is None and rotated[1] is None and rotated[0].size == tile.size[::-1]
+
+    images = [Image.new('RGB', (320, 240), (20, 40, 60)) for _ in range(3)]
+    for img in images:
+        draw_placement(img, placement, color)
+    expanded = watermark_render._tiled_masks.objects()
+    print(f"单元尺寸: {tile.size}, 整幅蒙版: {len(expanded)} 个, 单元缓存: {watermark_render.get_tile.cache_info()}")
+    ok = ok and len(expanded) == 1 and watermark_render.get_tile.cache_info().misses == 1
+    ok = ok and images[0].tobytes() == images[2].tobytes()
+
+    # 四个象限都有水印
+    changed = ImageChops.difference(images[0], Image.new('RGB', (320, 240), (20, 40, 60))).convert('L')
+    quadrants = [changed.crop((x, y, x + 160, y + 120)).getbbox() is not None for x in (0, 160) for y in (0, 120)]
+    print(f"各象限是否有水印: {quadrants}")
+
+    # 带效果的平铺水印，以及非RGB图片
+    style = WatermarkStyle(2, (0, 0, 0), False, None, (0, 0), 0)
+    for mode in ('L', 'CMYK'):
+        img = Image.new(mode, (320, 240))
+        draw_placement(img, get_placement("Proof", font, 'tile', img.size, 1, color, style, 45), color)
+        ok = ok and img.getbbox() is not None
+    return ok and all(quadrants)
+
+
+def main():
+    """
+    主函数
+    """
+    print("===== 测试：水印渲染 =====")
+    if os.path.exists(TEST_DIR):
+        shutil.rmtree(TEST_DIR)
+    os.makedirs(TEST_DIR, exist_ok=True)
+
+    checks = [check_orientation, check_mask_cache, check_effects, check_roi_modes, check_native_modes,
+              check_numeric_modes, check_transparent_palette, check_blend_engines, check_blend_weight_cache,
+              check_glyph_atlas, check_font_scale, check_bundled_font, check_invalid_font_file, check_cache_report,
+              check_parallel_jobs, check_tile_position]
+    failed = 0
+    for check in checks:
+        print(f"\n--- {check.__doc__.strip()} ---")
+        if check():
+            print("通过")
+        else:
+            print("失败")
+            failed += 1
+
+    print(f"\n===== 测试总结 =====")
+    print(f"总测试数: {len(checks)}")
+    print(f"失败测试: {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
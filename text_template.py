@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+水印文本模板
+模板只解析一次，编译结果记录需要读取的EXIF标签，每张图片只做字段替换
+例如：{date:%Y.%m.%d} · {Model} · f/{FNumber}
+"""
+
+import string
+from datetime import datetime
+from functools import lru_cache
+
+from exif_tools import METADATA_TAGS, TEMPLATE_TAGS
+
+
+# 按日期优先级选出的拍摄日期，格式说明为strftime格式
+DATE_FIELD = 'date'
+
+# {date}没有格式说明时的输出格式
+DEFAULT_DATE_FORMAT = '%Y-%m-%d'
+
+
+@lru_cache(maxsize=4096)
+def format_date(date_str, date_format):
+    """
+    按strftime格式输出日期，同一批照片中不同的日期很少，结果按(日期, 格式)缓存
+    :param date_str: 日期字符串(YYYY-MM-DD)
+    :param date_format: strftime格式
+    :return: 格式化后的日期字符串
+    """
+    return datetime.strptime(date_str, '%Y-%m-%d').strftime(date_format or DEFAULT_DATE_FORMAT)
+
+
+def format_field(value, conversion, format_spec):
+    """
+    按模板中的转换符和格式说明输出字段值，格式说明与取值类型不符时直接输出字符串
+    :param value: 字段值，为None时输出空字符串
+    :param conversion: 转换符（s、r、a）或None
+    :param format_spec: 格式说明
+    :return: 字符串
+    """
+    if value is None:
+        return ''
+    if conversion == 's':
+        value = str(value)
+    elif conversion == 'r':
+        value = repr(value)
+    elif conversion == 'a':
+        value = ascii(value)
+    try:
+        return format(value, format_spec)
+    except (ValueError, TypeError):
+        return str(value)
+
+
+class TextTemplate(object):
+    """
+    编译后的水印文本模板
+    """
+
+    def __init__(self, template):
+        """
+        :param template: 模板字符串，字段名为date或EXIF标签名（见TEMPLATE_TAGS）
+        :raises ValueError: 模板语法错误或引用了不支持的字段
+        """
+        self.template = template
+        # [(字面文本, 字段名, 转换符, 格式说明)]，字段名为None表示只有字面文本
+        self.parts = []
+        try:
+            parsed = list(string.Formatter().parse(template))
+        except ValueError as e:
+            raise ValueError(f"模板语法错误: {e}")
+        for literal, name, format_spec, conversion in parsed:
+            if name is not None:
+                if name not in TEMPLATE_TAGS and name not in METADATA_TAGS and name != DATE_FIELD:
+                    raise ValueError(f"不支持的模板字段: {{{name}}}（可选：{DATE_FIELD}、"
+                                     f"{'、'.join(list(TEMPLATE_TAGS) + list(METADATA_TAGS))}）")
+                if '{' in format_spec:
+                    raise ValueError(f"模板字段的格式说明中不能嵌套字段: {{{name}:{format_spec}}}")
+            self.parts.append((literal, name, conversion, format_spec))
+        # 需要额外读取的EXIF标签，日期和方向等字段总是会读取
+        self.tags = tuple(sorted(set(name for literal, name, conversion, format_spec in self.parts
+                                     if name in TEMPLATE_TAGS)))
+        self.uses_date = any(name == DATE_FIELD for literal, name, conversion, format_spec in self.parts)
+
+    def render(self, tags, date):
+        """
+        生成一张图片的水印文本
+        :param tags: 从EXIF/XMP读取的字段{字段名: 值}
+        :param date: 拍摄日期(YYYY-MM-DD)，模板不使用日期时可以为None
+        :return: 水印文本，缺少的字段输出为空
+        """
+        pieces = []
+        for literal, name, conversion, format_spec in self.parts:
+            pieces.append(literal)
+            if name == DATE_FIELD:
+                pieces.append(format_date(date, format_spec) if date else '')
+            elif name is not None:
+                pieces.append(format_field(tags.get(name), conversion, format_spec))
+        return ''.join(pieces).strip()
+
+
+def compile_template(template):
+    """
+    编译水印文本模板
+    :param template: 模板字符串
+    :return: TextTemplate
+    :raises ValueError: 模板无效
+    """
+    return TextTemplate(template)
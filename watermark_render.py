@@ -0,0 +1,903 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+水印渲染工具
+把水印文字渲染成L模式的透明度蒙版（带描边、阴影等效果时渲染成RGBA图章），
+按EXIF方向计算在存储像素坐标中的位置后绘制到图片上
+"""
+
+import math
+from collections import namedtuple
+from functools import lru_cache
+
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageFont
+
+try:
+    import numpy as np
+except ImportError:
+    # 没有安装NumPy时不使用字形图集，全部文字用draw.text渲染
+    np = None
+
+
+# Pillow 9.1之前转置常量直接定义在Image模块中
+_Transpose = getattr(Image, 'Transpose', Image)
+_Dither = getattr(Image, 'Dither', Image)
+
+
+class ObjectCache(object):
+    """
+    以对象身份(id)和附加参数为键的缓存，用于蒙版、图章等不可哈希或哈希代价高的对象
+    缓存项同时持有对象，对象存在期间id不会被复用；超过maxsize项时淘汰最久未使用的一项
+    """
+
+    def __init__(self, maxsize):
+        """
+        :param maxsize: 缓存项数量上限
+        """
+        self.maxsize = maxsize
+        # {(id(对象), 附加参数): (对象, 结果)}，按最近使用的顺序排列
+        self.entries = {}
+
+    def get(self, obj, extra, compute):
+        """
+        获取对象的缓存结果，没有缓存时调用compute()计算
+        :param obj: 作为键的对象
+        :param extra: 附加参数（可哈希）
+        :param compute: 无参数的计算函数
+        :return: 缓存的结果，被共用，调用方不能修改
+        """
+        key = (id(obj), extra)
+        # 取出后重新插入，使字典保持最近使用的顺序
+        entry = self.entries.pop(key, None)
+        if entry is None or entry[0] is not obj:
+            entry = (obj, compute())
+            if len(self.entries) >= self.maxsize:
+                del self.entries[next(iter(self.entries))]
+        self.entries[key] = entry
+        return entry[1]
+
+    def objects(self):
+        """
+        :return: 当前缓存的对象列表，从最久未使用到最近使用
+        """
+        return [entry[0] for entry in self.entries.values()]
+
+    def clear(self):
+        """
+        清空缓存
+        """
+        self.entries.clear()
+
+
+# 水印到图片边缘的距离
+MARGIN = 10
+
+# 缓存的文字蒙版数量上限
+MASK_CACHE_SIZE = 256
+
+# 缓存的效果图章数量上限
+STAMP_CACHE_SIZE = 64
+
+# 缓存的水印位置数量上限（每种文字、图片尺寸和方向的组合一项）
+PLACEMENT_CACHE_SIZE = 1024
+
+# numpy引擎缓存的混合权重数量上限，每项是两个与水印区域等大的uint16数组（每像素12字节）
+BLEND_CACHE_SIZE = 64
+
+# 平铺水印的位置名称，水印旋转后斜向重复铺满整张图片
+TILE_POSITION = 'tile'
+
+# 平铺水印默认的旋转角度（逆时针，度）
+TILE_ANGLE = 30
+
+# 平铺水印之间的间距，为文字高度的倍数
+TILE_SPACING = 1
+
+# 缓存的整幅平铺蒙版数量上限，每项与图片一样大
+TILE_CACHE_SIZE = 4
+
+# ImageDraw可以直接按RGBA颜色混合的图片模式，其他模式只转换水印所在的区域
+NATIVE_BLEND_MODES = ('RGB',)
+
+# 可选的混合引擎：pillow为ImageDraw/paste，numpy为向量化的定点整数运算（需要安装NumPy）
+BLEND_ENGINES = ('pillow', 'numpy')
+
+# numpy引擎预先计算的混合权重，键为(蒙版, 颜色)
+_blend_weights = ObjectCache(BLEND_CACHE_SIZE)
+
+# 带透明通道的图片模式，水印按alpha合成叠加，保留原有的透明度
+_ALPHA_MODES = ('RGBA', 'LA')
+
+# 按图片尺寸展开的平铺蒙版，键为(平铺单元, 尺寸, 透明度)
+_tiled_masks = ObjectCache(TILE_CACHE_SIZE)
+
+# 效果图章颜色层转换到其他模式的结果，键为(颜色层, 模式)
+_mode_layers = ObjectCache(STAMP_CACHE_SIZE)
+
+# 字形图集包含的字符（日期水印只会用到这些字符）
+ATLAS_CHARS = '0123456789-'
+
+# 水印效果
+# stroke_width: 描边宽度，0表示不描边；stroke_color: 描边颜色(R, G, B)
+# outline: 是否为只保留描边的空心字
+# shadow_color: 阴影颜色(R, G, B)，None表示没有阴影；shadow_offset: 阴影偏移(x, y)；shadow_blur: 阴影高斯模糊半径
+WatermarkStyle = namedtuple('WatermarkStyle', ['stroke_width', 'stroke_color', 'outline',
+                                               'shadow_color', 'shadow_offset', 'shadow_blur'])
+
+# Pillow 9.1之前布局引擎常量直接定义在ImageFont模块中
+_LAYOUT_BASIC = getattr(getattr(ImageFont, 'Layout', ImageFont), 'BASIC', 0)
+
+# EXIF方向 -> 把显示方向的蒙版变换到存储方向所需的转置操作
+# （即exif_transpose所用操作的逆操作）
+_MASK_TRANSPOSE = {
+    2: _Transpose.FLIP_LEFT_RIGHT,
+    3: _Transpose.ROTATE_180,
+    4: _Transpose.FLIP_TOP_BOTTOM,
+    5: _Transpose.TRANSPOSE,
+    6: _Transpose.ROTATE_90,
+    7: _Transpose.TRANSVERSE,
+    8: _Transpose.ROTATE_270,
+}
+
+
+def normalize_orientation(orientation):
+    """
+    把EXIF方向值规范为1-8的整数，缺失或无效时视为1（不旋转）
+    """
+    return orientation if isinstance(orientation, int) and 1 <= orientation <= 8 else 1
+
+
+def display_size(size, orientation):
+    """
+    计算图片按EXIF方向显示时的尺寸
+    :param size: 存储像素尺寸(宽, 高)
+    :param orientation: EXIF方向值
+    :return: 显示尺寸(宽, 高)
+    """
+    width, height = size
+    return (height, width) if normalize_orientation(orientation) >= 5 else (width, height)
+
+
+def _display_to_stored(u, v, orientation, size):
+    """
+    把显示坐标中的点映射到存储坐标（按像素边界的连续坐标计算）
+    :param size: 存储像素尺寸(宽, 高)
+    """
+    width, height = size
+    return {
+        1: (u, v),
+        2: (width - u, v),
+        3: (width - u, height - v),
+        4: (u, height - v),
+        5: (v, u),
+        6: (v, height - u),
+        7: (width - v, height - u),
+        8: (width - v, u),
+    }[orientation]
+
+
+def display_box_to_stored(box, orientation, size):
+    """
+    把显示坐标中的矩形映射到存储坐标
+    :param box: 显示坐标中的矩形(左, 上, 右, 下)
+    :param orientation: EXIF方向值
+    :param size: 存储像素尺寸(宽, 高)
+    :return: 存储坐标中的矩形(左, 上, 右, 下)
+    """
+    orientation = normalize_orientation(orientation)
+    x1, y1 = _display_to_stored(box[0], box[1], orientation, size)
+    x2, y2 = _display_to_stored(box[2], box[3], orientation, size)
+    return min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+
+
+@lru_cache(maxsize=MASK_CACHE_SIZE)
+def get_text_bbox(text, font, stroke_width=0):
+    """
+    测量文字的边界框，相同的(文字, 字体, 描边宽度)只测量一次
+    字体对象由font_manager按(路径, 字号, 索引)缓存，同一字体和字号总是同一个对象
+    :param text: 水印文本
+    :param font: 字体对象
+    :param stroke_width: 描边宽度
+    :return: 以文字原点为(0, 0)的边界框(左, 上, 右, 下)，左和上即绘制时需要抵消的偏移
+    """
+    measure = ImageDraw.Draw(Image.new('L', (1, 1)))
+    return measure.textbbox((0, 0), text, font=font, stroke_width=stroke_width)
+
+
+def render_text_mask(text, font, stroke_width=0):
+    """
+    把文字渲染成刚好包住字形的L模式蒙版，像素值为字形覆盖度(0-255)
+    :param text: 水印文本
+    :param font: 字体对象
+    :param stroke_width: 描边宽度
+    :return: L模式的Image
+    """
+    left, top, right, bottom = get_text_bbox(text, font, stroke_width)
+    mask = Image.new('L', (max(right - left, 1), max(bottom - top, 1)), 0)
+    ImageDraw.Draw(mask).text((-left, -top), text, font=font, fill=255, stroke_width=stroke_width, stroke_fill=255)
+    return mask
+
+
+class GlyphAtlas(object):
+    """
+    单个字体的数字字形图集
+    每个字形和两两之间的字距只用FreeType渲染、测量一次，之后用NumPy拼接出任意日期的蒙版
+    相邻字形重叠的像素按a + b - a * b / 255合成（与Pillow 12的draw.text相同，旧版本取最大值），
+    建立图集时核对每对会重叠的字符，与draw.text不一致时exact为False，不应使用该图集
+    """
+
+    def __init__(self, font, chars=ATLAS_CHARS):
+        """
+        :param font: 字体对象（FreeTypeFont，基本布局）
+        :param chars: 图集包含的字符
+        """
+        # 步进和字距以1/64像素为单位，与FreeType内部的26.6定点数一致
+        self.advances = {c: round(font.getlength(c) * 64) for c in chars}
+        self.kerning = {(a, b): round(font.getlength(a + b) * 64) - self.advances[a] - self.advances[b]
+                        for a in chars for b in chars}
+        self.bboxes = {}
+        self.glyphs = {}
+        for c in chars:
+            left, top, right, bottom = get_text_bbox(c, font)
+            self.bboxes[c] = (left, top, right, bottom)
+            glyph = Image.new('L', (max(right - left, 1), max(bottom - top, 1)), 0)
+            ImageDraw.Draw(glyph).text((-left, -top), c, font=font, fill=255)
+            self.glyphs[c] = np.asarray(glyph)
+        # 小字号时字形常超出步进与下一个字形重叠，只有这些字符对需要核对合成结果
+        self.exact = all(self._matches(a + b, font) for a in chars for b in chars
+                         if ((self.advances[a] + self.kerning[a, b]) >> 6) + self.bboxes[b][0] < self.bboxes[a][2])
+
+    def _matches(self, text, font):
+        """
+        拼接结果是否与draw.text逐像素一致
+        """
+        expected = render_text_mask(text, font)
+        result = self.render(text)
+        return result.size == expected.size and result.tobytes() == expected.tobytes()
+
+    def covers(self, text):
+        """
+        图集是否包含文字中的全部字符
+        """
+        return bool(text) and all(c in self.glyphs for c in text)
+
+    def render(self, text):
+        """
+        用图集拼接文字蒙版，结果与render_text_mask相同
+        :param text: 只包含图集字符的文字
+        :return: L模式的Image
+        """
+        # 每个字形的笔位置（像素），加上前一个字形的步进和两者之间的字距
+        pens = []
+        pen = 0
+        for i, c in enumerate(text):
+            if i:
+                pen += self.advances[text[i - 1]] + self.kerning[text[i - 1], c]
+            pens.append(pen >> 6)
+
+        boxes = [self.bboxes[c] for c in text]
+        left = min(x + box[0] for x, box in zip(pens, boxes))
+        top = min(box[1] for box in boxes)
+        right = max(x + box[2] for x, box in zip(pens, boxes))
+        bottom = max(box[3] for box in boxes)
+
+        mask = np.zeros((max(bottom - top, 1), max(right - left, 1)), dtype=np.uint8)
+        for c, x, box in zip(text, pens, boxes):
+            glyph = self.glyphs[c]
+            x0 = x + box[0] - left
+            y0 = box[1] - top
+            region = mask[y0:y0 + glyph.shape[0], x0:x0 + glyph.shape[1]]
+            # 覆盖度按a + b - a * b / 255合成，除以255使用与Pillow相同的定点整数近似
+            src = glyph[:region.shape[0], :region.shape[1]].astype(np.uint16)
+            product = region * src + 128
+            region[...] = region + src - ((product + (product >> 8)) >> 8)
+        return Image.fromarray(mask, 'L')
+
+
+@lru_cache(maxsize=32)
+def get_glyph_atlas(font):
+    """
+    获取字体的字形图集，每个字体对象只建立一次
+    只支持基本布局的FreeType字体（复杂布局可能改变字形位置），没有NumPy或拼接结果与draw.text不一致时
+    不使用图集
+    :param font: 字体对象
+    :return: GlyphAtlas或None
+    """
+    if np is None or not isinstance(font, ImageFont.FreeTypeFont):
+        return None
+    if getattr(font, 'layout_engine', _LAYOUT_BASIC) != _LAYOUT_BASIC:
+        return None
+    atlas = GlyphAtlas(font)
+    return atlas if atlas.exact else None
+
+
+@lru_cache(maxsize=MASK_CACHE_SIZE)
+def get_text_mask(text, font, stroke_width=0):
+    """
+    获取文字蒙版，相同的(文字, 字体, 描边宽度)只渲染一次
+    只由数字和连字符组成的日期文字用字形图集拼接，其他文字用draw.text渲染
+    字体对象由font_manager按(路径, 字号, 索引)缓存，同一字体和字号总是同一个对象
+    返回的蒙版会被多张图片共用，调用方不能修改
+    :param text: 水印文本
+    :param font: 字体对象
+    :param stroke_width: 描边宽度
+    :return: L模式的Image
+    """
+    if not stroke_width:
+        atlas = get_glyph_atlas(font)
+        if atlas is not None and atlas.covers(text):
+            return atlas.render(text)
+    return render_text_mask(text, font, stroke_width)
+
+
+def render_effect_stamp(text, font, rgba_color, style):
+    """
+    渲染带描边、空心或阴影效果的水印图章，图层从下到上依次为阴影、描边、文字
+    :param text: 水印文本
+    :param font: 字体对象
+    :param rgba_color: 文字颜色，A通道为整个水印的透明度
+    :param style: WatermarkStyle
+    :return: RGBA模式的Image
+    """
+    stroke_width = style.stroke_width
+    left, top, right, bottom = get_text_bbox(text, font, stroke_width)
+    dx, dy = style.shadow_offset if style.shadow_color else (0, 0)
+    # 高斯模糊的影响范围约为半径的3倍
+    pad = int(math.ceil(style.shadow_blur * 3)) if style.shadow_color else 0
+    origin_x = pad + max(-dx, 0) - left
+    origin_y = pad + max(-dy, 0) - top
+    size = (right - left + 2 * pad + abs(dx), bottom - top + 2 * pad + abs(dy))
+
+    def text_layer(offset=(0, 0), with_stroke=False):
+        layer = Image.new('L', size, 0)
+        ImageDraw.Draw(layer).text((origin_x + offset[0], origin_y + offset[1]), text, font=font, fill=255,
+                                   stroke_width=stroke_width if with_stroke else 0, stroke_fill=255)
+        return layer
+
+    text_mask = text_layer()
+    layers = []
+    if style.shadow_color:
+        shadow = text_layer((dx, dy), with_stroke=True)
+        if style.shadow_blur:
+            shadow = shadow.filter(ImageFilter.GaussianBlur(style.shadow_blur))
+        layers.append((style.shadow_color, shadow))
+    if stroke_width:
+        stroke = text_layer(with_stroke=True)
+        if style.outline:
+            stroke = ImageChops.subtract(stroke, text_mask)
+        layers.append((style.stroke_color, stroke))
+    if not (style.outline and stroke_width):
+        layers.append((rgba_color[:3], text_mask))
+
+    stamp = Image.new('RGBA', size, (0, 0, 0, 0))
+    for color, mask in layers:
+        layer = Image.new('RGBA', size, tuple(color[:3]) + (0,))
+        layer.putalpha(mask)
+        stamp = Image.alpha_composite(stamp, layer)
+    # 水印透明度作用于整个图章
+    opacity = rgba_color[3] if len(rgba_color) > 3 else 255
+    if opacity < 255:
+        stamp.putalpha(stamp.getchannel('A').point(lambda value: value * opacity // 255))
+    return stamp
+
+
+@lru_cache(maxsize=STAMP_CACHE_SIZE)
+def get_effect_stamp(text, font, rgba_color, style):
+    """
+    获取效果图章，阴影模糊等开销较大的处理对相同的(文字, 字体, 颜色, 效果)只做一次
+    返回的图章会被多张图片共用，调用方不能修改
+    :param text: 水印文本
+    :param font: 字体对象
+    :param rgba_color: 文字颜色和透明度(R, G, B, A)
+    :param style: WatermarkStyle
+    :return: RGBA模式的Image
+    """
+    return render_effect_stamp(text, font, rgba_color, style)
+
+
+@lru_cache(maxsize=STAMP_CACHE_SIZE)
+def get_tile(text, font, angle=TILE_ANGLE, rgba_color=None, style=None):
+    """
+    获取平铺水印的单元：旋转后的文字加上四周的间距，相同的(文字, 字体, 角度, 效果)只渲染和旋转一次
+    返回的单元会被多张图片共用，调用方不能修改
+    :param text: 水印文本
+    :param font: 字体对象
+    :param angle: 逆时针旋转角度（度）
+    :param rgba_color: 文字颜色和透明度，只在有效果时使用
+    :param style: WatermarkStyle，为None时为普通水印
+    :return: 显示方向的L蒙版，或效果图章(RGB颜色层, L透明度层)
+    """
+    mark = get_text_mask(text, font, 0) if style is None else get_effect_stamp(text, font, rgba_color, style)
+    gap = max(mark.height, 1) * TILE_SPACING
+    rotated = mark.rotate(angle, Image.BICUBIC, expand=True)
+    tile = Image.new(mark.mode, (rotated.width + gap, rotated.height + gap))
+    tile.paste(rotated, (gap // 2, gap // 2))
+    if style is None:
+        return tile
+    return tile.convert('RGB'), tile.getchannel('A')
+
+
+def expand_tile(tile, image_size):
+    """
+    把平铺单元铺满整张图片，隔行错开半个单元，使水印斜向排列
+    :param tile: L或RGB模式的单元
+    :param image_size: 图片尺寸(宽, 高)
+    :return: 与图片同样大小的Image
+    """
+    canvas = Image.new(tile.mode, image_size)
+    for row, top in enumerate(range(0, image_size[1], tile.height)):
+        for left in range(-(row % 2) * (tile.width // 2), image_size[0], tile.width):
+            canvas.paste(tile, (left, top))
+    return canvas
+
+
+def get_tiled_mask(tile, image_size, opacity=255):
+    """
+    获取按图片尺寸展开的平铺蒙版，同一批尺寸相同的图片只展开一次，之后每张图片只做一次整幅混合
+    :param tile: get_placement()返回的平铺单元（L蒙版或效果图章）
+    :param image_size: 存储像素尺寸(宽, 高)
+    :param opacity: 普通水印的透明度(0-255)，预先乘到展开后的蒙版中
+    :return: 整幅L透明度蒙版，或效果图章(RGB颜色层, L透明度层)，被共用，调用方不能修改
+    """
+    def expand():
+        if isinstance(tile, tuple):
+            return tuple(expand_tile(layer, image_size) for layer in tile)
+        return scale_alpha(expand_tile(tile, image_size), opacity)
+
+    return _tiled_masks.get(tile, (image_size, opacity), expand)
+
+
+def calculate_text_position(position, image_size, text_size, margin=MARGIN):
+    """
+    计算文字左上角在图片中的位置
+    :param position: 水印位置
+    :param image_size: 图片尺寸(宽, 高)
+    :param text_size: 文字尺寸(宽, 高)
+    :param margin: 边距
+    :return: (x, y)
+    """
+    width, height = image_size
+    text_width, text_height = text_size
+    if position == 'top-left':
+        return margin, margin
+    if position == 'top-right':
+        return width - text_width - margin, margin
+    if position == 'bottom-left':
+        return margin, height - text_height - margin
+    if position == 'center':
+        return (width - text_width) // 2, (height - text_height) // 2
+    # 默认右下角
+    return width - text_width - margin, height - text_height - margin
+
+
+def place_mask(mask, position, image_size, orientation=1):
+    """
+    按显示方向计算水印位置，再把蒙版和位置映射到存储像素坐标
+    只转置很小的文字蒙版，不需要对整张图片做transpose
+    :param mask: 显示方向的文字蒙版
+    :param position: 水印位置（相对显示方向）
+    :param image_size: 存储像素尺寸(宽, 高)
+    :param orientation: EXIF方向值
+    :return: (存储方向的蒙版, 左上角坐标(x, y))
+    """
+    orientation = normalize_orientation(orientation)
+    text_x, text_y = calculate_text_position(position, display_size(image_size, orientation), mask.size)
+    if orientation == 1:
+        return mask, (text_x, text_y)
+
+    box = (text_x, text_y, text_x + mask.width, text_y + mask.height)
+    left, top, _, _ = display_box_to_stored(box, orientation, image_size)
+    return mask.transpose(_MASK_TRANSPOSE[orientation]), (left, top)
+
+
+def draw_mask(img, mask, xy, color):
+    """
+    用指定颜色按蒙版把水印绘制到图片上，混合方式与draw.text相同
+    注意draw.text/bitmap只按蒙版混合，会忽略填充色的A通道，透明度需要预先乘到蒙版中
+    :param img: 目标图片
+    :param mask: L模式透明度蒙版
+    :param xy: 左上角坐标
+    :param color: RGB颜色
+    """
+    ImageDraw.Draw(img).bitmap(xy, mask, fill=tuple(color[:3]))
+
+
+def draw_stamp(img, stamp, xy):
+    """
+    把效果图章按其透明度合成到图片上，开销与draw_mask相同
+    :param img: 目标图片
+    :param stamp: (RGB颜色层, L透明度层)
+    :param xy: 左上角坐标
+    """
+    color, alpha = stamp
+    img.paste(color, xy, alpha)
+
+
+def scale_alpha(mask, opacity):
+    """
+    把文字蒙版按水印透明度缩放为实际的混合权重
+    :param mask: L模式蒙版
+    :param opacity: 透明度(0-255)
+    :return: L模式透明度蒙版
+    """
+    if opacity >= 255:
+        return mask
+    return mask.point([(value * opacity + 127) // 255 for value in range(256)])
+
+
+def get_blend_weights(mask, rgba_color):
+    """
+    numpy引擎的混合权重：255 - a和color * a + 128，对同一蒙版和颜色只计算一次
+    最多缓存BLEND_CACHE_SIZE项，超出时淘汰最久未使用的一项
+    权重按(高, 宽 * 3)排列，与RGB像素数据逐字节对应，计算时不需要广播颜色通道
+    :param mask: 普通水印的L蒙版，或效果图章(RGB颜色层, L透明度层)
+    :param rgba_color: 普通水印的RGBA颜色
+    :return: (255 - a, color * a + 128)，均为uint16数组
+    """
+    stamp = isinstance(mask, tuple)
+
+    def compute():
+        if stamp:
+            layer, alpha = mask
+            ink = np.asarray(layer, dtype=np.uint16).reshape(alpha.height, alpha.width * 3)
+        else:
+            alpha = scale_alpha(mask, rgba_color[3] if len(rgba_color) > 3 else 255)
+            ink = np.tile(np.asarray(rgba_color[:3], dtype=np.uint16), alpha.width)
+        weight = np.repeat(np.asarray(alpha, dtype=np.uint16), 3, axis=1)
+        return 255 - weight, ink * weight + 128
+
+    return _blend_weights.get(mask, None if stamp else tuple(rgba_color), compute)
+
+
+def blend_numpy(img, mask, rgba_color, xy):
+    """
+    用NumPy在水印区域上一次完成混合：out = (src * (255 - a) + color * a) / 255
+    除以255使用与Pillow的BLEND宏相同的定点整数近似，结果与pillow引擎逐像素一致
+    :param img: 目标图片（RGB模式）
+    :param mask: 普通水印的L蒙版，或效果图章(RGB颜色层, L透明度层)
+    :param rgba_color: 普通水印的RGBA颜色
+    :param xy: 左上角坐标
+    """
+    inverse, ink = get_blend_weights(mask, rgba_color)
+    height, row_size = inverse.shape
+    box = (xy[0], xy[1], xy[0] + row_size // 3, xy[1] + height)
+    # 255 * 255 + 128 < 65536，中间结果用uint16即可，不会溢出；水印区域复制一次后都原地计算
+    patch = np.asarray(img.crop(box)).reshape(height, row_size).astype(np.uint16)
+    patch *= inverse
+    patch += ink
+    patch += patch >> 8
+    patch >>= 8
+    result = patch.astype(np.uint8)
+    img.paste(Image.frombuffer('RGB', (row_size // 3, height), result, 'raw', 'RGB', 0, 1), box)
+
+
+def cmyk_ink(color):
+    """
+    把RGB颜色反相为CMYK油墨，灰色成分全部由K通道承担（白色不着墨，黑色只用K）
+    :param color: RGB颜色(R, G, B)
+    :return: (C, M, Y, K)
+    """
+    black = 255 - max(color[:3])
+    return tuple(255 - value - black for value in color[:3]) + (black,)
+
+
+def luma_ink(color):
+    """
+    RGB颜色的亮度，与Pillow的RGB到L转换一致
+    :param color: RGB颜色(R, G, B)
+    :return: 0-255的亮度值
+    """
+    return Image.new('RGB', (1, 1), tuple(color[:3])).convert('L').getpixel((0, 0))
+
+
+def convert_layer(layer, mode):
+    """
+    把效果图章的RGB颜色层转换到目标模式（L为亮度，CMYK为cmyk_ink()相同的反相），同一图章只转换一次
+    :param layer: RGB颜色层
+    :param mode: 'L'或'CMYK'
+    :return: 转换后的颜色层，被共用，调用方不能修改
+    """
+    def convert():
+        if mode == 'CMYK':
+            red, green, blue = (ImageChops.invert(band) for band in layer.split())
+            black = ImageChops.darker(ImageChops.darker(red, green), blue)
+            return Image.merge('CMYK', [ImageChops.subtract(band, black) for band in (red, green, blue)] + [black])
+        return layer.convert(mode)
+
+    return _mode_layers.get(layer, mode, convert)
+
+
+def draw_luma(img, color, alpha, xy):
+    """
+    L模式图片：直接按亮度混合，不转换为RGB
+    :param img: 目标图片（L模式）
+    :param color: 水印颜色(R, G, B)，或与alpha尺寸相同的RGB颜色层
+    :param alpha: L模式透明度蒙版（已包含水印透明度）
+    :param xy: 左上角坐标
+    """
+    ink = convert_layer(color, 'L') if isinstance(color, Image.Image) else luma_ink(color)
+    img.paste(ink, (xy[0], xy[1], xy[0] + alpha.width, xy[1] + alpha.height), alpha)
+
+
+def draw_cmyk(img, color, alpha, xy):
+    """
+    CMYK图片：把水印颜色反相为油墨后在CMYK空间中逐通道混合，不经过RGB，原图的K通道不会被清零
+    :param img: 目标图片（CMYK模式）
+    :param color: 水印颜色(R, G, B)，或与alpha尺寸相同的RGB颜色层
+    :param alpha: L模式透明度蒙版（已包含水印透明度）
+    :param xy: 左上角坐标
+    """
+    ink = convert_layer(color, 'CMYK') if isinstance(color, Image.Image) else cmyk_ink(color)
+    img.paste(ink, (xy[0], xy[1], xy[0] + alpha.width, xy[1] + alpha.height), alpha)
+
+
+def draw_rgba(img, color, alpha, xy):
+    """
+    RGBA图片：在水印区域上直接做alpha合成，透明度为0的像素保持原始字节，不需要转换模式
+    :param img: 目标图片（RGBA模式）
+    :param color: 水印颜色(R, G, B)，或与alpha尺寸相同的RGB颜色层
+    :param alpha: L模式透明度蒙版（已包含水印透明度）
+    :param xy: 左上角坐标
+    """
+    box = (xy[0], xy[1], xy[0] + alpha.width, xy[1] + alpha.height)
+    if isinstance(color, Image.Image):
+        overlay = color.convert('RGBA')
+    else:
+        overlay = Image.new('RGBA', alpha.size, tuple(color[:3]))
+    overlay.putalpha(alpha)
+    img.paste(Image.alpha_composite(img.crop(box), overlay), box)
+
+
+def transparent_indices(img):
+    """
+    P模式图片中透明（或半透明）的调色板索引
+    GIF和单一透明色的PNG-8为一个索引，带tRNS透明度表的PNG-8为透明度小于255的所有索引
+    :param img: P模式图片
+    :return: 索引集合
+    """
+    transparency = img.info.get('transparency')
+    if isinstance(transparency, int):
+        return {transparency}
+    if isinstance(transparency, bytes):
+        return set(index for index, value in enumerate(transparency) if value < 255)
+    return set()
+
+
+def quantize_to_palette(work, img):
+    """
+    把混合后的RGB区域按最接近的颜色映射回原图的调色板，不会映射到透明的索引
+    Pillow的quantize按分桶近似查找，安装NumPy时对区域内的每种颜色精确计算最接近的调色板颜色
+    :param work: RGB模式的区域
+    :param img: 提供调色板的P模式图片
+    :return: 使用原图索引的P模式图片
+    """
+    palette = img.getpalette()
+    transparent = transparent_indices(img)
+    opaque = [index for index in range(len(palette) // 3) if index not in transparent]
+    if not opaque:
+        return work.quantize(palette=img, dither=_Dither.NONE)
+    if np is not None:
+        pixels = np.asarray(work, dtype=np.int32).reshape(-1, 3)
+        unique, inverse = np.unique((pixels[:, 0] << 16) | (pixels[:, 1] << 8) | pixels[:, 2], return_inverse=True)
+        colors = np.stack([unique >> 16, (unique >> 8) & 255, unique & 255], axis=1)
+        candidates = np.asarray([palette[index * 3:index * 3 + 3] for index in opaque], dtype=np.int32)
+        nearest = np.empty(len(colors), dtype=np.intp)
+        # 分块计算距离，颜色很多时中间数组也不会过大
+        for begin in range(0, len(colors), 4096):
+            chunk = colors[begin:begin + 4096, None, :] - candidates[None, :, :]
+            nearest[begin:begin + 4096] = (chunk * chunk).sum(axis=2).argmin(axis=1)
+        indices = np.asarray(opaque, dtype=np.uint8)[nearest][inverse.reshape(-1)]
+        return Image.frombuffer('P', work.size, indices.tobytes(), 'raw', 'P', 0, 1)
+    if not transparent:
+        return work.quantize(palette=img, dither=_Dither.NONE)
+    # 只用不透明的颜色组成临时调色板，映射后再换回原图中的索引
+    reference = Image.new('P', (1, 1))
+    reference.putpalette([value for index in opaque for value in palette[index * 3:index * 3 + 3]])
+    compact = work.quantize(palette=reference, dither=_Dither.NONE)
+    lut = opaque + [opaque[-1]] * (256 - len(opaque))
+    return Image.frombytes('P', work.size, Image.frombytes('L', work.size, compact.tobytes()).point(lut).tobytes())
+
+
+def palette_index(img, color):
+    """
+    查找调色板中与水印颜色完全相同的不透明颜色，没有时如果调色板还有空位就追加一项
+    已有像素的索引不变，只是水印完全覆盖的像素能映射到准确的颜色；透明索引即使颜色相同也不使用
+    :param img: 目标图片（P模式）
+    :param color: 水印颜色(R, G, B)
+    :return: 颜色索引，调色板已满时返回None（之后按最接近的颜色映射）
+    """
+    if img.palette is None or img.palette.mode != 'RGB':
+        return None
+    palette = img.getpalette()
+    entries = [tuple(palette[i:i + 3]) for i in range(0, len(palette), 3)]
+    color = tuple(color[:3])
+    transparent = transparent_indices(img)
+    for index, entry in enumerate(entries):
+        if entry == color and index not in transparent:
+            return index
+    if len(entries) >= 256:
+        return None
+    img.putpalette(palette + list(color))
+    return len(entries)
+
+
+def draw_palette(img, color, alpha, xy):
+    """
+    P模式图片：水印颜色优先使用调色板中的颜色或追加到调色板的空位，
+    水印区域混合后按最接近的颜色映射回同一个调色板
+    :param img: 目标图片（P模式）
+    :param color: 水印颜色(R, G, B)，或与alpha尺寸相同的RGB颜色层
+    :param alpha: L模式透明度蒙版（已包含水印透明度）
+    :param xy: 左上角坐标
+    """
+    if not isinstance(color, Image.Image):
+        palette_index(img, color)
+    draw_roi(img, color, alpha, xy)
+
+
+def white_level(img):
+    """
+    数值型灰度图片中白色对应的像素值
+    16位模式为65535；I和F模式没有固定范围，按图片的最大值依次取1.0（仅F）、255或65535，超出时取最大值本身
+    :param img: 目标图片（I;16、I;16L、I;16B、I或F模式）
+    :return: 白色的像素值
+    """
+    if img.mode.startswith('I;16'):
+        return 65535
+    high = img.getextrema()[1]
+    for level in ((1.0,) if img.mode == 'F' else ()) + (255, 65535):
+        if high <= level:
+            return level
+    return high
+
+
+def draw_numeric(img, color, alpha, xy):
+    """
+    16位、32位整数和浮点灰度图片：把亮度按white_level()缩放到图片的数值范围后直接按透明度混合，保留原有精度
+    转换为RGB会把超过255的值截断，所以这些模式不经过draw_roi
+    :param img: 目标图片（I;16、I;16L、I;16B、I或F模式）
+    :param color: 水印颜色(R, G, B)，或与alpha尺寸相同的RGB颜色层
+    :param alpha: L模式透明度蒙版（已包含水印透明度）
+    :param xy: 左上角坐标
+    """
+    box = (xy[0], xy[1], xy[0] + alpha.width, xy[1] + alpha.height)
+    white = white_level(img)
+    if isinstance(color, Image.Image):
+        luma = convert_layer(color, 'L')
+    else:
+        luma = Image.new('L', alpha.size, luma_ink(color))
+    if np is None:
+        # 没有NumPy时缩放到8位按亮度混合再缩放回去，只有水印覆盖的像素损失精度
+        patch = img.crop(box)
+        work = patch if img.mode == 'F' else patch.convert('I')
+        scaled = work.point(lambda value: value * 255 / white).convert('L')
+        scaled.paste(luma, (0, 0), alpha)
+        result = scaled.convert(work.mode).point(lambda value: value * white / 255)
+        coverage = alpha.point([255 if value else 0 for value in range(256)])
+        # 32位模式按蒙版粘贴时逐字节混合，只用0/255的覆盖范围合成后整块贴回
+        img.paste(Image.composite(result, work, coverage).convert(img.mode), box)
+        return
+    source = np.asarray(img.crop(box))
+    weight = np.asarray(alpha, dtype=np.int64)
+    if img.mode == 'F':
+        ink = np.asarray(luma, dtype=np.float64) * (white / 255)
+        result = (source * (255 - weight) + ink * weight) / 255
+    else:
+        # 65535 = 255 * 257，16位图片的墨水值是精确的整数
+        ink = (np.asarray(luma, dtype=np.int64) * int(white) + 127) // 255
+        result = (source.astype(np.int64) * (255 - weight) + ink * weight + 127) // 255
+    # 透明度为0的像素保持原值
+    result = np.where(weight > 0, result, source).astype(source.dtype)
+    patch = Image.frombuffer(img.mode, alpha.size, result.tobytes(), 'raw', img.mode, 0, 1)
+    # Pillow按蒙版粘贴16位和32位图片时不能逐像素混合，整块贴回
+    img.paste(patch, box)
+
+
+def draw_roi(img, color, alpha, xy):
+    """
+    只裁出水印所在的矩形区域，转换为RGB(A)混合后再贴回原图
+    区域以外的像素不会被读取或修改，区域内透明度为0的像素也保持原始字节，开销只与水印面积有关
+    :param img: 目标图片（没有专门混合方式的8位模式，如LA、RGBX、YCbCr、LAB、HSV，以及P模式）
+    :param color: 水印颜色(R, G, B)，或与alpha尺寸相同的RGB颜色层
+    :param alpha: L模式透明度蒙版（已包含水印透明度）
+    :param xy: 左上角坐标
+    """
+    box = (xy[0], xy[1], xy[0] + alpha.width, xy[1] + alpha.height)
+    patch = img.crop(box)
+    if not isinstance(color, Image.Image):
+        color = Image.new('RGB', alpha.size, tuple(color[:3]))
+    if img.mode in _ALPHA_MODES:
+        overlay = color.convert('RGBA')
+        overlay.putalpha(alpha)
+        work = Image.alpha_composite(patch.convert('RGBA'), overlay)
+    else:
+        work = patch.convert('RGB')
+        work.paste(color, (0, 0), alpha)
+
+    if img.mode == 'P':
+        # 映射回原图的调色板中不透明的颜色，不改变调色板
+        result = quantize_to_palette(work, img)
+    else:
+        result = work.convert(img.mode)
+    # 只写回水印覆盖到的像素，格式转换的误差不会扩散到区域内的其他像素
+    coverage = alpha.point([255 if value else 0 for value in range(256)])
+    img.paste(result, box, coverage)
+
+
+# 各图片模式在自身颜色空间中的混合方式，其他模式使用draw_roi
+_MODE_DRAWERS = {
+    'L': draw_luma,
+    'P': draw_palette,
+    'RGBA': draw_rgba,
+    'CMYK': draw_cmyk,
+    'I;16': draw_numeric,
+    'I;16L': draw_numeric,
+    'I;16B': draw_numeric,
+    'I': draw_numeric,
+    'F': draw_numeric,
+}
+
+
+def draw_placement(img, placement, rgba_color, engine='pillow'):
+    """
+    绘制get_placement()返回的水印，RGB图片直接混合，其他模式在各自的颜色空间中只处理水印所在的区域
+    :param img: 目标图片
+    :param placement: (蒙版或效果图章, 左上角坐标)，坐标为None时为平铺水印的单元
+    :param rgba_color: 普通水印的RGBA颜色（效果图章的颜色已包含在图章中）
+    :param engine: RGB图片的混合引擎（见BLEND_ENGINES），没有安装NumPy时总是使用pillow
+    """
+    mask, xy = placement
+    opacity = rgba_color[3] if len(rgba_color) > 3 else 255
+    if xy is None:
+        # 平铺水印：展开后的整幅蒙版已包含透明度，整张图片只混合一次；
+        # 整幅的numpy权重过大，RGB图片也使用pillow引擎
+        mask, xy = get_tiled_mask(mask, img.size, opacity), (0, 0)
+        opacity = 255
+    elif img.mode in NATIVE_BLEND_MODES and engine == 'numpy' and np is not None:
+        blend_numpy(img, mask, rgba_color, xy)
+        return
+
+    if isinstance(mask, tuple):
+        color, alpha = mask
+    else:
+        color = tuple(rgba_color[:3])
+        alpha = scale_alpha(mask, opacity)
+
+    if img.mode not in NATIVE_BLEND_MODES:
+        _MODE_DRAWERS.get(img.mode, draw_roi)(img, color, alpha, xy)
+    elif isinstance(color, Image.Image):
+        draw_stamp(img, (color, alpha), xy)
+    else:
+        draw_mask(img, alpha, xy, color)
+
+
+@lru_cache(maxsize=PLACEMENT_CACHE_SIZE)
+def get_placement(text, font, position, image_size, orientation=1, rgba_color=None, style=None, angle=TILE_ANGLE):
+    """
+    获取水印在存储像素坐标中的蒙版和位置，同一批尺寸相同的图片只计算一次
+    位置只取决于文字、字体、效果、图片尺寸和方向，之后的每张图片只需一次字典查询
+    :param text: 水印文本
+    :param font: 字体对象
+    :param position: 水印位置（相对显示方向）
+    :param image_size: 存储像素尺寸(宽, 高)
+    :param orientation: EXIF方向值
+    :param rgba_color: 文字颜色和透明度，只在有效果时使用
+    :param style: WatermarkStyle，为None时为普通水印
+    :param angle: 平铺水印的旋转角度，只在position为TILE_POSITION时使用
+    :return: (存储方向的L蒙版或效果图章(RGB颜色层, L透明度层), 左上角坐标(x, y))，被共用，调用方不能修改；
+             平铺水印的坐标为None，蒙版为平铺单元，绘制时才按图片尺寸展开
+    """
+    if position == TILE_POSITION:
+        tile = get_tile(text, font, angle, None if style is None else rgba_color, style)
+        orientation = normalize_orientation(orientation)
+        if orientation == 1:
+            return tile, None
+        transpose = _MASK_TRANSPOSE[orientation]
+        if isinstance(tile, tuple):
+            return tuple(layer.transpose(transpose) for layer in tile), None
+        return tile.transpose(transpose), None
+    if style is None:
+        return place_mask(get_text_mask(text, font, 0), position, image_size, orientation)
+    stamp, xy = place_mask(get_effect_stamp(text, font, rgba_color, style), position, image_size, orientation)
+    return (stamp.convert('RGB'), stamp.getchannel('A')), xy